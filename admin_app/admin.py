@@ -9,6 +9,8 @@ from .models import (
     GiftBox, GiftBoxItem, GiftBoxOrder,
     LoyaltyCard, LoyaltyReward, PointsTransaction, Referral, Achievement, CustomerAchievement
 )
+from .custom_pricing import quote_orders, recalculate_estimates
+from .rollups import update_orders
 from .widgets import ImageCropWidget
 
 
@@ -520,6 +522,7 @@ class CustomCakeOrderDecorationInline(admin.TabularInline):
 @admin.register(CustomCakeOrder)
 class CustomCakeOrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'customer', 'shape', 'tier', 'total_weight', 'flavor_display', 'status', 'price_range_display', 'estimated_price', 'final_price', 'delivery_date', 'created_at']
+    list_select_related = ['customer', 'shape', 'tier', 'flavor']
     list_filter = ['status', 'shape', 'tier', 'flavor', 'delivery_date', 'created_at']
     search_fields = ['order_number', 'customer__name', 'customer__phone_number', 'special_instructions']
     date_hierarchy = 'delivery_date'
@@ -568,6 +571,8 @@ class CustomCakeOrderAdmin(admin.ModelAdmin):
         if not obj.pk:
             return "Save first to see price breakdown"
         
+        # Loads the decorations used below along with the quote
+        quote_orders([obj])
         breakdown = obj.price_breakdown
         
         flavor_text = obj.flavor.name if obj.flavor else (obj.flavor_description or 'Not specified')
@@ -638,38 +643,34 @@ class CustomCakeOrderAdmin(admin.ModelAdmin):
     
     def recalculate_prices(self, request, queryset):
         """Recalculate estimated prices for selected orders"""
-        updated = 0
-        for order in queryset:
-            old_price = order.estimated_price
-            order.update_estimate()
-            if order.estimated_price != old_price:
-                updated += 1
+        results = recalculate_estimates(queryset)
+        updated = sum(1 for order, old_price in results if order.estimated_price != old_price)
         
         self.message_user(
             request,
-            f"Recalculated {queryset.count()} order(s). {updated} price(s) changed."
+            f"Recalculated {len(results)} order(s). {updated} price(s) changed."
         )
     recalculate_prices.short_description = "🔄 Recalculate Prices (use after updating flavor prices)"
     
     def mark_as_quoted(self, request, queryset):
-        queryset.update(status='quoted')
-        self.message_user(request, f"{queryset.count()} orders marked as Quoted")
+        updated = update_orders(queryset, status='quoted')
+        self.message_user(request, f"{updated} orders marked as Quoted")
     mark_as_quoted.short_description = "Mark as Quoted (Estimate Sent)"
     
     def mark_as_confirmed(self, request, queryset):
         from django.utils import timezone
-        queryset.update(status='confirmed', confirmed_at=timezone.now())
-        self.message_user(request, f"{queryset.count()} orders marked as Confirmed")
+        updated = update_orders(queryset, status='confirmed', confirmed_at=timezone.now())
+        self.message_user(request, f"{updated} orders marked as Confirmed")
     mark_as_confirmed.short_description = "Mark as Confirmed"
     
     def mark_as_preparing(self, request, queryset):
-        queryset.update(status='preparing')
-        self.message_user(request, f"{queryset.count()} orders marked as Preparing")
+        updated = update_orders(queryset, status='preparing')
+        self.message_user(request, f"{updated} orders marked as Preparing")
     mark_as_preparing.short_description = "Mark as Preparing"
     
     def mark_as_completed(self, request, queryset):
-        queryset.update(status='completed')
-        self.message_user(request, f"{queryset.count()} orders marked as Completed")
+        updated = update_orders(queryset, status='completed')
+        self.message_user(request, f"{updated} orders marked as Completed")
     mark_as_completed.short_description = "Mark as Completed"
 
 
@@ -768,23 +769,23 @@ class GiftBoxOrderAdmin(admin.ModelAdmin):
     actions = ['mark_as_confirmed', 'mark_as_preparing', 'mark_as_ready', 'mark_as_completed']
     
     def mark_as_confirmed(self, request, queryset):
-        queryset.update(status='confirmed')
-        self.message_user(request, f"{queryset.count()} orders marked as Confirmed")
+        updated = update_orders(queryset, status='confirmed')
+        self.message_user(request, f"{updated} orders marked as Confirmed")
     mark_as_confirmed.short_description = "Mark as Confirmed"
     
     def mark_as_preparing(self, request, queryset):
-        queryset.update(status='preparing')
-        self.message_user(request, f"{queryset.count()} orders marked as Preparing")
+        updated = update_orders(queryset, status='preparing')
+        self.message_user(request, f"{updated} orders marked as Preparing")
     mark_as_preparing.short_description = "Mark as Preparing"
     
     def mark_as_ready(self, request, queryset):
-        queryset.update(status='ready')
-        self.message_user(request, f"{queryset.count()} orders marked as Ready")
+        updated = update_orders(queryset, status='ready')
+        self.message_user(request, f"{updated} orders marked as Ready")
     mark_as_ready.short_description = "Mark as Ready for Pickup/Delivery"
     
     def mark_as_completed(self, request, queryset):
-        queryset.update(status='completed')
-        self.message_user(request, f"{queryset.count()} orders marked as Completed")
+        updated = update_orders(queryset, status='completed')
+        self.message_user(request, f"{updated} orders marked as Completed")
     mark_as_completed.short_description = "Mark as Completed"
 
 
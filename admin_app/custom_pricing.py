@@ -0,0 +1,192 @@
+"""
+Custom cake pricing engine
+
+One pass over an order's preloaded inputs (shape, tier, flavor, selected
+product size price and decorations) produces its estimate and the full price
+breakdown together; the customer-facing price range is derived from the
+estimate. CustomCakeOrder.calculate_estimate(), price_breakdown and
+price_range all go through quote_order(), so the pricing rules live here
+only.
+
+quote_orders() prices any number of orders with a constant number of
+queries, and recalculate_estimates() stores the new estimates in bulk.
+"""
+import math
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+CustomCakeQuote = namedtuple('CustomCakeQuote', [
+    'estimate',     # Decimal, rounded to 2 places
+    'breakdown',    # dict shown on the order pages and in the admin
+])
+
+PRICING_RELATIONS = ('shape', 'tier', 'flavor', 'product', 'size', 'order_decorations__decoration')
+
+
+def price_range(base_estimate):
+    """Price range shown to the customer (round up to nearest 200, then +500)"""
+    min_price = math.ceil(float(base_estimate) / 200) * 200
+    max_price = min_price + 500
+    return {
+        'min': int(min_price),
+        'max': int(max_price),
+        'estimate': int(base_estimate)
+    }
+
+
+def _weight(order):
+    if isinstance(order.total_weight, Decimal):
+        return order.total_weight
+    return Decimal(str(order.total_weight))
+
+
+def _decorations(order):
+    """The order's decorations, from the prefetch cache when present"""
+    if not order.pk:
+        return []
+    if 'order_decorations' in getattr(order, '_prefetched_objects_cache', {}):
+        return order.order_decorations.all()
+    return order.order_decorations.select_related('decoration')
+
+
+def _product_price(order, product_prices):
+    if product_prices is not None:
+        return product_prices.get((order.product_id, order.size_id))
+    from .models import ProductPrice
+
+    return ProductPrice.objects.filter(
+        product_id=order.product_id, size_id=order.size_id
+    ).values_list('price', flat=True).first()
+
+
+def quote_order(order, product_prices=None):
+    """
+    Price one custom cake order.
+
+    `product_prices` is an optional {(product_id, size_id): price} map
+    (see quote_orders); without it the selected product's price is looked up.
+    """
+    total_weight = _weight(order)
+
+    # Always start with shape base price
+    shape_cost = order.shape.base_price_per_kg * total_weight
+    flavor_cost = Decimal('0.00')
+    flavor_source = "Not set"
+    pricing_method = "shape_based"
+
+    if order.product_id and order.size_id:
+        # Customer selected existing product - ProductPrice is the flavor/recipe cost
+        price = _product_price(order, product_prices)
+        if price is not None:
+            flavor_cost = price
+            flavor_source = f"{order.product.name} - {order.size.name} (Product)"
+            pricing_method = "product_based"
+        else:
+            flavor_source = "Product price not found"
+    elif order.flavor_id:
+        # Custom build with a predefined flavor
+        flavor_cost = order.flavor.price_per_kg * total_weight
+        flavor_source = f"{order.flavor.name} (₹{order.flavor.price_per_kg}/kg)"
+    elif order.custom_flavor_price_per_kg:
+        # Custom flavor priced by the admin
+        custom_price = Decimal(str(order.custom_flavor_price_per_kg))
+        flavor_cost = custom_price * total_weight
+        flavor_source = f"{order.flavor_description} (₹{custom_price}/kg)"
+
+    subtotal = shape_cost + flavor_cost
+    with_tier = subtotal * order.tier.price_multiplier
+
+    decorations = Decimal('0.00')
+    if order.pk:
+        decorations = sum(
+            Decimal(str(order_dec.total_price))
+            for order_dec in _decorations(order)
+        )
+
+    total = round(with_tier + decorations, 2)
+    return CustomCakeQuote(
+        estimate=total,
+        breakdown={
+            'shape': round(shape_cost, 2),
+            'flavor': round(flavor_cost, 2),
+            'flavor_source': flavor_source,
+            'subtotal': round(subtotal, 2),
+            'with_tier': round(with_tier, 2),
+            'decorations': round(decorations, 2),
+            'total': total,
+            'pricing_method': pricing_method
+        }
+    )
+
+
+# ===========================
+# Batch pricing
+# ===========================
+
+def quote_orders(orders):
+    """
+    Price many orders with a constant number of queries.
+
+    Loads the shapes, tiers, flavors, products, sizes and decorations the
+    orders don't already have cached, plus every selected product price in
+    one query. Each quote is also kept on its order, so price_breakdown and
+    price_range reuse it. Returns the quotes in order.
+    """
+    from .models import ProductPrice
+
+    orders = list(orders)
+    if not orders:
+        return []
+    prefetch_related_objects(orders, *PRICING_RELATIONS)
+
+    pairs = {(order.product_id, order.size_id) for order in orders if order.product_id and order.size_id}
+    product_prices = {}
+    if pairs:
+        product_prices = {
+            (product_id, size_id): price
+            for product_id, size_id, price in ProductPrice.objects.filter(
+                product_id__in={product_id for product_id, _ in pairs},
+                size_id__in={size_id for _, size_id in pairs}
+            ).values_list('product_id', 'size_id', 'price')
+        }
+
+    quotes = []
+    for order in orders:
+        quote = quote_order(order, product_prices)
+        order._pricing_quote = quote
+        quotes.append(quote)
+    return quotes
+
+
+def recalculate_estimates(orders):
+    """
+    Recalculate and store the estimated price of many orders.
+
+    Writes with one bulk_update and rebuilds the affected sales rollup days
+    (bulk_update bypasses the rollup signals). Returns [(order, old_price)]
+    for every order, with order.estimated_price already updated.
+    """
+    from .models import CustomCakeOrder
+    from .rollups import rebuild_daily_rollups
+
+    orders = list(orders)
+    results = []
+    changed = []
+    now = timezone.now()
+    for order, quote in zip(orders, quote_orders(orders)):
+        results.append((order, order.estimated_price))
+        if quote.estimate != order.estimated_price:
+            changed.append(order)
+        order.estimated_price = quote.estimate
+        order.updated_at = now
+
+    with transaction.atomic():
+        CustomCakeOrder.objects.bulk_update(orders, ['estimated_price', 'updated_at'], batch_size=500)
+        if changed:
+            days = {timezone.localdate(order.created_at) for order in changed}
+            rebuild_daily_rollups(order_types=['custom'], dates=days)
+    return results
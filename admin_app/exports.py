@@ -0,0 +1,241 @@
+"""
+Streaming CSV exports for the admin reports
+
+Rows are read with QuerySet.iterator() in chunks and written out a few
+hundred at a time through a StreamingHttpResponse, so an export never holds
+more than one chunk in memory however much history it covers. Optionally the
+stream is gzip-compressed on the fly.
+
+Datasets: regular orders, custom cake orders, gift box orders and purchase
+bills. The three order datasets share their column keys, so they can be
+exported together ('all') with an extra "Type" column.
+"""
+import csv
+import io
+import zlib
+from collections import namedtuple
+
+from django.http import StreamingHttpResponse
+
+from .models import Order, CustomCakeOrder, GiftBoxOrder, PurchaseBill
+from .rollups import SALES_STATUSES
+
+CHUNK_SIZE = 2000   # rows fetched from the database per round trip
+FLUSH_ROWS = 500    # rows written to the response per chunk
+
+ExportDataset = namedtuple('ExportDataset', [
+    'queryset',         # callable returning the base queryset
+    'date_lookup',      # field lookup used for date_from/date_to
+    'status_field',     # field filtered by `status` (None: not filterable)
+    'columns',          # {key: value getter}
+    'default_columns',  # keys exported when no columns are selected
+])
+
+
+def _date(value):
+    return value.strftime('%Y-%m-%d') if value else ''
+
+
+# ===========================
+# Datasets
+# ===========================
+
+ORDER_HEADERS = {
+    'order_type': 'Type',
+    'order_number': 'Order Number',
+    'date': 'Date',
+    'customer': 'Customer',
+    'phone': 'Phone',
+    'item': 'Product',
+    'size': 'Size',
+    'quantity': 'Quantity',
+    'amount': 'Amount',
+    'status': 'Status',
+    'delivery_date': 'Delivery Date',
+}
+
+EXPENSE_HEADERS = {
+    'date': 'Date',
+    'supplier': 'Supplier',
+    'amount': 'Amount',
+    'notes': 'Notes',
+}
+
+ORDER_DEFAULT_COLUMNS = ['order_number', 'date', 'customer', 'item', 'size', 'quantity', 'amount', 'status']
+
+
+def _order_columns(order_type, item, size, quantity, amount):
+    return {
+        'order_type': lambda o: order_type,
+        'order_number': lambda o: o.order_number,
+        'date': lambda o: _date(o.created_at),
+        'customer': lambda o: o.customer.name,
+        'phone': lambda o: o.customer.phone_number,
+        'item': item,
+        'size': size,
+        'quantity': quantity,
+        'amount': amount,
+        'status': lambda o: o.get_status_display(),
+        'delivery_date': lambda o: _date(o.delivery_date),
+    }
+
+
+DATASETS = {
+    'regular': ExportDataset(
+        queryset=lambda: Order.objects.select_related('customer', 'product', 'size'),
+        date_lookup='created_at__date',
+        status_field='status',
+        columns=_order_columns(
+            'Regular',
+            item=lambda o: o.product.name,
+            size=lambda o: o.size.name,
+            quantity=lambda o: o.quantity,
+            amount=lambda o: o.total_price,
+        ),
+        default_columns=ORDER_DEFAULT_COLUMNS,
+    ),
+    'custom': ExportDataset(
+        queryset=lambda: CustomCakeOrder.objects.select_related('customer', 'shape', 'tier'),
+        date_lookup='created_at__date',
+        status_field='status',
+        columns=_order_columns(
+            'Custom Cake',
+            item=lambda o: f"Custom Cake - {o.shape.name}, {o.tier.name}",
+            size=lambda o: f"{o.total_weight}kg",
+            quantity=lambda o: 1,
+            amount=lambda o: o.display_price,
+        ),
+        default_columns=ORDER_DEFAULT_COLUMNS,
+    ),
+    'gift_box': ExportDataset(
+        queryset=lambda: GiftBoxOrder.objects.select_related('customer', 'gift_box'),
+        date_lookup='created_at__date',
+        status_field='status',
+        columns=_order_columns(
+            'Gift Box',
+            item=lambda o: o.gift_box.name,
+            size=lambda o: '',
+            quantity=lambda o: o.quantity,
+            amount=lambda o: o.total_price,
+        ),
+        default_columns=ORDER_DEFAULT_COLUMNS,
+    ),
+    'expenses': ExportDataset(
+        queryset=lambda: PurchaseBill.objects.all(),
+        date_lookup='date',
+        status_field=None,
+        columns={
+            'date': lambda b: _date(b.date),
+            'supplier': lambda b: b.supplier_name,
+            'amount': lambda b: b.total_amount,
+            'notes': lambda b: b.notes,
+        },
+        default_columns=['date', 'supplier', 'amount', 'notes'],
+    ),
+}
+
+ORDER_DATASETS = ('regular', 'custom', 'gift_box')
+
+
+def parse_columns(value, available, default):
+    """Selected column keys from a comma-separated list (unknown keys are ignored)."""
+    if not value:
+        return list(default)
+    columns = [key.strip() for key in value.split(',') if key.strip() in available]
+    return columns or list(default)
+
+
+# ===========================
+# Streaming
+# ===========================
+
+def _filtered(name, date_from=None, date_to=None, status=None, statuses=None):
+    dataset = DATASETS[name]
+    queryset = dataset.queryset()
+    if date_from:
+        queryset = queryset.filter(**{f'{dataset.date_lookup}__gte': date_from})
+    if date_to:
+        queryset = queryset.filter(**{f'{dataset.date_lookup}__lte': date_to})
+    if dataset.status_field:
+        if statuses:
+            queryset = queryset.filter(**{f'{dataset.status_field}__in': statuses})
+        if status:
+            queryset = queryset.filter(**{dataset.status_field: status})
+    return queryset.order_by(f"-{dataset.date_lookup.split('__')[0]}", '-pk')
+
+
+def iter_csv(names, columns, headers, **filters):
+    """Yield CSV text in chunks of FLUSH_ROWS rows for one or more datasets."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([headers[key] for key in columns])
+
+    rows = 0
+    for name in names:
+        getters = [DATASETS[name].columns[key] for key in columns]
+        for obj in _filtered(name, **filters).iterator(chunk_size=CHUNK_SIZE):
+            writer.writerow([getter(obj) for getter in getters])
+            rows += 1
+            if rows % FLUSH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_export_response(names, filename, columns=None, gzip=False, **filters):
+    """
+    StreamingHttpResponse exporting the given datasets as CSV.
+
+    `columns` is a comma-separated list of column keys (defaults to the
+    dataset's usual columns); filters are date_from, date_to, status and
+    statuses. With gzip=True the file is sent as <filename>.gz.
+    """
+    if names == ['expenses']:
+        headers = EXPENSE_HEADERS
+        default = DATASETS['expenses'].default_columns
+    else:
+        headers = ORDER_HEADERS
+        default = ORDER_DEFAULT_COLUMNS if len(names) == 1 else ['order_type'] + ORDER_DEFAULT_COLUMNS
+    selected = parse_columns(columns, headers, default)
+
+    chunks = iter_csv(names, selected, headers, **filters)
+    if gzip:
+        response = StreamingHttpResponse(_gzip(chunks), content_type='application/gzip')
+        filename = f'{filename}.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def sales_export_response(request, date_from='', date_to='', status=''):
+    """CSV export for the sales report (?type=regular|custom|gift_box|all&columns=...&gzip=1)."""
+    export_type = request.GET.get('type', 'regular')
+    names = list(ORDER_DATASETS) if export_type == 'all' else [export_type if export_type in ORDER_DATASETS else 'regular']
+    filename = 'sales_report.csv' if names == ['regular'] else f'sales_report_{export_type}.csv'
+    return csv_export_response(
+        names, filename,
+        columns=request.GET.get('columns'),
+        gzip=request.GET.get('gzip') in ('1', 'true', 'yes'),
+        date_from=date_from, date_to=date_to, status=status, statuses=SALES_STATUSES,
+    )
+
+
+def expense_export_response(request, date_from='', date_to=''):
+    """CSV export for the expense report (?columns=...&gzip=1)."""
+    return csv_export_response(
+        ['expenses'], 'expense_report.csv',
+        columns=request.GET.get('columns'),
+        gzip=request.GET.get('gzip') in ('1', 'true', 'yes'),
+        date_from=date_from, date_to=date_to,
+    )
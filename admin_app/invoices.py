@@ -0,0 +1,721 @@
+"""
+PDF invoices and estimates for orders, with an on-disk render cache
+
+Each document is built from a plain dict of its printable fields (everything
+that ends up on the page, already formatted). The cache key is a SHA-256 of
+those fields plus PDF_RENDER_VERSION, so editing an order, its decorations
+or the prices behind its estimate produces a new key and the old file simply
+ages out of the cache.
+
+Rendered PDFs are stored under MEDIA_ROOT/<PDF_CACHE_DIR>/<fingerprint>.pdf.
+A file's mtime is refreshed on every hit and the oldest files are evicted
+once the cache grows past PDF_CACHE_MAX_FILES / PDF_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import (
+    SimpleDocTemplate, PageTemplate, Frame, Table, TableStyle, Paragraph, Spacer
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of any document below changes so cached files
+# rendered with the old layout stop matching.
+PDF_RENDER_VERSION = 1
+
+ORDER_INVOICE = 'order_invoice'
+CUSTOM_CAKE_ESTIMATE = 'custom_cake_estimate'
+ORDER_ESTIMATE = 'order_estimate'
+
+
+# ===========================
+# Shared styles
+# ===========================
+
+@lru_cache(maxsize=None)
+def _styles():
+    """Paragraph styles shared by every document (built once per process)."""
+    styles = getSampleStyleSheet()
+    return {
+        'normal': styles['Normal'],
+        'heading2': styles['Heading2'],
+        'from_content': ParagraphStyle(
+            'FromContent',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor('#333333'),
+            leading=14
+        ),
+        'heading': ParagraphStyle(
+            'Heading',
+            parent=styles['Heading2'],
+            fontSize=15,
+            textColor=colors.HexColor('#FF6B9D'),
+            spaceAfter=10,
+            spaceBefore=15,
+            fontName='Helvetica-Bold',
+            borderColor=colors.HexColor('#FF6B9D'),
+            borderWidth=0,
+            borderPadding=5
+        ),
+        'note': ParagraphStyle(
+            'Note', parent=styles['Normal'], fontSize=9,
+            textColor=colors.HexColor('#666666'), leading=12
+        ),
+        'price_note': ParagraphStyle(
+            'PriceNote', parent=styles['Normal'], fontSize=9,
+            textColor=colors.HexColor('#666666'), alignment=TA_LEFT
+        ),
+        'terms_heading': ParagraphStyle(
+            'TermsHeading',
+            parent=styles['Normal'],
+            fontSize=11,
+            textColor=colors.HexColor('#1A5490'),
+            fontName='Helvetica-Bold',
+            spaceAfter=8
+        ),
+        'terms': ParagraphStyle(
+            'Terms',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#333333'),
+            leading=13,
+            spaceAfter=3
+        ),
+        'estimate_title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#FF1493'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        ),
+        'estimate_footer': ParagraphStyle(
+            'Footer', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER
+        ),
+    }
+
+
+HEADER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#1A5490')),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+    ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+    ('PADDING', (0, 0), (-1, -1), 20),
+])
+
+INFO_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('PADDING', (0, 0), (-1, -1), 0),
+])
+
+FOOTER_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#666666')),
+    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+    ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+    ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
+    ('TOPPADDING', (0, 0), (-1, -1), 20),
+])
+
+FOOTER_DATA = [[
+    'Tel: +91 9946588352',
+    'Email: cakesbydesti@example.com',
+    'Web: www.cakesbydesti.com'
+]]
+
+
+def _draw_watermark(canvas, doc):
+    """Add watermark (no borders for clean look)"""
+    canvas.saveState()
+    canvas.setFont('Helvetica-Bold', 60)
+    canvas.setFillColor(colors.HexColor('#FFF3F8'))
+    canvas.setFillAlpha(0.2)
+    canvas.translate(A4[0]/2, A4[1]/2)
+    canvas.rotate(45)
+    canvas.drawCentredString(0, 0, "CAKES BY DESTI")
+    canvas.rotate(-45)
+    canvas.translate(-A4[0]/2, -A4[1]/2)
+    canvas.restoreState()
+
+
+def _watermarked_doc(buffer, template_id):
+    frame = Frame(0.75*inch, 0.75*inch, A4[0]-1.5*inch, A4[1]-1.5*inch, id='normal')
+    template = PageTemplate(id=template_id, frames=frame, onPage=_draw_watermark)
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.75*inch, bottomMargin=0.75*inch,
+                            leftMargin=0.75*inch, rightMargin=0.75*inch)
+    doc.addPageTemplates([template])
+    return doc
+
+
+def _header_table(title):
+    style = _styles()['from_content']
+    header_table = Table([[
+        Paragraph("<b style='color: white; font-size: 12pt'>🎂 CAKES BY DESTI & SIMI</b><br/>"
+                  "<font size='8' color='white'>Made by our family for your family</font>", style),
+        Paragraph(f"<b style='color: white; font-size: 32pt'>{title}</b>", style)
+    ]], colWidths=[4*inch, 2.5*inch])
+    header_table.setStyle(HEADER_TABLE_STYLE)
+    return header_table
+
+
+def _info_table(fields, number_label):
+    style = _styles()['from_content']
+    info_table = Table([[
+        Paragraph(f"<b>Client Name:</b> {fields['client_name']}<br/>"
+                  f"<b>{number_label}#:</b> {fields['order_number']}<br/>"
+                  f"<b>Date:</b> {fields['date']}", style),
+        Paragraph(f"<b>Client Address</b><br/>"
+                  f"{fields['address']}<br/>"
+                  f"Ph: {fields['phone']}<br/>"
+                  f"Email: {fields['email']}", style)
+    ]], colWidths=[3.25*inch, 3.25*inch])
+    info_table.setStyle(INFO_TABLE_STYLE)
+    return info_table
+
+
+def _footer_table():
+    footer_table = Table(FOOTER_DATA, colWidths=[2.2*inch, 2.2*inch, 2.1*inch])
+    footer_table.setStyle(FOOTER_TABLE_STYLE)
+    return footer_table
+
+
+# ===========================
+# Printable fields
+# ===========================
+
+def order_invoice_fields(order):
+    """Everything printed on a regular order's invoice."""
+    product_description = f"{order.product.name} - {order.size.name}"
+    if order.custom_message:
+        product_description += f"<br/>Message: {order.custom_message}"
+    if order.event:
+        product_description += f"<br/>Event: {order.event.event_name}"
+
+    return {
+        'client_name': order.customer.name,
+        'order_number': order.order_number,
+        'date': order.created_at.strftime('%m/%d/%Y'),
+        'address': order.customer.address or 'N/A',
+        'phone': order.customer.phone_number,
+        'email': order.customer.email or 'N/A',
+        'description': product_description,
+        'unit_price': f'₹{order.unit_price:,.0f}',
+        'quantity': str(order.quantity),
+        'total_price': f'₹{order.total_price:,.0f}',
+        'special_instructions': order.special_instructions or '',
+    }
+
+
+def custom_cake_estimate_fields(order):
+    """Everything printed on a custom cake order's estimate."""
+    flavor_name = order.flavor.name if order.flavor else (order.flavor_description or 'Not specified')
+
+    order_decorations = order.order_decorations.all()
+    decorations_text = ', '.join([f"{od.quantity}× {od.decoration.name}" for od in order_decorations]) if order_decorations else 'None'
+
+    cake_description = f"Custom Cake - {order.shape.name}, {order.tier.name}, {order.total_weight}kg, {flavor_name}"
+    if decorations_text != 'None':
+        cake_description += f"<br/>Decorations: {decorations_text}"
+    if order.custom_message:
+        cake_description += f"<br/>Message: {order.custom_message}"
+
+    price_range = order.price_range
+    show_final_price = bool(order.final_price and order.final_price != order.estimated_price)
+
+    return {
+        'client_name': order.customer.name,
+        'order_number': order.order_number,
+        'date': order.created_at.strftime('%m/%d/%Y'),
+        'address': order.delivery_address[:80],
+        'phone': order.customer.phone_number,
+        'email': order.customer.email or 'N/A',
+        'description': cake_description,
+        'price_min': f'₹{price_range["min"]:,}',
+        'price_max': f'₹{price_range["max"]:,}',
+        'final_price': f'₹{order.final_price:,.2f}' if show_final_price else '',
+        'price_note': (order.price_note or '') if show_final_price else '',
+        'custom_message': order.custom_message or '',
+        'special_instructions': order.special_instructions or '',
+    }
+
+
+def order_estimate_fields(order):
+    """Everything printed on the admin estimate for a regular order."""
+    flavor = getattr(order, 'flavor', None)
+    return {
+        'order_number': order.order_number,
+        'customer_name': order.customer.name,
+        'phone': order.customer.phone_number,
+        'order_date': order.created_at.strftime('%d %b %Y'),
+        'delivery_date': order.delivery_date.strftime('%d %b %Y'),
+        'status': order.get_status_display(),
+        'product': order.product.name,
+        'size': order.size.name,
+        'flavor': flavor.name if flavor else 'N/A',
+        'quantity': str(order.quantity),
+        'unit_price': f'₹{order.unit_price}',
+        'total_price': f'₹{order.total_price}',
+        'custom_message': order.custom_message or '',
+        'special_instructions': order.special_instructions or '',
+    }
+
+
+# ===========================
+# Renderers
+# ===========================
+
+def render_order_invoice(fields):
+    """Professional invoice PDF for a regular product order"""
+    buffer = BytesIO()
+    doc = _watermarked_doc(buffer, 'invoice')
+    styles = _styles()
+    from_content_style = styles['from_content']
+
+    elements = [_header_table('INVOICE'), Spacer(1, 15)]
+    elements.append(_info_table(fields, 'Invoice'))
+    elements.append(Spacer(1, 25))
+
+    # Items Table
+    items_data = [
+        ['SL.', 'Item Description', 'Price', 'Qty', 'Total'],
+        [
+            '1',
+            Paragraph(fields['description'], from_content_style),
+            fields['unit_price'],
+            fields['quantity'],
+            fields['total_price']
+        ],
+    ]
+    # Add empty rows for clean look
+    for i in range(4):
+        items_data.append(['', '', '', '', ''])
+
+    items_table = Table(items_data, colWidths=[0.5*inch, 3.5*inch, 1*inch, 0.6*inch, 0.9*inch])
+    items_table.setStyle(TableStyle([
+        # Header row
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1A5490')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
+        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+        ('ALIGN', (2, 0), (-1, -1), 'CENTER'),
+
+        # Data rows
+        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#CCCCCC')),
+        ('PADDING', (0, 0), (-1, -1), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ]))
+    elements.append(items_table)
+    elements.append(Spacer(1, 5))
+
+    # Summary Section (aligned right)
+    summary_data = [
+        ['', '', '', 'Sub Total:', fields['total_price']],
+        ['', '', '', 'Total:', fields['total_price']],
+    ]
+
+    summary_table = Table(summary_data, colWidths=[0.5*inch, 3.5*inch, 1*inch, 0.6*inch, 0.9*inch])
+    summary_table.setStyle(TableStyle([
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('FONT', (3, 0), (3, 0), 'Helvetica', 10),
+        ('FONT', (4, 0), (4, 0), 'Helvetica', 10),
+        ('FONT', (3, 1), (-1, 1), 'Helvetica-Bold', 12),
+        ('BACKGROUND', (3, 1), (-1, 1), colors.HexColor('#E8F5E9')),
+        ('TEXTCOLOR', (3, 1), (-1, 1), colors.HexColor('#4CAF50')),
+        ('PADDING', (3, 0), (-1, -1), 8),
+        ('LINEABOVE', (3, 0), (-1, 0), 1, colors.HexColor('#CCCCCC')),
+        ('LINEABOVE', (3, 1), (-1, 1), 2, colors.HexColor('#4CAF50')),
+        ('TOPPADDING', (3, 1), (-1, 1), 12),
+        ('BOTTOMPADDING', (3, 1), (-1, 1), 12),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 25))
+
+    # Additional notes if any
+    if fields['special_instructions']:
+        elements.append(Paragraph(f"<b>Special Instructions:</b><br/>{fields['special_instructions']}", styles['note']))
+        elements.append(Spacer(1, 15))
+
+    # Terms and Conditions
+    elements.append(Paragraph("Terms & Conditions", styles['terms_heading']))
+    elements.append(Paragraph("Payment is due on delivery", styles['terms']))
+    elements.append(Paragraph("Delivery date and time must be confirmed 24 hours in advance", styles['terms']))
+    elements.append(Paragraph("Thank you for your business!", styles['terms']))
+    elements.append(Spacer(1, 15))
+
+    elements.append(_footer_table())
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_custom_cake_estimate(fields):
+    """Estimate PDF for a custom cake order"""
+    buffer = BytesIO()
+    doc = _watermarked_doc(buffer, 'test')
+    styles = _styles()
+    from_content_style = styles['from_content']
+
+    elements = [_header_table('ESTIMATE'), Spacer(1, 15)]
+    elements.append(_info_table(fields, 'Estimate'))
+    elements.append(Spacer(1, 25))
+
+    # Items Table
+    items_data = [
+        ['QTY', 'Description', 'Unit Price', 'Amount'],
+        [
+            '1',
+            Paragraph(fields['description'], from_content_style),
+            fields['price_min'],
+            fields['price_min']
+        ],
+    ]
+    # Add a few empty rows for clean look
+    for i in range(2):
+        items_data.append(['', '', '', ''])
+
+    items_table = Table(items_data, colWidths=[0.7*inch, 3.8*inch, 1*inch, 1*inch])
+    items_table.setStyle(TableStyle([
+        # Header row styling - Dark blue
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1A5490')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
+        ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+        ('ALIGN', (2, 0), (-1, 0), 'CENTER'),
+
+        # Data rows styling
+        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
+        ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+        ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+
+        # Grid and padding
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#CCCCCC')),
+        ('PADDING', (0, 0), (-1, -1), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ]))
+    elements.append(items_table)
+    elements.append(Spacer(1, 5))
+
+    # Subtotal and Total Section
+    summary_data = [
+        ['', '', 'Subtotal', fields['price_min']],
+        ['', '', 'Price Range', f"{fields['price_min']} - {fields['price_max']}"],
+        ['', '', Paragraph('<b>Total (Estimated)</b>', from_content_style),
+         Paragraph(f"<b>{fields['price_max']}</b>", from_content_style)],
+    ]
+
+    summary_table = Table(summary_data, colWidths=[0.7*inch, 3.8*inch, 1*inch, 1*inch])
+    summary_table.setStyle(TableStyle([
+        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+        ('FONT', (2, 0), (2, 1), 'Helvetica', 10),
+        ('FONT', (3, 0), (3, 1), 'Helvetica', 10),
+        ('FONT', (2, 2), (-1, 2), 'Helvetica-Bold', 12),
+        ('BACKGROUND', (2, 2), (-1, 2), colors.HexColor('#E8F5E9')),
+        ('TEXTCOLOR', (2, 2), (-1, 2), colors.HexColor('#4CAF50')),
+        ('PADDING', (2, 0), (-1, -1), 8),
+        ('LINEABOVE', (2, 0), (-1, 0), 1, colors.HexColor('#CCCCCC')),
+        ('LINEABOVE', (2, 2), (-1, 2), 2, colors.HexColor('#4CAF50')),
+        ('TOPPADDING', (2, 2), (-1, 2), 12),
+        ('BOTTOMPADDING', (2, 2), (-1, 2), 12),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 20))
+
+    # Final Price (if different)
+    if fields['final_price']:
+        final_table = Table([['FINAL PRICE:', fields['final_price']]], colWidths=[5*inch, 1.5*inch])
+        final_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#E8F5E9')),
+            ('FONT', (0, 0), (0, 0), 'Helvetica-Bold', 14),
+            ('FONT', (1, 0), (1, 0), 'Helvetica-Bold', 16),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#4CAF50')),
+            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+            ('PADDING', (0, 0), (-1, -1), 15),
+            ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#4CAF50')),
+        ]))
+        elements.append(final_table)
+
+        if fields['price_note']:
+            elements.append(Spacer(1, 5))
+            elements.append(Paragraph(f"<i>Note: {fields['price_note']}</i>", styles['price_note']))
+
+    elements.append(Spacer(1, 20))
+
+    # Additional Information
+    if fields['custom_message'] or fields['special_instructions']:
+        elements.append(Paragraph("Additional Information", styles['heading']))
+
+        info_data = []
+        if fields['custom_message']:
+            info_data.append(['Message on Cake:', fields['custom_message']])
+        if fields['special_instructions']:
+            info_data.append(['Special Instructions:', fields['special_instructions']])
+
+        info_table = Table(info_data, colWidths=[2*inch, 4.5*inch])
+        info_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#FFF9E6')),
+            ('FONT', (0, 0), (0, -1), 'Helvetica-Bold', 10),
+            ('FONT', (1, 0), (1, -1), 'Helvetica', 10),
+            ('PADDING', (0, 0), (-1, -1), 12),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#FFE5A3')),
+        ]))
+        elements.append(info_table)
+
+    elements.append(Spacer(1, 30))
+
+    # Terms and Conditions Section
+    elements.append(Paragraph("Terms & Conditions", styles['terms_heading']))
+    elements.append(Paragraph("This is an estimated quotation. Final price will be confirmed after design discussion.", styles['terms']))
+    elements.append(Paragraph("50% advance payment required to confirm the order.", styles['terms']))
+    elements.append(Paragraph("Balance payment to be made at the time of delivery.", styles['terms']))
+    elements.append(Paragraph("Thank you for your business!", styles['terms']))
+    elements.append(Spacer(1, 15))
+
+    elements.append(_footer_table())
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_order_estimate(fields):
+    """Admin estimate PDF for a regular order"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = _styles()
+
+    elements = []
+    elements.append(Paragraph("🎂 Cakes by Desti", styles['estimate_title']))
+    elements.append(Paragraph("ORDER ESTIMATE", styles['heading2']))
+    elements.append(Spacer(1, 20))
+
+    # Order details
+    order_data = [
+        ['Order Number:', fields['order_number']],
+        ['Customer Name:', fields['customer_name']],
+        ['Phone:', fields['phone']],
+        ['Order Date:', fields['order_date']],
+        ['Delivery Date:', fields['delivery_date']],
+        ['Status:', fields['status']],
+    ]
+
+    order_table = Table(order_data, colWidths=[2*inch, 4*inch])
+    order_table.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+        ('FONT', (0, 0), (0, -1), 'Helvetica-Bold', 10),
+        ('PADDING', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(order_table)
+    elements.append(Spacer(1, 20))
+
+    # Product details
+    product_data = [
+        ['Product', 'Size', 'Flavor', 'Qty', 'Price', 'Total'],
+        [
+            fields['product'],
+            fields['size'],
+            fields['flavor'],
+            fields['quantity'],
+            fields['unit_price'],
+            fields['total_price']
+        ]
+    ]
+
+    product_table = Table(product_data, colWidths=[2*inch, 1*inch, 1.5*inch, 0.5*inch, 1*inch, 1*inch])
+    product_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
+        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('PADDING', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(product_table)
+    elements.append(Spacer(1, 20))
+
+    # Special instructions
+    if fields['custom_message'] or fields['special_instructions']:
+        elements.append(Paragraph("<b>Special Instructions:</b>", styles['normal']))
+        if fields['custom_message']:
+            elements.append(Paragraph(f"Message on cake: {fields['custom_message']}", styles['normal']))
+        if fields['special_instructions']:
+            elements.append(Paragraph(f"Notes: {fields['special_instructions']}", styles['normal']))
+        elements.append(Spacer(1, 20))
+
+    # Footer
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph("Thank you for your order! 🎉", styles['estimate_footer']))
+    elements.append(Paragraph("Contact: +91 XXXXXXXXXX | Email: info@cakesbydesti.com", styles['estimate_footer']))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# kind -> (printable fields builder, renderer)
+DOCUMENTS = {
+    ORDER_INVOICE: (order_invoice_fields, render_order_invoice),
+    CUSTOM_CAKE_ESTIMATE: (custom_cake_estimate_fields, render_custom_cake_estimate),
+    ORDER_ESTIMATE: (order_estimate_fields, render_order_estimate),
+}
+
+
+def document_queryset(kind):
+    """Queryset loading an order together with everything its document prints."""
+    from .models import Order, CustomCakeOrder
+
+    if kind == CUSTOM_CAKE_ESTIMATE:
+        return (
+            CustomCakeOrder.objects
+            .select_related('customer', 'shape', 'tier', 'flavor', 'product', 'size')
+            .prefetch_related('order_decorations__decoration')
+        )
+    return Order.objects.select_related('customer', 'product', 'size', 'event')
+
+
+def render_pdf(kind, fields):
+    """Render a document from its printable fields (safe to run in a worker process)."""
+    return DOCUMENTS[kind][1](fields)
+
+
+# ===========================
+# Render cache
+# ===========================
+
+def pdf_fingerprint(kind, fields):
+    """Content address of a document: hash of its kind, layout version and printable fields."""
+    payload = json.dumps(
+        {'kind': kind, 'version': PDF_RENDER_VERSION, 'fields': fields},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_dir():
+    return os.path.join(settings.MEDIA_ROOT, getattr(settings, 'PDF_CACHE_DIR', 'pdf_cache'))
+
+
+def _cache_path(fingerprint):
+    return os.path.join(_cache_dir(), f'{fingerprint}.pdf')
+
+
+def has_cached_pdf(fingerprint):
+    return os.path.exists(_cache_path(fingerprint))
+
+
+def read_cached_pdf(fingerprint):
+    """Cached bytes for a fingerprint (marking the entry as recently used), or None."""
+    path = _cache_path(fingerprint)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return data
+
+
+def write_cached_pdf(fingerprint, data):
+    """Atomically store rendered bytes and evict least recently used entries."""
+    directory = _cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, _cache_path(fingerprint))
+    except OSError as e:
+        logger.warning("Could not cache PDF %s: %s", fingerprint, e)
+        return
+    evict_pdf_cache()
+
+
+def evict_pdf_cache():
+    """Delete the oldest cached PDFs until the cache fits its file and byte limits."""
+    max_files = getattr(settings, 'PDF_CACHE_MAX_FILES', 2000)
+    max_bytes = getattr(settings, 'PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+
+    entries = []
+    total_bytes = 0
+    try:
+        with os.scandir(_cache_dir()) as it:
+            for entry in it:
+                if not entry.name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    entries.sort()
+    for mtime, size, path in entries:
+        if len(entries) - removed <= max_files and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        removed += 1
+        total_bytes -= size
+    return removed
+
+
+def get_pdf(kind, fields, fingerprint=None):
+    """Return PDF bytes for a document, rendering and caching it on a miss."""
+    if fingerprint is None:
+        fingerprint = pdf_fingerprint(kind, fields)
+    data = read_cached_pdf(fingerprint)
+    if data is None:
+        data = render_pdf(kind, fields)
+        write_cached_pdf(fingerprint, data)
+    return data
+
+
+def pdf_response(request, kind, order, filename, disposition='inline'):
+    """
+    Serve an order document from the render cache.
+
+    The fingerprint doubles as a strong ETag, so a client that already has
+    this exact document gets a 304 without anything being read or rendered.
+    """
+    fields = DOCUMENTS[kind][0](order)
+    fingerprint = pdf_fingerprint(kind, fields)
+    etag = f'"{fingerprint}"'
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or etag in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+    response = HttpResponse(get_pdf(kind, fields, fingerprint), content_type='application/pdf')
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,152 @@
+"""
+Keyset (cursor) pagination
+
+Pages are fetched with "rows after this key" filters on an ordering that
+ends in a unique column (e.g. ('-created_at', '-id')) instead of OFFSET, so
+a deep page costs the same as the first one and rows inserted while someone
+is scrolling never shift or repeat items.
+
+A cursor is the ordering values of a boundary row, encoded as URL-safe
+base64 JSON; pages go forwards from the last row (cursor) or backwards from
+the first one (before). A malformed cursor simply restarts at the first page.
+
+List totals would need a COUNT over every matching row, so cached_totals()
+keeps them in the cache for a short while: they are shown as estimates.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
+
+KeysetPage = namedtuple('KeysetPage', [
+    'items',        # rows on this page, in order
+    'next_cursor',  # cursor for the following page, or None on the last one
+    'prev_cursor',  # cursor ("before") for the preceding page, or None on the first one
+    'has_next',
+    'has_previous',
+])
+
+
+def _fields(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _json_value(value):
+    # isoformat keeps microseconds (DjangoJSONEncoder would drop them)
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def encode_cursor(item, ordering):
+    """Cursor pointing just after `item` in `ordering`."""
+    values = [_json_value(getattr(item, name)) for name, _ in _fields(ordering)]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """The ordering values stored in `cursor`, or None if it isn't valid for this ordering."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    fields = _fields(ordering)
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    try:
+        return [
+            model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(fields, values)
+        ]
+    except (ValidationError, TypeError):
+        return None
+
+
+def _reversed(ordering):
+    return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+
+def after_filter(ordering, values):
+    """
+    Q for the rows that come after `values` in `ordering`:
+    (a > x) | (a = x & b > y) | ..., with < for descending fields.
+    """
+    condition = Q()
+    equal = {}
+    fields = _fields(ordering)
+    for (name, descending), value in zip(fields, values):
+        lookup = f'{name}__lt' if descending else f'{name}__gt'
+        condition |= Q(**equal, **{lookup: value})
+        equal[name] = value
+
+    # Redundant bound on the leading column, so the database seeks into
+    # the (a, b) index instead of scanning it from the start
+    name, descending = fields[0]
+    return Q(**{f'{name}__lte' if descending else f'{name}__gte': values[0]}) & condition
+
+
+def paginate(queryset, ordering, cursor=None, per_page=20, before=None):
+    """
+    One KeysetPage of `queryset` ordered by `ordering`, starting after
+    `cursor` (or ending just before `before`). The last ordering field must
+    be unique (normally the id).
+    """
+    model = queryset.model
+    before_values = decode_cursor(before, model, ordering)
+    if before_values is not None:
+        # Walk backwards from the boundary, then restore the display order
+        items = list(
+            queryset.order_by(*_reversed(ordering))
+            .filter(after_filter(_reversed(ordering), before_values))[:per_page + 1]
+        )
+        has_previous = len(items) > per_page
+        items = items[:per_page][::-1]
+        has_next = True
+    else:
+        values = decode_cursor(cursor, model, ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(after_filter(ordering, values))
+        # One extra row tells whether there is a next page
+        items = list(queryset[:per_page + 1])
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        has_previous = values is not None
+
+    return KeysetPage(
+        items=items,
+        next_cursor=encode_cursor(items[-1], ordering) if has_next and items else None,
+        prev_cursor=encode_cursor(items[0], ordering) if has_previous and items else None,
+        has_next=has_next and bool(items),
+        has_previous=has_previous and bool(items),
+    )
+
+
+# ===========================
+# Cached totals
+# ===========================
+
+def cached_totals(queryset, timeout=None, **aggregates):
+    """
+    {'count': ..., **aggregates} for `queryset`, cached for `timeout` seconds
+    (ADMIN_LIST_COUNT_TIMEOUT) per distinct query, so paging through a long
+    list doesn't count every row on every request.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'ADMIN_LIST_COUNT_TIMEOUT', 60)
+    query = queryset.order_by()
+    digest = hashlib.sha1(f'{aggregates}|{query.query}'.encode()).hexdigest()
+    key = f'keyset_totals:{queryset.model._meta.label_lower}:{digest}'
+
+    totals = cache.get(key)
+    if totals is None:
+        totals = query.aggregate(count=Count('pk'), **aggregates)
+        cache.set(key, totals, timeout)
+    return totals
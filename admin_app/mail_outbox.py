@@ -0,0 +1,266 @@
+"""
+Outbound email queue
+
+Requests that send mail (OTP logins) only insert an OutboundEmail row and
+return; the SMTP handshake never happens on the request thread. One sender
+thread per process wakes up when a message is queued, claims the due rows in
+batches and delivers each batch over a single SMTP connection.
+
+Failed sends are retried with exponential backoff (MAIL_OUTBOX_RETRY_DELAY,
+doubled per attempt) up to MAIL_OUTBOX_MAX_ATTEMPTS. A message queued with
+an expiry (an OTP is useless once it has expired) is given up as failed
+instead when it can't go out in time. The body of sent and failed rows is
+cleared, as it may hold a one-time password. Rows left behind by a
+restart are picked up by `python manage.py process_mail_outbox`, which also
+reports the queue depth and delivery latency (see outbox_metrics()).
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_sender = None
+_sender_lock = threading.Lock()
+_wakeup = threading.Event()
+
+# Seconds the sender sleeps between checks for retries that became due
+IDLE_POLL = 30
+# Rows 'sending' for longer than this belong to a sender that died
+STALE_SENDING = 5 * 60
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ===========================
+# Queueing
+# ===========================
+
+def enqueue_email(to, subject, body, expires_in=None):
+    """
+    Queue one email and wake the sender once the current transaction
+    commits. Sends inline when MAIL_OUTBOX_ASYNC is False. A message with
+    `expires_in` (seconds) is not sent after that. Returns the row.
+    """
+    from .models import OutboundEmail
+
+    expires_at = timezone.now() + timedelta(seconds=expires_in) if expires_in else None
+    message = OutboundEmail.objects.create(to=to, subject=subject, body=body, expires_at=expires_at)
+    if _setting('MAIL_OUTBOX_ASYNC', True):
+        transaction.on_commit(_wake_sender)
+    else:
+        transaction.on_commit(lambda: process_outbox())
+    return message
+
+
+def _wake_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = threading.Thread(target=_sender_loop, name='mail-outbox', daemon=True)
+            _sender.start()
+    _wakeup.set()
+
+
+def _sender_loop():
+    while True:
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            results = process_outbox()
+        except Exception:
+            logger.exception("Mail outbox pass crashed")
+            results = {}
+        finally:
+            close_old_connections()
+        if not results:
+            _wakeup.wait(IDLE_POLL)
+
+
+# ===========================
+# Sending
+# ===========================
+
+def _expire_pending():
+    """Give up pending rows whose expiry has passed. Returns the count."""
+    from .models import OutboundEmail
+
+    now = timezone.now()
+    return OutboundEmail.objects.filter(status='pending', expires_at__lte=now).update(
+        status='failed', body='', last_error='Expired before it could be sent', updated_at=now
+    )
+
+
+def _claim_batch(limit):
+    """Move up to `limit` due rows to 'sending'; rows another process claimed first are skipped."""
+    from .models import OutboundEmail
+
+    expired = _expire_pending()
+    if expired:
+        logger.warning("Gave up %s queued emails that expired before they could be sent", expired)
+
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        status='pending', next_attempt_at__lte=now
+    ).order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:limit]
+
+    claimed = [
+        pk for pk in list(due)
+        if OutboundEmail.objects.filter(pk=pk, status='pending').update(status='sending', updated_at=now) == 1
+    ]
+    return list(OutboundEmail.objects.filter(pk__in=claimed).order_by('next_attempt_at', 'id'))
+
+
+def _send_batch(messages):
+    """Deliver claimed rows over one connection. Returns {status: count}."""
+    from .models import OutboundEmail
+
+    results = {}
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Server unreachable: every message in the batch goes back for a retry
+        for message in messages:
+            status = _record_failure(message, e)
+            results[status] = results.get(status, 0) + 1
+        return results
+
+    try:
+        for message in messages:
+            if message.expires_at is not None and message.expires_at <= timezone.now():
+                # Expired while earlier messages of the batch were sent
+                OutboundEmail.objects.filter(pk=message.pk).update(
+                    status='failed', body='', last_error='Expired before it could be sent',
+                    updated_at=timezone.now()
+                )
+                results['failed'] = results.get('failed', 0) + 1
+                continue
+            try:
+                EmailMessage(
+                    subject=message.subject,
+                    body=message.body,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[message.to],
+                    connection=connection,
+                ).send()
+            except Exception as e:
+                status = _record_failure(message, e)
+            else:
+                OutboundEmail.objects.filter(pk=message.pk).update(
+                    status='sent', attempts=message.attempts + 1, body='', last_error='',
+                    sent_at=timezone.now(), updated_at=timezone.now()
+                )
+                status = 'sent'
+            results[status] = results.get(status, 0) + 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return results
+
+
+def _record_failure(message, error):
+    from .models import OutboundEmail
+
+    attempts = message.attempts + 1
+    delay = _setting('MAIL_OUTBOX_RETRY_DELAY', 30) * (2 ** (attempts - 1))
+    next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    will_retry = (
+        attempts < _setting('MAIL_OUTBOX_MAX_ATTEMPTS', 5)
+        and (message.expires_at is None or next_attempt_at < message.expires_at)
+    )
+
+    # A message that is given up no longer needs its (possibly secret) body
+    cleared = {} if will_retry else {'body': ''}
+    OutboundEmail.objects.filter(pk=message.pk).update(
+        status='pending' if will_retry else 'failed',
+        attempts=attempts,
+        last_error=f"{type(error).__name__}: {error}",
+        next_attempt_at=next_attempt_at,
+        updated_at=timezone.now(),
+        **cleared
+    )
+    if will_retry:
+        logger.warning("Email to %s failed (attempt %s), retrying in %ss: %s", message.to, attempts, delay, error)
+        return 'pending'
+    logger.error("Email to %s failed permanently: %s", message.to, error)
+    return 'failed'
+
+
+def process_outbox(limit=None):
+    """
+    Send every due message in batches of MAIL_OUTBOX_BATCH_SIZE (at most
+    `limit` messages), after re-queueing rows stuck in 'sending' by a sender
+    that died. Returns {status: count}.
+    """
+    from .models import OutboundEmail
+
+    stale_before = timezone.now() - timedelta(seconds=STALE_SENDING)
+    OutboundEmail.objects.filter(status='sending', updated_at__lt=stale_before).update(status='pending')
+
+    batch_size = _setting('MAIL_OUTBOX_BATCH_SIZE', 20)
+    results = {}
+    sent = 0
+    while limit is None or sent < limit:
+        batch = _claim_batch(batch_size if limit is None else min(batch_size, limit - sent))
+        if not batch:
+            break
+        for status, count in _send_batch(batch).items():
+            results[status] = results.get(status, 0) + count
+        sent += len(batch)
+    return results
+
+
+def purge_sent(older_than_days=7):
+    """Delete sent messages older than the given number of days. Returns the count."""
+    from .models import OutboundEmail
+
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = OutboundEmail.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    return deleted
+
+
+# ===========================
+# Metrics
+# ===========================
+
+def outbox_metrics(sample=200):
+    """
+    Queue depth and delivery latency:
+    {'pending', 'sending', 'failed', 'oldest_pending_seconds',
+     'latency_avg_seconds', 'latency_p95_seconds', 'latency_max_seconds'}
+    with the latency (queued -> sent) taken over the last `sample` messages sent.
+    """
+    from django.db.models import Count, Min
+    from .models import OutboundEmail
+
+    counts = dict(
+        OutboundEmail.objects.exclude(status='sent').values('status')
+        .annotate(total=Count('id')).order_by().values_list('status', 'total')
+    )
+    oldest = OutboundEmail.objects.filter(status='pending').aggregate(oldest=Min('created_at'))['oldest']
+    now = timezone.now()
+
+    latencies = sorted(
+        (sent_at - created_at).total_seconds()
+        for created_at, sent_at in OutboundEmail.objects.filter(status='sent', sent_at__isnull=False)
+        .order_by('-sent_at').values_list('created_at', 'sent_at')[:sample]
+    )
+    return {
+        'pending': counts.get('pending', 0),
+        'sending': counts.get('sending', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_pending_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0,
+        'latency_avg_seconds': round(sum(latencies) / len(latencies), 3) if latencies else None,
+        'latency_p95_seconds': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+        'latency_max_seconds': round(latencies[-1], 3) if latencies else None,
+    }
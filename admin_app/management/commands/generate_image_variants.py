@@ -0,0 +1,47 @@
+"""
+Management command to generate responsive (srcset) variants for stored images
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from admin_app.utils import ensure_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate WebP/JPEG width variants for images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            help='Process only this admin_app model (e.g. Product)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate variants even if they already exist',
+        )
+
+    def handle(self, *args, **options):
+        only_model = options.get('model')
+        force = options.get('force', False)
+        total = 0
+
+        for model in apps.get_app_config('admin_app').get_models():
+            if only_model and model.__name__ != only_model:
+                continue
+            image_fields = [f.name for f in model._meta.get_fields() if isinstance(f, models.ImageField)]
+            if not image_fields:
+                continue
+
+            for instance in model.objects.all().iterator():
+                for field_name in image_fields:
+                    field_file = getattr(instance, field_name)
+                    try:
+                        if ensure_image_variants(field_file, force=force):
+                            total += 1
+                            self.stdout.write(f'  {model.__name__} #{instance.pk}: {field_file.name}')
+                    except (OSError, ValueError) as e:
+                        self.stdout.write(self.style.WARNING(f'  Skipped {field_file.name}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {total} image(s)'))
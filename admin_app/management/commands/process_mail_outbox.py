@@ -0,0 +1,56 @@
+"""
+Management command to deliver queued outbound emails and report queue metrics
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from admin_app.mail_outbox import outbox_metrics, process_outbox, purge_sent
+
+
+class Command(BaseCommand):
+    help = 'Send due emails from the outbox (e.g. left over from a restart) and show queue metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Send at most this many emails per pass',
+        )
+        parser.add_argument(
+            '--watch',
+            type=int,
+            metavar='SECONDS',
+            help='Keep running, polling for due emails every SECONDS',
+        )
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='Only show queue depth and delivery latency',
+        )
+        parser.add_argument(
+            '--purge-days',
+            type=int,
+            metavar='DAYS',
+            help='Also delete sent emails older than DAYS',
+        )
+
+    def handle(self, *args, **options):
+        if options.get('status'):
+            for name, value in outbox_metrics().items():
+                self.stdout.write(f'{name}: {value if value is not None else "-"}')
+            return
+
+        if options.get('purge_days') is not None:
+            deleted = purge_sent(options['purge_days'])
+            self.stdout.write(f'Purged {deleted} sent email(s)')
+
+        watch = options.get('watch')
+        while True:
+            results = process_outbox(limit=options.get('limit'))
+            if results or not watch:
+                summary = ', '.join(f'{status}: {count}' for status, count in sorted(results.items())) or 'no due emails'
+                self.stdout.write(self.style.SUCCESS(f'Outbox processed ({summary})'))
+            if not watch:
+                break
+            time.sleep(watch)
@@ -0,0 +1,48 @@
+"""
+Management command to run queued invoice/estimate PDF pre-render jobs
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from admin_app.models import PdfRenderJob
+from admin_app.pdf_jobs import process_pending_pdf_jobs
+
+
+class Command(BaseCommand):
+    help = 'Render pending PDF jobs (e.g. left over from a restart) into the PDF cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Process at most this many jobs per pass',
+        )
+        parser.add_argument(
+            '--watch',
+            type=int,
+            metavar='SECONDS',
+            help='Keep running, polling for due jobs every SECONDS',
+        )
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='Only show job counts by status',
+        )
+
+    def handle(self, *args, **options):
+        if options.get('status'):
+            for status, label in PdfRenderJob.STATUS_CHOICES:
+                count = PdfRenderJob.objects.filter(status=status).count()
+                self.stdout.write(f'{label}: {count}')
+            return
+
+        watch = options.get('watch')
+        while True:
+            results = process_pending_pdf_jobs(limit=options.get('limit'), in_process=True)
+            if results or not watch:
+                summary = ', '.join(f'{status}: {count}' for status, count in sorted(results.items())) or 'no due jobs'
+                self.stdout.write(self.style.SUCCESS(f'PDF jobs processed ({summary})'))
+            if not watch:
+                break
+            time.sleep(watch)
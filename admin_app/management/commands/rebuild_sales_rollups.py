@@ -0,0 +1,49 @@
+"""
+Management command to rebuild the daily sales rollup table from the orders
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_app.models import DailySalesRollup
+from admin_app.rollups import rebuild_daily_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute DailySalesRollup rows from Order, CustomCakeOrder and GiftBoxOrder'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            choices=[choice for choice, _ in DailySalesRollup.ORDER_TYPE_CHOICES],
+            action='append',
+            dest='order_types',
+            help='Rebuild only this order type (can be repeated)',
+        )
+        parser.add_argument(
+            '--date-from',
+            help='First day to rebuild (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--date-to',
+            help='Last day to rebuild (YYYY-MM-DD)',
+        )
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        date_from = self._parse_date(options.get('date_from'))
+        date_to = self._parse_date(options.get('date_to'))
+
+        written = rebuild_daily_rollups(
+            order_types=options.get('order_types'),
+            date_from=date_from,
+            date_to=date_to,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} daily sales rollup row(s)'))
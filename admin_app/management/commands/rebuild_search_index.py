@@ -0,0 +1,20 @@
+"""
+Management command to rebuild the full-text product search index
+"""
+from django.core.management.base import BaseCommand
+
+from admin_app.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index (e.g. after bulk product updates)'
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        if backend is None:
+            self.stdout.write(self.style.WARNING(
+                'Full-text search is not available on this database; search uses icontains'
+            ))
+            return
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} product(s) ({backend})'))
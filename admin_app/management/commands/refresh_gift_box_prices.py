@@ -0,0 +1,22 @@
+"""
+Management command to recalculate the stored gift box prices and item counts
+"""
+from django.core.management.base import BaseCommand
+
+from admin_app.models import GiftBox
+
+
+class Command(BaseCommand):
+    help = 'Recalculate GiftBox.computed_price and computed_items_count (e.g. after bulk price updates)'
+
+    def handle(self, *args, **options):
+        changed = 0
+        gift_boxes = GiftBox.objects.all()
+        for gift_box in gift_boxes:
+            before = (gift_box.computed_price, gift_box.computed_items_count)
+            gift_box.refresh_pricing()
+            if (gift_box.computed_price, gift_box.computed_items_count) != before:
+                changed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(gift_boxes)} gift box(es), {changed} changed'
+        ))
@@ -0,0 +1,35 @@
+"""
+Management command to show how many session writes the coalescing session engine saved
+"""
+from django.core.management.base import BaseCommand
+
+from cakeshop.sessions import SessionStore, reset_stats, session_stats
+
+
+class Command(BaseCommand):
+    help = 'Show session writes saved/performed across workers; optionally purge expired sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Delete expired sessions now',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters (e.g. before a load test)',
+        )
+
+    def handle(self, *args, **options):
+        if options.get('purge'):
+            deleted = SessionStore.clear_expired()
+            self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired session(s)'))
+
+        if options.get('reset'):
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Session counters reset'))
+            return
+
+        for name, value in session_stats().items():
+            self.stdout.write(f'{name}: {value if value is not None else "-"}')
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0004_imagederivative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagederivative',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Responsive width/format variants (srcset manifest)'),
+        ),
+        migrations.AlterField(
+            model_name='imagederivative',
+            name='output',
+            field=models.CharField(db_index=True, help_text='Storage path of the processed image', max_length=255),
+        ),
+    ]
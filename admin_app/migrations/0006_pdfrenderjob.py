@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-17 03:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0005_imagederivative_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order_invoice', 'Order Invoice'), ('custom_cake_estimate', 'Custom Cake Estimate'), ('order_estimate', 'Order Estimate')], max_length=30)),
+                ('order_number', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('fingerprint', models.CharField(blank=True, help_text='Fingerprint of the last rendered PDF', max_length=64)),
+                ('last_error', models.TextField(blank=True)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'PDF Render Job',
+                'verbose_name_plural': 'PDF Render Jobs',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pdfrenderjob',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='admin_app_p_status_e69a8a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pdfrenderjob',
+            unique_together={('kind', 'order_number')},
+        ),
+    ]
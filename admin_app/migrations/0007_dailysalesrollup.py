@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-17 03:15
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    DailySalesRollup = apps.get_model('admin_app', 'DailySalesRollup')
+    output = DecimalField(max_digits=14, decimal_places=2)
+    sources = [
+        ('regular', apps.get_model('admin_app', 'Order'),
+         Coalesce('total_price', Value(0), output_field=output)),
+        ('custom', apps.get_model('admin_app', 'CustomCakeOrder'),
+         Coalesce(NullIf('final_price', Value(0)), 'estimated_price', Value(0), output_field=output)),
+        ('gift_box', apps.get_model('admin_app', 'GiftBoxOrder'),
+         Coalesce('total_price', Value(0), output_field=output)),
+    ]
+    for order_type, model, amount in sources:
+        totals = model.objects.annotate(day=TruncDate('created_at')).values('day', 'status').annotate(
+            order_count=Count('id'), total_amount=Sum(amount)
+        ).order_by()
+        DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(
+                date=row['day'], order_type=order_type, status=row['status'],
+                order_count=row['order_count'], total_amount=row['total_amount'] or 0
+            )
+            for row in totals
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0006_pdfrenderjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('order_type', models.CharField(choices=[('regular', 'Regular'), ('custom', 'Custom Cake'), ('gift_box', 'Gift Box')], max_length=10)),
+                ('status', models.CharField(max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Daily Sales Rollup',
+                'verbose_name_plural': 'Daily Sales Rollups',
+                'ordering': ['-date', 'order_type', 'status'],
+                'unique_together': {('date', 'order_type', 'status')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
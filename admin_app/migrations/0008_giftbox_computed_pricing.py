@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-17 03:25
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def populate_gift_box_pricing(apps, schema_editor):
+    GiftBox = apps.get_model('admin_app', 'GiftBox')
+    GiftBoxItem = apps.get_model('admin_app', 'GiftBoxItem')
+    ProductPrice = apps.get_model('admin_app', 'ProductPrice')
+    prices = {
+        (product_id, size_id): price
+        for product_id, size_id, price in ProductPrice.objects.values_list('product_id', 'size_id', 'price')
+    }
+    items_by_box = {}
+    for gift_box_id, product_id, size_id, quantity in GiftBoxItem.objects.values_list(
+        'gift_box_id', 'product_id', 'size_id', 'quantity'
+    ):
+        items_by_box.setdefault(gift_box_id, []).append(
+            (prices.get((product_id, size_id), Decimal('0.00')), quantity)
+        )
+
+    for gift_box in GiftBox.objects.all():
+        items = items_by_box.get(gift_box.id, [])
+        items_total = sum((price * quantity for price, quantity in items), Decimal('0.00'))
+        if gift_box.pricing_type == 'fixed' and gift_box.fixed_price:
+            total = gift_box.fixed_price
+        elif gift_box.pricing_type == 'discounted' and gift_box.discount_percentage:
+            total = items_total - items_total * (gift_box.discount_percentage / 100)
+        else:
+            total = items_total
+        GiftBox.objects.filter(pk=gift_box.pk).update(
+            computed_price=Decimal(total).quantize(Decimal('0.01')),
+            computed_items_count=sum(quantity for _, quantity in items)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0007_dailysalesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='giftbox',
+            name='computed_items_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='giftbox',
+            name='computed_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(populate_gift_box_pricing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations, OperationalError
+
+SEARCH_TABLE = 'admin_app_productsearch'
+
+
+def _documents(apps):
+    Product = apps.get_model('admin_app', 'Product')
+    return [
+        (product_id, name, description or '', category or '', subcategory or '')
+        for product_id, name, description, category, subcategory in Product.objects.filter(
+            is_active=True
+        ).values_list('id', 'name', 'description', 'category__name', 'subcategory__name')
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                f"name, description, category, subcategory, "
+                f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to icontains
+            return
+        insert = (
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category, subcategory) '
+            f'VALUES (%s, %s, %s, %s, %s)'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {SEARCH_TABLE} ('
+            f'product_id bigint PRIMARY KEY REFERENCES admin_app_product (id) ON DELETE CASCADE '
+            f'DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)'
+        )
+        insert = (
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, "
+            f"setweight(to_tsvector('simple', %s), 'A') || "
+            f"setweight(to_tsvector('simple', %s), 'C') || "
+            f"setweight(to_tsvector('simple', %s), 'B') || "
+            f"setweight(to_tsvector('simple', %s), 'B'))"
+        )
+    else:
+        return
+
+    documents = _documents(apps)
+    if documents:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, documents)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0008_giftbox_computed_pricing'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
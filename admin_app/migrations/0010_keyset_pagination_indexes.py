@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gallery',
+            index=models.Index(fields=['uploaded_at', 'id'], name='admin_app_g_uploade_5ecb24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='admin_app_p_created_3b35dd_idx'),
+        ),
+    ]
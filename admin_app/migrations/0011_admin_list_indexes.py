@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-17 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0010_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customcakeorder',
+            index=models.Index(fields=['created_at', 'id'], name='admin_app_c_created_382f0a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customcakeorder',
+            index=models.Index(fields=['status', 'created_at'], name='admin_app_c_status_81d350_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customcakeorder',
+            index=models.Index(fields=['customer', 'created_at'], name='admin_app_c_custome_3efdb6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at', 'id'], name='admin_app_c_created_5d0ffb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftboxorder',
+            index=models.Index(fields=['created_at', 'id'], name='admin_app_g_created_4ae5e6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftboxorder',
+            index=models.Index(fields=['status', 'created_at'], name='admin_app_g_status_4d2a12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftboxorder',
+            index=models.Index(fields=['customer', 'created_at'], name='admin_app_g_custome_850d87_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='admin_app_o_created_6bd849_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='admin_app_o_status_4caf19_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'created_at'], name='admin_app_o_custome_35bb62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasebill',
+            index=models.Index(fields=['date', 'id'], name='admin_app_p_date_a03206_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0013_order_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text='Not sent after this time (e.g. an OTP past its validity)', null=True),
+        ),
+    ]
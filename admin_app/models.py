@@ -1,9 +1,12 @@
-from django.db import models
+import threading
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Max, Min
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from datetime import datetime
 from decimal import Decimal
-from .utils import resize_and_optimize_image, get_image_dimensions_for_model
+from .utils import get_image_dimensions_for_model, prepare_image_upload, schedule_image_processing
 
 # ===========================
 # 1. Category & Subcategory
@@ -33,11 +36,11 @@ class Category(models.Model):
         return self.name
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            width, height = get_image_dimensions_for_model('Category', 'image')
-            self.image = resize_and_optimize_image(self.image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('Category', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 class Subcategory(models.Model):
@@ -62,11 +65,11 @@ class Subcategory(models.Model):
         return f"{self.category.name} - {self.name}"
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            width, height = get_image_dimensions_for_model('Subcategory', 'image')
-            self.image = resize_and_optimize_image(self.image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('Subcategory', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 # ===========================
@@ -99,6 +102,25 @@ class Size(models.Model):
 # 3. Products
 # ===========================
 
+def _price_value(value):
+    return Decimal(value).quantize(Decimal('0.01')) if value is not None else None
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_price_summary(self):
+        """
+        Annotate each product's cheapest and dearest size price and the
+        number of priced sizes (price_min, price_max, price_count), so
+        listings get them from the same query instead of one query per card.
+        Aggregate queries ignore Meta.ordering, so order the result explicitly.
+        """
+        return self.annotate(
+            price_min=Min('prices__price'),
+            price_max=Max('prices__price'),
+            price_count=Count('prices', distinct=True),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
@@ -115,24 +137,60 @@ class Product(models.Model):
     # Available sizes (many-to-many)
     sizes = models.ManyToManyField(Size, related_name='products')
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        # Keyset pagination of the storefront listing (created_at, id)
+        indexes = [models.Index(fields=['created_at', 'id'])]
     
     def __str__(self):
         return self.name
     
+    def _price_summary(self):
+        """
+        (min, max, count) of this product's size prices. Uses the
+        with_price_summary() annotation or prefetched prices when present,
+        otherwise runs one aggregate query and keeps the result.
+        """
+        if not hasattr(self, 'price_min'):
+            prefetched = getattr(self, '_prefetched_objects_cache', {}).get('prices')
+            if prefetched is not None:
+                prices = [price.price for price in prefetched]
+                self.price_min = min(prices) if prices else None
+                self.price_max = max(prices) if prices else None
+                self.price_count = len(prices)
+            else:
+                summary = self.prices.aggregate(
+                    price_min=Min('price'), price_max=Max('price'), price_count=Count('id')
+                )
+                self.price_min = summary['price_min']
+                self.price_max = summary['price_max']
+                self.price_count = summary['price_count']
+        # SQLite returns aggregated decimals without their scale (100 vs 100.00)
+        return _price_value(self.price_min), _price_value(self.price_max), self.price_count
+    
     @property
     def min_price(self):
         """Get minimum price from all ProductPrice combinations"""
-        min_price_obj = self.prices.order_by('price').first()
-        return min_price_obj.price if min_price_obj else None
+        return self._price_summary()[0]
+    
+    @property
+    def max_price(self):
+        """Get maximum price from all ProductPrice combinations"""
+        return self._price_summary()[1]
+    
+    @property
+    def priced_size_count(self):
+        """Number of sizes this product has a price for"""
+        return self._price_summary()[2]
     
     def save(self, *args, **kwargs):
-        # Process main image if it's being uploaded/changed
-        if self.main_image:
-            width, height = get_image_dimensions_for_model('Product', 'main_image')
-            self.main_image = resize_and_optimize_image(self.main_image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('Product', 'main_image')
+        pending = prepare_image_upload(self, 'main_image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_images')
     image = models.ImageField(
@@ -146,10 +204,11 @@ class ProductImage(models.Model):
         return f"Image for {self.product.name}"
 
     def save(self, *args, **kwargs):
-        if self.image:
-            width, height = get_image_dimensions_for_model('ProductImage', 'image')
-            self.image = resize_and_optimize_image(self.image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('ProductImage', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 class ProductPrice(models.Model):
@@ -222,6 +281,8 @@ class PurchaseBill(models.Model):
     
     class Meta:
         ordering = ['-date']
+        # Admin bill list: keyset pages newest first
+        indexes = [models.Index(fields=['date', 'id'])]
     
     def __str__(self):
         return f"{self.supplier_name} - ₹{self.total_amount} ({self.date})"
@@ -277,6 +338,8 @@ class Customer(models.Model):
     
     class Meta:
         ordering = ['name']
+        # Admin customer list: keyset pages newest first
+        indexes = [models.Index(fields=['created_at', 'id'])]
     
     def __str__(self):
         return f"{self.name} ({self.phone_number})"
@@ -307,6 +370,8 @@ class Order(models.Model):
     ]
     
     order_number = models.CharField(max_length=20, unique=True, editable=False)
+    # Form submission that created the order; a resubmission can't insert it twice
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     size = models.ForeignKey(Size, on_delete=models.CASCADE)
@@ -328,6 +393,17 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Admin lists: keyset pages newest first, by status and per customer
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['customer', 'created_at']),
+        ]
+    
+    @staticmethod
+    def order_number_prefix():
+        """Today's order number prefix (CKyyyymmdd)"""
+        return f"CK{timezone.now().strftime('%Y%m%d')}"
     
     def calculate_unit_price(self):
         """Calculate unit price from ProductPrice table"""
@@ -344,15 +420,7 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Generate unique order number
-            today = timezone.now()
-            prefix = f"CK{today.strftime('%Y%m%d')}"
-            last_order = Order.objects.filter(order_number__startswith=prefix).order_by('-order_number').first()
-            if last_order:
-                last_num = int(last_order.order_number[-4:])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            self.order_number = f"{prefix}{new_num:04d}"
+            self.order_number = generate_sequence_number(Order, 'order_number', self.order_number_prefix(), 4)
         
         # Auto-calculate unit price from ProductPrice if not set
         if not self.unit_price or self.unit_price == 0:
@@ -405,16 +473,18 @@ class Gallery(models.Model):
     class Meta:
         verbose_name_plural = "Gallery"
         ordering = ['-uploaded_at']
+        # Keyset pagination of the gallery page (uploaded_at, id)
+        indexes = [models.Index(fields=['uploaded_at', 'id'])]
     
     def __str__(self):
         return self.caption if self.caption else f"Gallery Image {self.id}"
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            width, height = get_image_dimensions_for_model('Gallery', 'image')
-            self.image = resize_and_optimize_image(self.image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('Gallery', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 # ===========================
@@ -478,11 +548,11 @@ class CarouselSlide(models.Model):
         return self.is_active and self.start_date <= today <= self.end_date
     
     def save(self, *args, **kwargs):
-        # Process carousel image if it's being uploaded/changed
-        if self.image:
-            width, height = get_image_dimensions_for_model('CarouselSlide', 'image')
-            self.image = resize_and_optimize_image(self.image, width, height, quality=90)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('CarouselSlide', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, quality=90, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 class PageTitleBanner(models.Model):
@@ -533,14 +603,11 @@ class PageTitleBanner(models.Model):
         return True
 
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            try:
-                width, height = get_image_dimensions_for_model('PageTitleBanner', 'image')
-            except Exception:
-                width, height = (1600, 400)
-            self.image = resize_and_optimize_image(self.image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('PageTitleBanner', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 
@@ -586,11 +653,11 @@ class OfferBanner(models.Model):
         return self.is_active and self.start_date <= today <= self.end_date
     
     def save(self, *args, **kwargs):
-        # Process offer banner image if it's being uploaded/changed
-        if self.image:
-            width, height = get_image_dimensions_for_model('OfferBanner', 'image')
-            self.image = resize_and_optimize_image(self.image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('OfferBanner', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 # ===========================
@@ -626,10 +693,11 @@ class CakeShape(models.Model):
         return f"{self.name} (₹{self.base_price_per_kg}/kg)"
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            self.image = resize_and_optimize_image(self.image, 400, 400)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('CakeShape', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 class CakeTier(models.Model):
@@ -663,10 +731,11 @@ class CakeTier(models.Model):
         return f"{self.name} ({self.tiers_count} tier{'s' if self.tiers_count > 1 else ''})"
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            self.image = resize_and_optimize_image(self.image, 400, 400)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('CakeTier', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 class Flavor(models.Model):
@@ -734,10 +803,11 @@ class Decoration(models.Model):
         return f"{self.name} (₹{self.price})"
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.image:
-            self.image = resize_and_optimize_image(self.image, 300, 300)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('Decoration', 'image')
+        pending = prepare_image_upload(self, 'image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
 
 
 class CustomCakeOrderDecoration(models.Model):
@@ -795,6 +865,8 @@ class CustomCakeOrder(models.Model):
     ]
     
     order_number = models.CharField(max_length=20, unique=True, editable=False)
+    # Form submission that created the order; a resubmission can't insert it twice
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='custom_orders')
     
     # Product Selection (optional - if customer selects existing product)
@@ -903,94 +975,51 @@ class CustomCakeOrder(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Admin lists: keyset pages newest first, by status and per customer
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['customer', 'created_at']),
+        ]
         verbose_name = 'Custom Cake Order'
         verbose_name_plural = 'Custom Cake Orders'
     
     def __str__(self):
         return f"Custom Order #{self.order_number} - {self.customer.name}"
     
+    @staticmethod
+    def order_number_prefix():
+        """Today's custom order number prefix (CSTMyyyymmdd)"""
+        return f"CSTM{timezone.now().strftime('%Y%m%d')}"
+    
     def save(self, *args, **kwargs):
         # Generate unique order number
         if not self.order_number:
-            today = timezone.now()
-            prefix = f"CSTM{today.strftime('%Y%m%d')}"
-            last_order = CustomCakeOrder.objects.filter(
-                order_number__startswith=prefix
-            ).order_by('-order_number').first()
-            if last_order:
-                last_num = int(last_order.order_number[-4:])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            self.order_number = f"{prefix}{new_num:04d}"
+            self.order_number = generate_sequence_number(CustomCakeOrder, 'order_number', self.order_number_prefix(), 4)
         
         # Auto-calculate estimated price if not set
         if not self.estimated_price or self.estimated_price == 0:
             self.estimated_price = self.calculate_estimate()
         
-        # Process reference image if uploaded
-        if self.reference_image:
-            self.reference_image = resize_and_optimize_image(self.reference_image, 1200, 1200, quality=85)
-        
+        # Queue reference image processing if uploaded/changed
+        width, height = get_image_dimensions_for_model('CustomCakeOrder', 'reference_image')
+        pending = prepare_image_upload(self, 'reference_image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        schedule_image_processing(self, pending)
+    
+    def pricing_quote(self, refresh=False):
+        """Estimate and breakdown from one pricing pass (kept on the instance)"""
+        from .custom_pricing import quote_order
+        
+        quote = getattr(self, '_pricing_quote', None)
+        if quote is None or refresh:
+            quote = quote_order(self)
+            self._pricing_quote = quote
+        return quote
     
     def calculate_estimate(self):
         """Auto-calculate estimated price"""
-        from decimal import Decimal
-        
-        # Ensure total_weight is a Decimal
-        if isinstance(self.total_weight, str):
-            total_weight = Decimal(self.total_weight)
-        else:
-            total_weight = Decimal(str(self.total_weight))
-        
-        # Determine base price based on what customer selected
-        # Always start with shape base price
-        shape_cost = self.shape.base_price_per_kg * total_weight
-        flavor_cost = Decimal('0.00')
-        
-        if self.product and self.size:
-            # Customer selected existing product - use ProductPrice as flavor cost
-            try:
-                product_price = ProductPrice.objects.get(
-                    product=self.product,
-                    size=self.size
-                )
-                # ProductPrice is the FLAVOR/RECIPE cost, add it to shape cost
-                flavor_cost = product_price.price
-            except ProductPrice.DoesNotExist:
-                # No product price found, flavor_cost remains 0
-                flavor_cost = Decimal('0.00')
-        else:
-            # Customer built custom cake from scratch
-            # Add flavor cost (per kg)
-            if self.flavor:
-                # Use predefined flavor price
-                flavor_cost = self.flavor.price_per_kg * total_weight
-            elif self.custom_flavor_price_per_kg:
-                # Use admin-set custom flavor price - ensure it's Decimal
-                custom_price = Decimal(str(self.custom_flavor_price_per_kg))
-                flavor_cost = custom_price * total_weight
-            # else: if neither set, flavor_cost remains 0 (admin needs to set price)
-        
-        # Subtotal before tier multiplier
-        subtotal = shape_cost + flavor_cost
-        
-        # Apply tier multiplier
-        tier_price = subtotal * self.tier.price_multiplier
-        
-        # Add decoration costs with quantities
-        decoration_total = Decimal('0.00')
-        if self.pk:  # Only if already saved (so we can access related decorations)
-            decoration_total = sum(
-                Decimal(str(order_dec.total_price)) 
-                for order_dec in self.order_decorations.all()
-            )
-        
-        # Total estimate
-        total = tier_price + decoration_total
-        
-        return round(total, 2)
+        return self.pricing_quote(refresh=True).estimate
     
     def update_estimate(self):
         """Recalculate and update estimate"""
@@ -1005,22 +1034,9 @@ class CustomCakeOrder(models.Model):
     @property
     def price_range(self):
         """Calculate price range for display (round up to nearest 200, then +500)"""
-        from decimal import Decimal
-        import math
-        
-        base_estimate = self.estimated_price if self.estimated_price else self.calculate_estimate()
+        from .custom_pricing import price_range
         
-        # Round UP to nearest 200
-        min_price = math.ceil(float(base_estimate) / 200) * 200
-        
-        # Max is min + 500
-        max_price = min_price + 500
-        
-        return {
-            'min': int(min_price),
-            'max': int(max_price),
-            'estimate': int(base_estimate)
-        }
+        return price_range(self.estimated_price if self.estimated_price else self.pricing_quote().estimate)
     
     @property
     def price_range_display(self):
@@ -1031,60 +1047,7 @@ class CustomCakeOrder(models.Model):
     @property
     def price_breakdown(self):
         """Get detailed price breakdown for display"""
-        from decimal import Decimal
-        
-        total_weight = self.total_weight if isinstance(self.total_weight, Decimal) else Decimal(str(self.total_weight))
-        
-        # Always calculate shape cost first
-        shape_cost = self.shape.base_price_per_kg * total_weight
-        flavor_cost = Decimal('0.00')
-        flavor_source = "Not set"
-        pricing_method = "shape_based"
-        
-        if self.product and self.size:
-            # Customer selected existing product - use ProductPrice as flavor addon
-            try:
-                product_price = ProductPrice.objects.get(
-                    product=self.product,
-                    size=self.size
-                )
-                # ProductPrice is the flavor/recipe cost, added to shape cost
-                flavor_cost = product_price.price
-                flavor_source = f"{self.product.name} - {self.size.name} (Product)"
-                pricing_method = "product_based"
-            except ProductPrice.DoesNotExist:
-                flavor_source = "Product price not found"
-                flavor_cost = Decimal('0.00')
-        else:
-            # Custom build
-            if self.flavor:
-                flavor_cost = self.flavor.price_per_kg * total_weight
-                flavor_source = f"{self.flavor.name} (₹{self.flavor.price_per_kg}/kg)"
-            elif self.custom_flavor_price_per_kg:
-                custom_price = Decimal(str(self.custom_flavor_price_per_kg))
-                flavor_cost = custom_price * total_weight
-                flavor_source = f"{self.flavor_description} (₹{custom_price}/kg)"
-        
-        subtotal = shape_cost + flavor_cost
-        with_tier = subtotal * self.tier.price_multiplier
-        
-        decorations = Decimal('0.00')
-        if self.pk:
-            decorations = sum(
-                Decimal(str(order_dec.total_price)) 
-                for order_dec in self.order_decorations.all()
-            )
-        
-        return {
-            'shape': round(shape_cost, 2),
-            'flavor': round(flavor_cost, 2),
-            'flavor_source': flavor_source,
-            'subtotal': round(subtotal, 2),
-            'with_tier': round(with_tier, 2),
-            'decorations': round(decorations, 2),
-            'total': round(with_tier + decorations, 2),
-            'pricing_method': pricing_method
-        }
+        return self.pricing_quote().breakdown
 
 
 # ===========================
@@ -1130,6 +1093,11 @@ class GiftBox(models.Model):
         help_text='Discount % (only for Sum with Discount type)'
     )
     
+    # Materialized pricing (kept current by refresh_pricing() and the
+    # GiftBoxItem/ProductPrice signals)
+    computed_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    computed_items_count = models.PositiveIntegerField(default=0, editable=False)
+    
     is_active = models.BooleanField(default=True)
     display_order = models.IntegerField(default=0, help_text='Order of display (lower numbers first)')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -1144,31 +1112,56 @@ class GiftBox(models.Model):
         return self.name
     
     def save(self, *args, **kwargs):
-        # Process image if it's being uploaded/changed
-        if self.main_image:
-            width, height = get_image_dimensions_for_model('Product', 'main_image')
-            self.main_image = resize_and_optimize_image(self.main_image, width, height)
+        # Queue image processing if it's being uploaded/changed
+        width, height = get_image_dimensions_for_model('GiftBox', 'main_image')
+        pending = prepare_image_upload(self, 'main_image', width, height, update_fields=kwargs.get('update_fields'))
         super().save(*args, **kwargs)
-    
-    @property
-    def total_price(self):
-        """Calculate total price based on pricing type"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'pricing_type', 'fixed_price', 'discount_percentage'} & set(update_fields):
+            self.refresh_pricing()
+        schedule_image_processing(self, pending)
+    
+    def calculate_pricing(self):
+        """
+        Calculate (total price, items count) from the items and their
+        current size prices, based on pricing type
+        """
+        items = list(self.items.all()) if self.pk else []
+        GiftBoxItem.attach_unit_prices(items)
+        items_count = sum(item.quantity for item in items)
+        
         if self.pricing_type == 'fixed' and self.fixed_price:
-            return self.fixed_price
+            return Decimal(self.fixed_price), items_count
         
         # Calculate sum of all items
-        items_total = sum(item.subtotal for item in self.items.all())
+        items_total = sum((item.subtotal for item in items), Decimal('0.00'))
         
         if self.pricing_type == 'discounted' and self.discount_percentage:
-            discount_amount = items_total * (self.discount_percentage / 100)
-            return items_total - discount_amount
+            discount_amount = items_total * (Decimal(self.discount_percentage) / 100)
+            return items_total - discount_amount, items_count
         
-        return items_total
+        return items_total, items_count
+    
+    def refresh_pricing(self):
+        """Recalculate and store the total price and items count"""
+        total_price, items_count = self.calculate_pricing()
+        self.computed_price = total_price.quantize(Decimal('0.01'))
+        self.computed_items_count = items_count
+        # update() rather than save(): no image processing or auto_now side effects
+        GiftBox.objects.filter(pk=self.pk).update(
+            computed_price=self.computed_price,
+            computed_items_count=self.computed_items_count
+        )
+    
+    @property
+    def total_price(self):
+        """Total price based on pricing type (materialized)"""
+        return self.computed_price
     
     @property
     def items_count(self):
-        """Get total count of items in the gift box"""
-        return sum(item.quantity for item in self.items.all())
+        """Get total count of items in the gift box (materialized)"""
+        return self.computed_items_count
 
 
 class GiftBoxItem(models.Model):
@@ -1192,11 +1185,33 @@ class GiftBoxItem(models.Model):
     def __str__(self):
         return f"{self.quantity}× {self.product.name} ({self.size.name})"
     
+    @staticmethod
+    def attach_unit_prices(items):
+        """
+        Load the size prices of several items in one query, so unit_price
+        and subtotal don't query per item. Returns the items.
+        """
+        items = list(items)
+        if not items:
+            return items
+        prices = {
+            (product_id, size_id): price
+            for product_id, size_id, price in ProductPrice.objects.filter(
+                product_id__in={item.product_id for item in items},
+                size_id__in={item.size_id for item in items}
+            ).values_list('product_id', 'size_id', 'price')
+        }
+        for item in items:
+            item._unit_price = prices.get((item.product_id, item.size_id), Decimal('0.00'))
+        return items
+    
     @property
     def unit_price(self):
         """Get price for this product-size combination"""
+        if hasattr(self, '_unit_price'):
+            return self._unit_price
         try:
-            product_price = ProductPrice.objects.get(product=self.product, size=self.size)
+            product_price = ProductPrice.objects.get(product_id=self.product_id, size_id=self.size_id)
             return product_price.price
         except ProductPrice.DoesNotExist:
             return Decimal('0.00')
@@ -1219,6 +1234,8 @@ class GiftBoxOrder(models.Model):
     ]
     
     order_number = models.CharField(max_length=20, unique=True, editable=False)
+    # Form submission that created the order; a resubmission can't insert it twice
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='gift_box_orders')
     gift_box = models.ForeignKey(GiftBox, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
@@ -1247,6 +1264,12 @@ class GiftBoxOrder(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Admin lists: keyset pages newest first, by status and per customer
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['customer', 'created_at']),
+        ]
         verbose_name = 'Gift Box Order'
         verbose_name_plural = 'Gift Box Orders'
     
@@ -1255,15 +1278,7 @@ class GiftBoxOrder(models.Model):
         if not self.order_number:
             today = timezone.now()
             prefix = f"GB{today.strftime('%Y%m%d')}"
-            last_order = GiftBoxOrder.objects.filter(
-                order_number__startswith=prefix
-            ).order_by('-order_number').first()
-            if last_order:
-                last_num = int(last_order.order_number[-4:])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            self.order_number = f"{prefix}{new_num:04d}"
+            self.order_number = generate_sequence_number(GiftBoxOrder, 'order_number', prefix, 4)
         
         # Set prices if not already set
         if not self.unit_price or self.unit_price == 0:
@@ -1325,25 +1340,23 @@ class LoyaltyCard(models.Model):
             # Generate unique card number: LC{YYYYMMDD}{XXX}
             today = timezone.now()
             prefix = f"LC{today.strftime('%Y%m%d')}"
-            last_card = LoyaltyCard.objects.filter(card_number__startswith=prefix).order_by('-card_number').first()
-            if last_card:
-                last_num = int(last_card.card_number[-3:])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            self.card_number = f"{prefix}{new_num:03d}"
+            self.card_number = generate_sequence_number(LoyaltyCard, 'card_number', prefix, 3)
         
         # Auto-update tier based on lifetime orders
-        if self.total_orders >= 50:
-            self.tier = 'platinum'
-        elif self.total_orders >= 25:
-            self.tier = 'gold'
-        elif self.total_orders >= 10:
-            self.tier = 'silver'
-        else:
-            self.tier = 'bronze'
-        
+        self.tier = self.tier_for_orders(self.total_orders)
+
         super().save(*args, **kwargs)
+
+    @staticmethod
+    def tier_for_orders(total_orders):
+        """Tier a card reaches after the given number of lifetime orders"""
+        if total_orders >= 50:
+            return 'platinum'
+        elif total_orders >= 25:
+            return 'gold'
+        elif total_orders >= 10:
+            return 'silver'
+        return 'bronze'
     
     def __str__(self):
         return f"{self.customer.name} - {self.card_number} ({self.get_tier_display()})"
@@ -1649,4 +1662,261 @@ class CustomerAchievement(models.Model):
         verbose_name_plural = 'Customer Achievements'
     
     def __str__(self):
-        return f"{self.loyalty_card.customer.name} - {self.achievement.name}"
\ No newline at end of file
+        return f"{self.loyalty_card.customer.name} - {self.achievement.name}"
+
+# ===========================
+# 12. Number Sequences
+# ===========================
+
+class NumberSequence(models.Model):
+    """Per-prefix counters used to allocate order and card numbers.
+
+    Prefixes carry the date (e.g. CK20250101), so each row is a per-day
+    counter. Numbers are handed out with an atomic UPDATE instead of scanning
+    the order table, so concurrent workers never receive the same number.
+    """
+    prefix = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+        verbose_name = 'Number Sequence'
+        verbose_name_plural = 'Number Sequences'
+
+    def __str__(self):
+        return f"{self.prefix}: {self.last_value}"
+
+    @classmethod
+    def allocate(cls, prefix, count=1, seed=None):
+        """Reserve `count` consecutive values for `prefix` and return the first one.
+
+        `seed` is an optional callable returning the highest value already
+        used for this prefix; it is only called when the counter row does not
+        exist yet (first number of the day, or numbers issued before this
+        table existed).
+        """
+        with transaction.atomic():
+            updated = cls.objects.filter(prefix=prefix).update(
+                last_value=F('last_value') + count,
+                updated_at=timezone.now()
+            )
+            if not updated:
+                start = seed() if seed else 0
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefix=prefix, last_value=start + count)
+                    return start + 1
+                except IntegrityError:
+                    # Another worker created the row first; take the update path
+                    cls.objects.filter(prefix=prefix).update(
+                        last_value=F('last_value') + count,
+                        updated_at=timezone.now()
+                    )
+            last_value = cls.objects.filter(prefix=prefix).values_list('last_value', flat=True).get()
+        return last_value - count + 1
+
+
+class ImageDerivative(models.Model):
+    """Processed (resized) images keyed by the SHA-256 of the uploaded original.
+
+    Lets the image pipeline recognise a re-uploaded picture and reuse the
+    stored derivative instead of re-encoding and storing another copy.
+    """
+    source_hash = models.CharField(max_length=64)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    quality = models.PositiveIntegerField(default=85)
+    output = models.CharField(max_length=255, db_index=True, help_text='Storage path of the processed image')
+    variants = models.JSONField(default=dict, blank=True, help_text='Responsive width/format variants (srcset manifest)')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['source_hash', 'width', 'height', 'quality']
+        ordering = ['-created_at']
+        verbose_name = 'Image Derivative'
+        verbose_name_plural = 'Image Derivatives'
+
+    def __str__(self):
+        return f"{self.output} ({self.width}×{self.height})"
+
+
+# Blocks of numbers pre-allocated by this worker: {prefix: [next_value, last_value]}
+_sequence_blocks = {}
+_sequence_lock = threading.Lock()
+
+
+def generate_sequence_number(model, field, prefix, width):
+    """Return the next unique `{prefix}{n:0{width}d}` value for `model.field`.
+
+    With ORDER_NUMBER_BLOCK_SIZE > 1 each worker reserves a block of numbers
+    at once and hands them out from memory, trading strictly increasing
+    numbers across workers for fewer writes to the counter row. Blocks are
+    only kept when allocating in autocommit mode: inside an atomic block the
+    reservation could be rolled back while the numbers stay cached here.
+    """
+    block_size = max(1, int(getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 1)))
+    if transaction.get_connection().in_atomic_block:
+        block_size = 1
+
+    with _sequence_lock:
+        block = _sequence_blocks.get(prefix)
+        if block is None or block[0] > block[1]:
+            first = NumberSequence.allocate(prefix, count=block_size, seed=_sequence_seed(model, field, prefix))
+            block = [first, first + block_size - 1]
+            # Only keep today's blocks around
+            for key in [k for k in _sequence_blocks if k[:-8] == prefix[:-8]]:
+                del _sequence_blocks[key]
+            _sequence_blocks[prefix] = block
+        value = block[0]
+        block[0] += 1
+
+    return f"{prefix}{value:0{width}d}"
+
+
+def generate_sequence_numbers(model, field, prefix, width, count):
+    """Return `count` consecutive unique values for `model.field` with one counter update.
+
+    Used when creating many orders at once (bulk_create skips save(), which
+    would otherwise allocate each number separately).
+    """
+    if count <= 0:
+        return []
+    first = NumberSequence.allocate(prefix, count=count, seed=_sequence_seed(model, field, prefix))
+    return [f"{prefix}{value:0{width}d}" for value in range(first, first + count)]
+
+
+def _sequence_seed(model, field, prefix):
+    """Callable returning the highest number already used for `prefix` in `model.field`."""
+    def existing_max():
+        last = model.objects.filter(
+            **{f'{field}__startswith': prefix}
+        ).order_by(f'-{field}').values_list(field, flat=True).first()
+        if not last:
+            return 0
+        try:
+            return int(last[len(prefix):])
+        except ValueError:
+            return 0
+
+    return existing_max
+
+
+# ===========================
+# 13. Background Jobs
+# ===========================
+
+class PdfRenderJob(models.Model):
+    """Queued pre-render of an order's invoice/estimate PDF (see pdf_jobs.py).
+
+    One row per document; placing or editing an order re-queues its row.
+    Rows left pending by a restarted worker are picked up again by the
+    process_pdf_jobs management command.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    KIND_CHOICES = [
+        ('order_invoice', 'Order Invoice'),
+        ('custom_cake_estimate', 'Custom Cake Estimate'),
+        ('order_estimate', 'Order Estimate'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    order_number = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    fingerprint = models.CharField(max_length=64, blank=True, help_text='Fingerprint of the last rendered PDF')
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['kind', 'order_number']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+        ordering = ['-updated_at']
+        verbose_name = 'PDF Render Job'
+        verbose_name_plural = 'PDF Render Jobs'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.order_number} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """Queued outgoing email, sent by the background mail sender (see mail_outbox.py).
+
+    The request that needs an email (e.g. an OTP) only inserts a row; the
+    sender delivers due rows in batches over one SMTP connection, retrying
+    failures with backoff. Messages with an expires_at (OTPs) are given up
+    once it passes instead of arriving dead. The body is cleared once the
+    row is sent or failed, since it may hold a one-time password.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text='Not sent after this time (e.g. an OTP past its validity)')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['status', 'sent_at']),
+        ]
+        ordering = ['-created_at']
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+
+# ===========================
+# 14. Reporting
+# ===========================
+
+class DailySalesRollup(models.Model):
+    """Per-day order count and value for one order type and status.
+
+    Kept up to date by the order save/delete signals (see rollups.py) so the
+    dashboard and sales report aggregate a few rows instead of every order.
+    `python manage.py rebuild_sales_rollups` recomputes it from the orders.
+    """
+    ORDER_TYPE_CHOICES = [
+        ('regular', 'Regular'),
+        ('custom', 'Custom Cake'),
+        ('gift_box', 'Gift Box'),
+    ]
+
+    date = models.DateField()
+    order_type = models.CharField(max_length=10, choices=ORDER_TYPE_CHOICES)
+    status = models.CharField(max_length=20)
+    order_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['date', 'order_type', 'status']
+        ordering = ['-date', 'order_type', 'status']
+        verbose_name = 'Daily Sales Rollup'
+        verbose_name_plural = 'Daily Sales Rollups'
+
+    def __str__(self):
+        return f"{self.date} {self.order_type}/{self.status}: {self.order_count} (₹{self.total_amount})"
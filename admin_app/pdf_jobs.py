@@ -0,0 +1,285 @@
+"""
+Background pre-rendering of order PDFs
+
+When an order is placed its invoice/estimate link goes out on WhatsApp right
+away, so the document is rendered ahead of the first click. Jobs are rows in
+PdfRenderJob (no broker needed). A small dispatcher thread pool claims them,
+loads the order and hands the ReportLab work to a process pool so rendering
+never competes with request threads for the GIL. The finished bytes go into
+the invoices render cache, where the PDF views find them.
+
+Failed renders are retried with exponential backoff up to
+PDF_RENDER_MAX_ATTEMPTS. Jobs interrupted by a restart are picked up by
+`python manage.py process_pdf_jobs`.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import invoices
+
+logger = logging.getLogger(__name__)
+
+_render_pool = None
+_dispatch_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_render_pool():
+    global _render_pool
+    with _pool_lock:
+        if _render_pool is None:
+            # 'spawn' keeps workers from inheriting request threads and DB
+            # connections; they only need reportlab and the invoices module.
+            _render_pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PDF_RENDER_WORKERS', 1),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _render_pool
+
+
+def _get_dispatch_pool():
+    global _dispatch_pool
+    with _pool_lock:
+        if _dispatch_pool is None:
+            _dispatch_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PDF_RENDER_WORKERS', 1),
+                thread_name_prefix='pdf-jobs'
+            )
+        return _dispatch_pool
+
+
+def _reset_render_pool():
+    """Drop a broken process pool (e.g. a worker was killed) so the next job starts a new one."""
+    global _render_pool
+    with _pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ===========================
+# Queueing
+# ===========================
+
+def enqueue_pdf_render(kind, order_number):
+    """Queue (or re-queue) a document and dispatch it to the background workers."""
+    from .models import PdfRenderJob
+
+    job, created = PdfRenderJob.objects.get_or_create(kind=kind, order_number=order_number)
+    if not created:
+        PdfRenderJob.objects.filter(pk=job.pk).update(
+            status='pending', attempts=0, last_error='',
+            next_attempt_at=timezone.now(), updated_at=timezone.now()
+        )
+    _dispatch(job.pk)
+    return job.pk
+
+
+def schedule_pdf_prerender(kind, order_number):
+    """
+    Queue a document once the current transaction commits, so the worker
+    sees the finished order. No-op when PDF_PRERENDER_ENABLED is False.
+    """
+    if not getattr(settings, 'PDF_PRERENDER_ENABLED', True):
+        return
+    transaction.on_commit(lambda: enqueue_pdf_render(kind, order_number))
+
+
+def enqueue_pdf_renders(kind, order_numbers):
+    """Queue (or re-queue) many documents of one kind with a constant number of queries."""
+    from .models import PdfRenderJob
+
+    order_numbers = list(order_numbers)
+    if not order_numbers:
+        return []
+    jobs = PdfRenderJob.objects.filter(kind=kind, order_number__in=order_numbers)
+    jobs.update(
+        status='pending', attempts=0, last_error='',
+        next_attempt_at=timezone.now(), updated_at=timezone.now()
+    )
+    existing = set(jobs.values_list('order_number', flat=True))
+    PdfRenderJob.objects.bulk_create([
+        PdfRenderJob(kind=kind, order_number=order_number)
+        for order_number in order_numbers if order_number not in existing
+    ], ignore_conflicts=True)
+    job_ids = list(jobs.values_list('pk', flat=True))
+    for job_id in job_ids:
+        _dispatch(job_id)
+    return job_ids
+
+
+def schedule_pdf_prerenders(kind, order_numbers):
+    """schedule_pdf_prerender() for many orders of one kind (e.g. a whole checkout)."""
+    if not getattr(settings, 'PDF_PRERENDER_ENABLED', True):
+        return
+    order_numbers = list(order_numbers)
+    if order_numbers:
+        transaction.on_commit(lambda: enqueue_pdf_renders(kind, order_numbers))
+
+
+def _dispatch(job_id, delay=0):
+    if delay:
+        timer = threading.Timer(delay, _dispatch, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+        return
+    _get_dispatch_pool().submit(_run_pdf_job, job_id)
+
+
+def _run_pdf_job(job_id):
+    close_old_connections()
+    try:
+        run_pdf_job(job_id)
+    except Exception:
+        logger.exception("PDF render job %s crashed", job_id)
+    finally:
+        close_old_connections()
+
+
+# ===========================
+# Execution
+# ===========================
+
+def _claim(job_id):
+    """Atomically move a due job to 'running'; False if another worker has it."""
+    from .models import PdfRenderJob
+
+    return PdfRenderJob.objects.filter(
+        pk=job_id, status='pending', next_attempt_at__lte=timezone.now()
+    ).update(status='running', updated_at=timezone.now()) == 1
+
+
+def run_pdf_job(job_id, in_process=False):
+    """
+    Render one queued document into the PDF cache.
+
+    Returns the job's final status. With in_process=True the render runs in
+    the calling process instead of the process pool (management command).
+    """
+    from .models import PdfRenderJob
+
+    if not _claim(job_id):
+        return None
+    job = PdfRenderJob.objects.get(pk=job_id)
+
+    try:
+        order = invoices.document_queryset(job.kind).filter(order_number=job.order_number).first()
+        if order is None:
+            raise LookupError(f"Order {job.order_number} not found")
+        fields = invoices.DOCUMENTS[job.kind][0](order)
+        fingerprint = invoices.pdf_fingerprint(job.kind, fields)
+
+        if not invoices.has_cached_pdf(fingerprint):
+            if in_process:
+                data = invoices.render_pdf(job.kind, fields)
+            else:
+                try:
+                    future = _get_render_pool().submit(invoices.render_pdf, job.kind, fields)
+                    data = future.result(timeout=getattr(settings, 'PDF_RENDER_TIMEOUT', 120))
+                except BrokenProcessPool:
+                    _reset_render_pool()
+                    raise
+            invoices.write_cached_pdf(fingerprint, data)
+    except Exception as e:
+        return _record_failure(job, e, retry=not isinstance(e, LookupError), redispatch=not in_process)
+
+    PdfRenderJob.objects.filter(pk=job.pk).update(
+        status='done', attempts=job.attempts + 1, fingerprint=fingerprint,
+        last_error='', updated_at=timezone.now()
+    )
+    return 'done'
+
+
+def _record_failure(job, error, retry=True, redispatch=True):
+    from .models import PdfRenderJob
+
+    attempts = job.attempts + 1
+    max_attempts = getattr(settings, 'PDF_RENDER_MAX_ATTEMPTS', 3)
+    delay = getattr(settings, 'PDF_RENDER_RETRY_DELAY', 30) * (2 ** (attempts - 1))
+    will_retry = retry and attempts < max_attempts
+
+    PdfRenderJob.objects.filter(pk=job.pk).update(
+        status='pending' if will_retry else 'failed',
+        attempts=attempts,
+        last_error=f"{type(error).__name__}: {error}",
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        updated_at=timezone.now()
+    )
+    if will_retry:
+        logger.warning("PDF render %s %s failed (attempt %s), retrying in %ss: %s",
+                       job.kind, job.order_number, attempts, delay, error)
+        if redispatch:
+            _dispatch(job.pk, delay=delay)
+        return 'pending'
+    logger.error("PDF render %s %s failed permanently: %s", job.kind, job.order_number, error)
+    return 'failed'
+
+
+def process_pending_pdf_jobs(limit=None, in_process=False):
+    """
+    Run every due job (pending past its retry time, or 'running' rows left
+    behind by a worker that died). Returns {status: count}.
+    """
+    from .models import PdfRenderJob
+
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'PDF_RENDER_TIMEOUT', 120) * 2)
+    PdfRenderJob.objects.filter(status='running', updated_at__lt=stale_before).update(status='pending')
+
+    job_ids = PdfRenderJob.objects.filter(
+        status='pending', next_attempt_at__lte=timezone.now()
+    ).order_by('next_attempt_at').values_list('pk', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+
+    results = {}
+    for job_id in list(job_ids):
+        status = run_pdf_job(job_id, in_process=in_process)
+        if status:
+            results[status] = results.get(status, 0) + 1
+    return results
+
+
+# ===========================
+# Status
+# ===========================
+
+def get_pdf_job_status(kind, order_number):
+    """
+    Status of a document's pre-render job, or None if it was never queued.
+
+    `ready` is True when the cached PDF matches the order as it is now, so a
+    job that finished before the order was edited reports ready=False.
+    """
+    from .models import PdfRenderJob
+
+    job = PdfRenderJob.objects.filter(kind=kind, order_number=order_number).first()
+    if job is None:
+        return None
+
+    ready = False
+    if job.status == 'done' and job.fingerprint:
+        order = invoices.document_queryset(kind).filter(order_number=order_number).first()
+        if order is not None:
+            fields = invoices.DOCUMENTS[kind][0](order)
+            ready = (
+                invoices.pdf_fingerprint(kind, fields) == job.fingerprint
+                and invoices.has_cached_pdf(job.fingerprint)
+            )
+
+    return {
+        'kind': job.kind,
+        'order_number': job.order_number,
+        'status': job.status,
+        'attempts': job.attempts,
+        'last_error': job.last_error,
+        'ready': ready,
+        'updated_at': job.updated_at.isoformat(),
+    }
@@ -0,0 +1,202 @@
+"""
+Incremental daily sales rollups
+
+Every regular, custom cake and gift box order counts towards exactly one
+DailySalesRollup row: (local order date, order type, status). When an order
+is saved the signals in signals.py move it from its old row to its new one
+with atomic F() updates. Bulk `queryset.update()` calls bypass signals, so
+callers change orders in bulk with update_orders(), which rebuilds the days
+involved, and
+rebuild_daily_rollups() (the rebuild_sales_rollups command) repairs any
+drift from the orders themselves.
+"""
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncDate
+from django.utils import timezone
+
+# Statuses counted as sales on the dashboard and sales report
+SALES_STATUSES = ('confirmed', 'completed')
+
+
+def _order_types():
+    from .models import Order, CustomCakeOrder, GiftBoxOrder
+
+    return {
+        'regular': Order,
+        'custom': CustomCakeOrder,
+        'gift_box': GiftBoxOrder,
+    }
+
+
+def order_type_for(model):
+    for order_type, order_model in _order_types().items():
+        if issubclass(model, order_model):
+            return order_type
+    return None
+
+
+def order_amount(order):
+    """Value an order contributes to the rollup (custom cakes: final price, else estimate)."""
+    if order_type_for(type(order)) == 'custom':
+        return order.display_price or Decimal('0.00')
+    return order.total_price or Decimal('0.00')
+
+
+def _amount_expression(order_type):
+    output = DecimalField(max_digits=14, decimal_places=2)
+    if order_type == 'custom':
+        return Coalesce(NullIf('final_price', Value(0)), 'estimated_price', Value(0), output_field=output)
+    return Coalesce('total_price', Value(0), output_field=output)
+
+
+def rollup_state(order):
+    """(order_type, date, status, amount) bucket an order currently belongs to."""
+    if order.created_at is None:
+        return None
+    return (
+        order_type_for(type(order)),
+        timezone.localdate(order.created_at),
+        order.status,
+        Decimal(order_amount(order)),
+    )
+
+
+def stored_rollup_state(model, pk):
+    """Bucket of the saved copy of an order (before it is overwritten)."""
+    order = model.objects.filter(pk=pk).first()
+    return rollup_state(order) if order is not None else None
+
+
+# ===========================
+# Incremental updates
+# ===========================
+
+def apply_rollup_delta(order_type, day, status, count, amount):
+    """Add `count` orders worth `amount` to one rollup row, creating it if needed."""
+    from .models import DailySalesRollup
+
+    rows = DailySalesRollup.objects.filter(date=day, order_type=order_type, status=status)
+    with transaction.atomic():
+        updated = rows.update(
+            order_count=F('order_count') + count,
+            total_amount=F('total_amount') + amount,
+            updated_at=timezone.now()
+        )
+        if updated:
+            if count < 0:
+                # Drop buckets that no longer hold any orders
+                rows.filter(order_count__lte=0).delete()
+            return
+        try:
+            with transaction.atomic():
+                DailySalesRollup.objects.create(
+                    date=day, order_type=order_type, status=status,
+                    order_count=count, total_amount=amount
+                )
+        except IntegrityError:
+            # Another worker created the row first; take the update path
+            rows.update(
+                order_count=F('order_count') + count,
+                total_amount=F('total_amount') + amount,
+                updated_at=timezone.now()
+            )
+
+
+def move_order(old_state, new_state):
+    """Move an order between rollup buckets (either side may be None)."""
+    if old_state == new_state:
+        return
+    if old_state is not None:
+        order_type, day, status, amount = old_state
+        apply_rollup_delta(order_type, day, status, -1, -amount)
+    if new_state is not None:
+        order_type, day, status, amount = new_state
+        apply_rollup_delta(order_type, day, status, 1, amount)
+
+
+def add_created_orders(orders):
+    """Count orders inserted with bulk_create (which skips the signals), one update per bucket."""
+    buckets = {}
+    for order in orders:
+        state = rollup_state(order)
+        if state is None:
+            continue
+        order_type, day, status, amount = state
+        count, total = buckets.get((order_type, day, status), (0, Decimal('0.00')))
+        buckets[(order_type, day, status)] = (count + 1, total + amount)
+    for (order_type, day, status), (count, amount) in buckets.items():
+        apply_rollup_delta(order_type, day, status, count, amount)
+
+
+# ===========================
+# Rebuilding
+# ===========================
+
+def rebuild_daily_rollups(order_types=None, date_from=None, date_to=None, dates=None):
+    """
+    Recompute rollup rows from the order tables, replacing what is stored.
+
+    Limit the work with a date window (date_from/date_to, inclusive) or an
+    explicit collection of dates. Returns the number of rows written.
+    """
+    from .models import DailySalesRollup
+
+    models_by_type = _order_types()
+    order_types = order_types or list(models_by_type)
+
+    written = 0
+    with transaction.atomic():
+        for order_type in order_types:
+            model = models_by_type[order_type]
+            orders = model.objects.annotate(day=TruncDate('created_at'))
+            rollups = DailySalesRollup.objects.filter(order_type=order_type)
+            if date_from:
+                orders = orders.filter(day__gte=date_from)
+                rollups = rollups.filter(date__gte=date_from)
+            if date_to:
+                orders = orders.filter(day__lte=date_to)
+                rollups = rollups.filter(date__lte=date_to)
+            if dates is not None:
+                orders = orders.filter(day__in=list(dates))
+                rollups = rollups.filter(date__in=list(dates))
+
+            totals = orders.values('day', 'status').annotate(
+                order_count=Count('id'),
+                total_amount=Sum(_amount_expression(order_type))
+            ).order_by()
+
+            rollups.delete()
+            new_rows = [
+                DailySalesRollup(
+                    date=row['day'], order_type=order_type, status=row['status'],
+                    order_count=row['order_count'], total_amount=row['total_amount'] or 0
+                )
+                for row in totals
+            ]
+            DailySalesRollup.objects.bulk_create(new_rows, batch_size=500)
+            written += len(new_rows)
+    return written
+
+
+def update_orders(queryset, **fields):
+    """
+    queryset.update(**fields) for orders, rebuilding the rollup days of the
+    updated orders. Returns the number of orders updated.
+
+    The days are read before the update: a queryset filtered on a field
+    being changed (an admin changelist filtered by status) matches none of
+    its orders afterwards.
+    """
+    order_type = order_type_for(queryset.model)
+    with transaction.atomic():
+        days = set(
+            queryset.annotate(day=TruncDate('created_at'))
+            .values_list('day', flat=True).order_by()
+        )
+        updated = queryset.update(**fields)
+        if order_type and days:
+            rebuild_daily_rollups(order_types=[order_type], dates=days)
+    return updated
@@ -0,0 +1,229 @@
+"""
+Full-text product search
+
+Products are indexed in a side table keyed by product id:
+- SQLite: an FTS5 virtual table (name, description, category, subcategory),
+  ranked with bm25() weighted towards the name.
+- PostgreSQL: a weighted tsvector column with a GIN index, ranked with
+  ts_rank().
+Other backends (or SQLite builds without FTS5) fall back to the old
+icontains filter.
+
+Every search term is matched as a prefix ("choc" finds "chocolate"), so the
+same query works for as-you-type lookups. The index only holds active
+products and is kept in sync by the signals in signals.py; bulk
+queryset.update() calls bypass them, so run the rebuild_search_index
+command after those.
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+SEARCH_TABLE = 'admin_app_productsearch'
+
+# Column weights: name, description, category, subcategory
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+
+SearchPage = namedtuple('SearchPage', [
+    'products',     # Product instances for this page, best match first
+    'total',        # matching products over all pages
+    'page',
+    'num_pages',
+    'per_page',
+])
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_sqlite_index_ready = False
+
+
+def search_backend():
+    """'sqlite', 'postgresql' or None (no full-text support: icontains fallback)."""
+    global _sqlite_index_ready
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        # The migration skips the FTS5 table when SQLite was built without it
+        if not _sqlite_index_ready:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+                _sqlite_index_ready = cursor.fetchone() is not None
+        return 'sqlite' if _sqlite_index_ready else None
+    return None
+
+
+def search_terms(query):
+    """Lower-cased word terms of a search string (punctuation and FTS syntax dropped)."""
+    return [term.lower() for term in _TERM_RE.findall(query or '')][:10]
+
+
+def _sqlite_match(terms):
+    # Quoted so words like AND/NEAR are plain terms; * makes each a prefix
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _postgres_tsquery(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+# ===========================
+# Indexing
+# ===========================
+
+def _documents(product_ids=None):
+    """(id, name, description, category, subcategory) of the active products to index."""
+    from .models import Product
+
+    products = Product.objects.filter(is_active=True)
+    if product_ids is not None:
+        products = products.filter(id__in=list(product_ids))
+    return [
+        (product_id, name, description or '', category or '', subcategory or '')
+        for product_id, name, description, category, subcategory in products.values_list(
+            'id', 'name', 'description', 'category__name', 'subcategory__name'
+        ).order_by()
+    ]
+
+
+def index_products(product_ids=None):
+    """
+    (Re)index the given products, or every product when product_ids is None.
+    Inactive and deleted products are removed from the index.
+    """
+    backend = search_backend()
+    if backend is None:
+        return 0
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+
+    documents = _documents(product_ids)
+    with connection.cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        else:
+            remove_from_index(product_ids, cursor=cursor)
+        if not documents:
+            return 0
+        if backend == 'sqlite':
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category, subcategory) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                documents
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || "
+                f"setweight(to_tsvector('simple', %s), 'C') || "
+                f"setweight(to_tsvector('simple', %s), 'B') || "
+                f"setweight(to_tsvector('simple', %s), 'B'))",
+                documents
+            )
+    return len(documents)
+
+
+def remove_from_index(product_ids, cursor=None):
+    """Drop products from the index."""
+    backend = search_backend()
+    product_ids = [int(product_id) for product_id in product_ids]
+    if backend is None or not product_ids:
+        return
+    column = 'rowid' if backend == 'sqlite' else 'product_id'
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    sql = f'DELETE FROM {SEARCH_TABLE} WHERE {column} IN ({placeholders})'
+    if cursor is not None:
+        cursor.execute(sql, product_ids)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(sql, product_ids)
+
+
+def rebuild_search_index():
+    """Rebuild the whole index from the product table. Returns the number of products indexed."""
+    return index_products(None)
+
+
+# ===========================
+# Searching
+# ===========================
+
+def ranked_product_ids(query, limit=None):
+    """
+    Ids of the indexed products matching every term (as prefixes), best
+    match first. None when full-text search is not available.
+    """
+    backend = search_backend()
+    if backend is None:
+        return None
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if backend == 'sqlite':
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        sql = (
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid DESC'
+        )
+        params = [_sqlite_match(terms)]
+    else:
+        sql = (
+            f"SELECT product_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+            f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC, product_id DESC"
+        )
+        params = [_postgres_tsquery(terms)]
+    if limit:
+        sql += ' LIMIT %s'
+        params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_products(query, queryset=None, page=1, per_page=None):
+    """
+    One page of products matching `query`, ranked by relevance.
+
+    `queryset` narrows the results (e.g. a category filter) and supplies
+    select_related/annotations for the listing; it defaults to the active
+    products. Without full-text support the old name/description icontains
+    filter is used, newest first.
+    """
+    from .models import Product
+
+    if queryset is None:
+        queryset = Product.objects.filter(is_active=True)
+    per_page = per_page or getattr(settings, 'SEARCH_RESULTS_PER_PAGE', 12)
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+
+    ranked_ids = ranked_product_ids(query)
+    if ranked_ids is None:
+        matches = queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).order_by('-created_at')
+        total = matches.count()
+        num_pages = max(1, -(-total // per_page))
+        page = min(page, num_pages)
+        products = list(matches[(page - 1) * per_page:page * per_page])
+        return SearchPage(products, total, page, num_pages, per_page)
+
+    # Keep the ranking, but only for products the queryset allows
+    allowed = set(queryset.filter(id__in=ranked_ids).values_list('id', flat=True).order_by())
+    ranked_ids = [product_id for product_id in ranked_ids if product_id in allowed]
+
+    total = len(ranked_ids)
+    num_pages = max(1, -(-total // per_page))
+    page = min(page, num_pages)
+    page_ids = ranked_ids[(page - 1) * per_page:page * per_page]
+    products_by_id = {product.id: product for product in queryset.filter(id__in=page_ids)}
+    products = [products_by_id[product_id] for product_id in page_ids if product_id in products_by_id]
+    return SearchPage(products, total, page, num_pages, per_page)
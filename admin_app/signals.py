@@ -1,7 +1,8 @@
 """
 Signals for automatic loyalty rewards management
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
@@ -9,8 +10,10 @@ from decimal import Decimal
 
 from .models import (
     Order, GiftBoxOrder, Customer, LoyaltyCard, LoyaltyReward,
-    CustomerAchievement, Achievement
+    CustomerAchievement, Achievement, CustomCakeOrder, PointsTransaction,
+    GiftBox, GiftBoxItem, ProductPrice, Product, Category, Subcategory
 )
+from . import rollups, search
 
 
 @receiver(post_save, sender=Customer)
@@ -94,45 +97,64 @@ def process_gift_box_order_loyalty(sender, instance, created, **kwargs):
         check_achievements(loyalty_card)
 
 
+def achievement_met(loyalty_card, achievement):
+    """Whether the card's current stats satisfy an achievement's criteria"""
+    if achievement.criteria_type == 'orders':
+        return loyalty_card.total_orders >= achievement.criteria_value
+    elif achievement.criteria_type == 'spent':
+        return loyalty_card.total_spent >= Decimal(achievement.criteria_value)
+    elif achievement.criteria_type == 'referrals':
+        return loyalty_card.referrals_made >= achievement.criteria_value
+    elif achievement.criteria_type == 'stamps':
+        return loyalty_card.total_stamps >= achievement.criteria_value
+    return False
+
+
 def check_achievements(loyalty_card):
-    """Check and unlock achievements for the customer"""
-    achievements = Achievement.objects.filter(is_active=True)
+    """
+    Check and unlock achievements for the customer.
+
+    Already unlocked achievements are loaded in one query and the criteria
+    are evaluated in memory; new unlocks and their points transactions are
+    written with bulk_create and the card is saved once.
+    Returns the newly unlocked achievements.
+    """
+    unlocked_ids = set(
+        CustomerAchievement.objects.filter(loyalty_card=loyalty_card)
+        .values_list('achievement_id', flat=True)
+    )
+    new_achievements = [
+        achievement for achievement in Achievement.objects.filter(is_active=True)
+        if achievement.id not in unlocked_ids and achievement_met(loyalty_card, achievement)
+    ]
+    if not new_achievements:
+        return []
     
-    for achievement in achievements:
-        # Check if already unlocked
-        if CustomerAchievement.objects.filter(
-            loyalty_card=loyalty_card, 
-            achievement=achievement
-        ).exists():
-            continue
-        
-        # Check criteria
-        unlocked = False
-        if achievement.criteria_type == 'orders':
-            if loyalty_card.total_orders >= achievement.criteria_value:
-                unlocked = True
-        elif achievement.criteria_type == 'spent':
-            if loyalty_card.total_spent >= Decimal(achievement.criteria_value):
-                unlocked = True
-        elif achievement.criteria_type == 'referrals':
-            if loyalty_card.referrals_made >= achievement.criteria_value:
-                unlocked = True
-        elif achievement.criteria_type == 'stamps':
-            if loyalty_card.total_stamps >= achievement.criteria_value:
-                unlocked = True
-        
-        # Unlock achievement
-        if unlocked:
-            CustomerAchievement.objects.create(
+    # Award points (same tier multiplier as LoyaltyCard.add_points)
+    multiplier = loyalty_card.tier_benefits['points_multiplier']
+    transactions = []
+    for achievement in new_achievements:
+        if achievement.points_reward > 0:
+            bonus_points = int(achievement.points_reward * multiplier)
+            loyalty_card.points_balance += bonus_points
+            loyalty_card.lifetime_points += bonus_points
+            transactions.append(PointsTransaction(
                 loyalty_card=loyalty_card,
-                achievement=achievement
-            )
-            # Award points
-            if achievement.points_reward > 0:
-                loyalty_card.add_points(
-                    achievement.points_reward,
-                    f'Achievement unlocked: {achievement.name}'
-                )
+                points=bonus_points,
+                transaction_type='earned',
+                reason=f'Achievement unlocked: {achievement.name}'
+            ))
+    
+    with transaction.atomic():
+        CustomerAchievement.objects.bulk_create([
+            CustomerAchievement(loyalty_card=loyalty_card, achievement=achievement)
+            for achievement in new_achievements
+        ])
+        if transactions:
+            loyalty_card.save()
+            PointsTransaction.objects.bulk_create(transactions)
+    
+    return new_achievements
 
 
 def check_birthday_rewards():
@@ -177,3 +199,89 @@ def check_birthday_rewards():
                 # Add birthday bonus points
                 loyalty_card.add_points(birthday_bonus, '🎂 Birthday bonus!')
 
+
+# ===========================
+# Daily sales rollups
+# ===========================
+
+ROLLUP_MODELS = (Order, CustomCakeOrder, GiftBoxOrder)
+
+
+def capture_rollup_state(sender, instance, **kwargs):
+    """Remember which rollup bucket the stored copy of the order is in"""
+    instance._rollup_state = (
+        rollups.stored_rollup_state(sender, instance.pk) if instance.pk else None
+    )
+
+
+def update_rollup(sender, instance, **kwargs):
+    """Move the order from its old rollup bucket to its new one"""
+    old_state = getattr(instance, '_rollup_state', None)
+    new_state = rollups.rollup_state(instance)
+    rollups.move_order(old_state, new_state)
+    instance._rollup_state = new_state
+
+
+def remove_from_rollup(sender, instance, **kwargs):
+    """Take a deleted order out of its rollup bucket"""
+    rollups.move_order(getattr(instance, '_rollup_state', None), None)
+
+
+for _model in ROLLUP_MODELS:
+    pre_save.connect(capture_rollup_state, sender=_model, dispatch_uid=f'rollup_capture_{_model.__name__}')
+    post_save.connect(update_rollup, sender=_model, dispatch_uid=f'rollup_update_{_model.__name__}')
+    pre_delete.connect(capture_rollup_state, sender=_model, dispatch_uid=f'rollup_capture_delete_{_model.__name__}')
+    post_delete.connect(remove_from_rollup, sender=_model, dispatch_uid=f'rollup_remove_{_model.__name__}')
+
+
+# ===========================
+# Gift box pricing
+# ===========================
+
+@receiver(post_save, sender=GiftBoxItem, dispatch_uid='gift_box_item_saved')
+@receiver(post_delete, sender=GiftBoxItem, dispatch_uid='gift_box_item_deleted')
+def refresh_gift_box_for_item(sender, instance, **kwargs):
+    """Recalculate the stored price of the gift box an item belongs to"""
+    gift_box = GiftBox.objects.filter(pk=instance.gift_box_id).first()
+    if gift_box is not None:
+        gift_box.refresh_pricing()
+
+
+@receiver(post_save, sender=ProductPrice, dispatch_uid='gift_box_product_price_saved')
+@receiver(post_delete, sender=ProductPrice, dispatch_uid='gift_box_product_price_deleted')
+def refresh_gift_boxes_for_price(sender, instance, **kwargs):
+    """Recalculate the stored price of every gift box containing this product size"""
+    gift_boxes = GiftBox.objects.filter(
+        items__product_id=instance.product_id,
+        items__size_id=instance.size_id
+    ).distinct()
+    for gift_box in gift_boxes:
+        gift_box.refresh_pricing()
+
+
+# ===========================
+# Product search index
+# ===========================
+
+@receiver(post_save, sender=Product, dispatch_uid='search_product_saved')
+def index_product(sender, instance, **kwargs):
+    """Re-index a product (inactive products are dropped from the index)"""
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='search_product_deleted')
+def unindex_product(sender, instance, **kwargs):
+    search.remove_from_index([instance.pk])
+
+
+@receiver(post_save, sender=Category, dispatch_uid='search_category_saved')
+def reindex_category_products(sender, instance, created, **kwargs):
+    """Category names are indexed with their products"""
+    if not created:
+        search.index_products(instance.products.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Subcategory, dispatch_uid='search_subcategory_saved')
+def reindex_subcategory_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.products.values_list('id', flat=True))
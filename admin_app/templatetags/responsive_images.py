@@ -0,0 +1,60 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from admin_app.utils import get_variants_manifest
+
+register = template.Library()
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def _srcset(entries):
+    return ', '.join(f"{default_storage.url(name)} {width}w" for width, name in entries)
+
+
+@register.filter
+def srcset(image, fmt='jpeg'):
+    """srcset string for an image field in the given format ('' if no variants)"""
+    if not image:
+        return ''
+    variants = get_variants_manifest().get(image.name)
+    if not variants:
+        return ''
+    return _srcset(variants['sources'].get(fmt, []))
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', **attrs):
+    """
+    Render a <picture> with WebP/AVIF sources and a JPEG srcset fallback.
+
+    Usage: {% responsive_image product.main_image sizes="(max-width: 576px) 100vw, 33vw" alt=product.name %}
+    Images without generated variants fall back to a plain <img>.
+    """
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    variants = get_variants_manifest().get(image.name)
+
+    img_attrs = dict(attrs)
+    img_attrs['src'] = image.url
+    sources = mark_safe('')
+    if variants:
+        img_attrs['srcset'] = _srcset(variants['sources'].get('jpeg', []))
+        img_attrs['sizes'] = sizes
+        sources = format_html_join(
+            '', '<source type="{}" srcset="{}" sizes="{}">',
+            ((MIME_TYPES[fmt], _srcset(entries), sizes)
+             for fmt, entries in variants['sources'].items() if fmt != 'jpeg')
+        )
+
+    img = format_html(
+        '<img {}>',
+        format_html_join(' ', '{}="{}"', ((key.replace('_', '-'), value) for key, value in img_attrs.items()))
+    )
+    if not variants:
+        return img
+    return format_html('<picture>{}{}</picture>', sources, img)
@@ -1,3 +1,285 @@
-from django.test import TestCase
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from multiprocessing import get_context
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core import mail
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import mail_outbox
+
+WORKERS = 4
+# Seconds to wait for the workers; one that fails to start hangs the pool instead of raising
+TASK_TIMEOUT = 120
+
+# Tests get their own cache, not the shared file cache of the running site.
+# Classes using it also switch off the background session purge, whose
+# thread could outlive the test database and open the real one.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _setup_worker():
+    """Pool initializer: a fresh Django process, like a separate server worker."""
+    sys.path.insert(0, str(settings.BASE_DIR))
+    import django
+    django.setup()
+
+
+def _migrate():
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def _wait_until(start_at):
+    # Workers start up at different speeds; begin allocating together
+    time.sleep(max(0.0, start_at - time.time()))
+
+
+def _allocate_one_by_one(prefix_kind, count, start_at):
+    from .models import CustomCakeOrder, Order, generate_sequence_number
+    model = Order if prefix_kind == 'order' else CustomCakeOrder
+    prefix = model.order_number_prefix()
+    _wait_until(start_at)
+    return [generate_sequence_number(model, 'order_number', prefix, 4) for _ in range(count)]
+
+
+def _allocate_batches(prefix_kind, sizes, start_at):
+    from .models import CustomCakeOrder, Order, generate_sequence_numbers
+    model = Order if prefix_kind == 'order' else CustomCakeOrder
+    prefix = model.order_number_prefix()
+    _wait_until(start_at)
+    numbers = []
+    for size in sizes:
+        numbers += generate_sequence_numbers(model, 'order_number', prefix, 4, size)
+    return numbers
+
+
+class SequenceNumberConcurrencyTests(SimpleTestCase):
+    """
+    Order numbers allocated by several processes at once against one SQLite
+    file: no number is handed out twice and none is skipped.
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='sequence-test-')
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.env = {
+            'SQLITE_PATH': os.path.join(self.workdir, 'db.sqlite3'),
+            'CACHE_FILE': os.path.join(self.workdir, 'cache.sqlite3'),
+        }
+        with self.pool(1) as pool:
+            pool.apply_async(_migrate).get(TASK_TIMEOUT)
+
+    def pool(self, processes, **env):
+        # Spawned workers read their settings from the environment at start-up
+        saved = {name: os.environ.get(name) for name in {**self.env, **env}}
+        os.environ.update({**self.env, **env})
+        try:
+            return get_context('spawn').Pool(processes, initializer=_setup_worker)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def start_at(self):
+        return time.time() + 3
+
+    def assertContiguous(self, numbers, count):
+        self.assertEqual(len(numbers), count)
+        self.assertEqual(len(set(numbers)), count, 'a number was handed out twice')
+        values = sorted(int(number[-4:]) for number in numbers)
+        self.assertEqual(values, list(range(1, count + 1)))
+
+    def test_single_numbers(self):
+        per_worker = 50
+        for block_size in (1, 5):
+            with self.subTest(block_size=block_size):
+                kind = 'order' if block_size == 1 else 'custom'
+                with self.pool(WORKERS, ORDER_NUMBER_BLOCK_SIZE=str(block_size)) as pool:
+                    results = pool.starmap_async(
+                        _allocate_one_by_one, [(kind, per_worker, self.start_at())] * WORKERS
+                    ).get(TASK_TIMEOUT)
+                # Every worker uses up its blocks (50 = 10 blocks of 5), so no gaps either way
+                self.assertContiguous([n for numbers in results for n in numbers], per_worker * WORKERS)
+
+    def test_batches(self):
+        sizes = [1, 3, 7, 2, 5]
+        with self.pool(WORKERS) as pool:
+            results = pool.starmap_async(
+                _allocate_batches, [('order', sizes, self.start_at())] * WORKERS
+            ).get(TASK_TIMEOUT)
+        numbers = [n for worker_numbers in results for n in worker_numbers]
+        self.assertContiguous(numbers, sum(sizes) * WORKERS)
+        # Each batch is one consecutive run
+        for worker_numbers in results:
+            start = 0
+            for size in sizes:
+                batch = [int(n[-4:]) for n in worker_numbers[start:start + size]]
+                self.assertEqual(batch, list(range(batch[0], batch[0] + size)))
+                start += size
+
+
+@override_settings(MAIL_OUTBOX_RETRY_DELAY=30, MAIL_OUTBOX_MAX_ATTEMPTS=5)
+class MailOutboxExpiryTests(TestCase):
+    """Queued OTPs are never delivered after they expire, and given-up rows don't keep their body."""
+
+    def queue(self, expires_in=300):
+        return mail_outbox.enqueue_email('customer@example.com', 'Your OTP', 'Your OTP is 424242', expires_in=expires_in)
+
+    def refresh(self, message):
+        message.refresh_from_db()
+        return message
+
+    def fail_sends(self):
+        return mock.patch.object(mail_outbox.EmailMessage, 'send', side_effect=SMTPException('unavailable'))
+
+    def test_expired_message_is_failed_without_sending(self):
+        message = self.queue()
+        type(message).objects.filter(pk=message.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(mail_outbox.process_outbox(), {})
+        message = self.refresh(message)
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(message.body, '')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_no_retry_scheduled_past_the_expiry(self):
+        message = self.queue(expires_in=100)
+        # Retries come 30, 60, 120s after each failure: the third would be past the expiry
+        for attempt in range(1, 5):
+            type(message).objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+            with self.fail_sends():
+                mail_outbox.process_outbox()
+            message = self.refresh(message)
+            self.assertEqual(message.attempts, attempt)
+            if message.status == 'failed':
+                break
+            self.assertLess(message.next_attempt_at, message.expires_at)
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(message.attempts, 3)
+        self.assertEqual(message.body, '')
+
+    def test_last_attempt_clears_body(self):
+        message = self.queue(expires_in=None)
+        type(message).objects.filter(pk=message.pk).update(attempts=4)
+        with self.fail_sends():
+            self.assertEqual(mail_outbox.process_outbox(), {'failed': 1})
+        message = self.refresh(message)
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(message.body, '')
+
+    def test_sent_before_expiry(self):
+        message = self.queue()
+        self.assertEqual(mail_outbox.process_outbox(), {'sent': 1})
+        self.assertEqual(self.refresh(message).status, 'sent')
+        self.assertEqual(mail.outbox[0].body, 'Your OTP is 424242')
+
+
+@override_settings(PDF_PRERENDER_ENABLED=False)
+class AdminStatusActionRollupTests(TestCase):
+    """Bulk status actions keep the sales rollups right, also from a changelist filtered by status."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from .models import CakeShape, CakeTier, Customer, GiftBox
+
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.customer = Customer.objects.create(name='Asha', phone_number='9000000001')
+        self.shape = CakeShape.objects.create(name='Round', base_price_per_kg=500)
+        self.tier = CakeTier.objects.create(name='Single', tiers_count=1)
+        self.gift_box = GiftBox(name='Treats', description='Assorted', pricing_type='fixed', fixed_price=Decimal('900'))
+        self.gift_box.main_image.name = 'gift_boxes/treats.jpg'
+        self.gift_box.save()
+
+    def create_custom_order(self):
+        from .models import CustomCakeOrder
+        return CustomCakeOrder.objects.create(
+            customer=self.customer, shape=self.shape, tier=self.tier, total_weight=Decimal('1.5'),
+            delivery_date=date.today() + timedelta(days=3), estimated_price=Decimal('750'),
+        )
+
+    def create_gift_box_order(self):
+        from .models import GiftBoxOrder
+        return GiftBoxOrder.objects.create(
+            customer=self.customer, gift_box=self.gift_box, delivery_date=date.today() + timedelta(days=3),
+            unit_price=Decimal('900'), total_price=Decimal('900'),
+        )
+
+    def run_action(self, model, action, selected, **filters):
+        """Run an admin action the way the changelist does: on its (filtered) queryset, limited to the selection."""
+        # Imported here, like the models: spawned workers import this module before Django is set up
+        from django.contrib.admin.sites import site
+
+        model_admin = site._registry[model]
+        request = RequestFactory().post('/', filters)
+        request.GET = request.POST
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        queryset = model_admin.get_changelist_instance(request).get_queryset(request)
+        getattr(model_admin, action)(request, queryset.filter(pk__in=[order.pk for order in selected]))
+        return [str(message) for message in request._messages]
+
+    def rollup_statuses(self, order_type):
+        from .models import DailySalesRollup
+        return sorted(
+            DailySalesRollup.objects.filter(order_type=order_type).values_list('status', 'order_count')
+        )
+
+    def test_custom_order_action_from_status_filtered_changelist(self):
+        from .models import CustomCakeOrder
+
+        order = self.create_custom_order()
+        self.assertEqual(self.rollup_statuses('custom'), [('pending', 1)])
+
+        messages = self.run_action(CustomCakeOrder, 'mark_as_confirmed', [order], status__exact='pending')
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual(self.rollup_statuses('custom'), [('confirmed', 1)])
+        self.assertEqual(messages, ['1 orders marked as Confirmed'])
+
+    def test_gift_box_order_action_from_status_filtered_changelist(self):
+        from .models import GiftBoxOrder
+
+        orders = [self.create_gift_box_order(), self.create_gift_box_order()]
+        self.run_action(GiftBoxOrder, 'mark_as_preparing', orders[:1], status__exact='pending')
+
+        self.assertEqual(self.rollup_statuses('gift_box'), [('pending', 1), ('preparing', 1)])
+
+
+@override_settings(CACHES=TEST_CACHES, SESSION_PURGE_INTERVAL=0, ALLOWED_HOSTS=['testserver'])
+class PurchaseBillTotalTests(TestCase):
+    """The expenses total on the bill list is current after each change, even though the row count is cached."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def save_bill(self, url, amount):
+        response = self.client.post(url, {
+            'supplier_name': 'Flour Mill', 'date': date.today().isoformat(), 'total_amount': amount,
+        }, follow=True)
+        return response.context['total_amount']
+
+    def test_total_follows_add_edit_and_delete(self):
+        from .models import PurchaseBill
+
+        self.assertEqual(self.save_bill(reverse('admin_purchase_bill_add'), '100.00'), Decimal('100.00'))
+        self.assertEqual(self.save_bill(reverse('admin_purchase_bill_add'), '250.00'), Decimal('350.00'))
+        bill = PurchaseBill.objects.earliest('id')
+        self.assertEqual(self.save_bill(reverse('admin_purchase_bill_edit', args=[bill.id]), '50.00'), Decimal('300.00'))
+        response = self.client.get(reverse('admin_purchase_bill_delete', args=[bill.id]), follow=True)
+        self.assertEqual(response.context['total_amount'], Decimal('250.00'))
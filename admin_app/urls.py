@@ -17,6 +17,8 @@ urlpatterns = [
     path('orders/confirmed/', views.admin_orders_confirmed, name='admin_orders_confirmed'),
     path('orders/<int:order_id>/', views.admin_order_detail, name='admin_order_detail'),
     path('orders/<int:order_id>/pdf/', views.admin_order_generate_pdf, name='admin_order_generate_pdf'),
+    path('pdf-jobs/<str:kind>/<str:order_number>/', views.admin_pdf_job_status, name='admin_pdf_job_status'),
+    path('mail-outbox/', views.admin_mail_outbox_status, name='admin_mail_outbox_status'),
     
     # Customers
     path('customers/', views.admin_customers, name='admin_customers'),
@@ -3,8 +3,60 @@ Utility functions for image processing and optimization
 """
 from PIL import Image
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+import hashlib
+import logging
+import os
 import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Sent with (sender=model class, instance_pk, field_name) once a derivative
+# has been written and the model row points at it.
+image_processed = Signal()
+
+
+def fit_image(img, target_width, target_height):
+    """
+    Convert a PIL image to RGB, centre-crop it to the target aspect ratio
+    and resize it to the target dimensions
+    """
+    # Convert RGBA to RGB if necessary (for PNG with transparency)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Create a white background
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # Calculate aspect ratios
+    original_ratio = img.width / img.height
+    target_ratio = target_width / target_height
+    
+    # Smart crop to maintain aspect ratio
+    if original_ratio > target_ratio:
+        # Image is wider than target - crop width
+        new_width = int(img.height * target_ratio)
+        left = (img.width - new_width) // 2
+        img = img.crop((left, 0, left + new_width, img.height))
+    elif original_ratio < target_ratio:
+        # Image is taller than target - crop height
+        new_height = int(img.width / target_ratio)
+        top = (img.height - new_height) // 2
+        img = img.crop((0, top, img.width, top + new_height))
+    
+    # Resize to target dimensions
+    return img.resize((target_width, target_height), Image.LANCZOS)
 
 
 def resize_and_optimize_image(image_field, target_width, target_height, quality=85):
@@ -24,38 +76,7 @@ def resize_and_optimize_image(image_field, target_width, target_height, quality=
         return None
     
     try:
-        # Open the image
-        img = Image.open(image_field)
-        
-        # Convert RGBA to RGB if necessary (for PNG with transparency)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Create a white background
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Calculate aspect ratios
-        original_ratio = img.width / img.height
-        target_ratio = target_width / target_height
-        
-        # Smart crop to maintain aspect ratio
-        if original_ratio > target_ratio:
-            # Image is wider than target - crop width
-            new_width = int(img.height * target_ratio)
-            left = (img.width - new_width) // 2
-            img = img.crop((left, 0, left + new_width, img.height))
-        elif original_ratio < target_ratio:
-            # Image is taller than target - crop height
-            new_height = int(img.width / target_ratio)
-            top = (img.height - new_height) // 2
-            img = img.crop((0, top, img.width, top + new_height))
-        
-        # Resize to target dimensions
-        img = img.resize((target_width, target_height), Image.LANCZOS)
+        img = fit_image(Image.open(image_field), target_width, target_height)
         
         # Save to BytesIO
         output = BytesIO()
@@ -92,7 +113,287 @@ def get_image_dimensions_for_model(model_name, field_name):
         'Gallery': {'image': (800, 800)},  # Square aspect ratio for gallery
         'CarouselSlide': {'image': (1920, 1080)},
         'OfferBanner': {'image': (800, 400)},
+        'PageTitleBanner': {'image': (1600, 400)},
+        'GiftBox': {'main_image': (800, 800)},  # Same display as products
+        'CakeShape': {'image': (400, 400)},
+        'CakeTier': {'image': (400, 400)},
+        'Decoration': {'image': (300, 300)},
+        'CustomCakeOrder': {'reference_image': (1200, 1200)},
     }
     
     return dimensions.get(model_name, {}).get(field_name, (800, 600))
 
+
+# ===========================
+# Background derivative pipeline
+# ===========================
+
+PendingImage = namedtuple('PendingImage', ['field_name', 'width', 'height', 'quality', 'source_hash'])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                thread_name_prefix='image-derivatives'
+            )
+        return _executor
+
+
+def hash_file(file_obj):
+    """SHA-256 of a file's content, leaving the file positioned at the start"""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(64 * 1024), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def prepare_image_upload(instance, field_name, width, height, quality=85, update_fields=None):
+    """
+    Decide whether an image field needs a new derivative before the model is saved.
+
+    Returns None when nothing has to be done: the field is empty, was not
+    changed (already stored file) or is excluded by update_fields. When the
+    uploaded content matches an image we already processed at the same size,
+    the field is pointed at the existing derivative and None is returned too.
+    Otherwise returns a PendingImage to pass to schedule_image_processing()
+    after the model has been saved.
+    """
+    if update_fields is not None and field_name not in update_fields:
+        return None
+    field_file = getattr(instance, field_name)
+    if not field_file or getattr(field_file, '_committed', True):
+        # No image, or the stored image was left untouched
+        return None
+
+    from .models import ImageDerivative
+
+    try:
+        source_hash = hash_file(field_file.file)
+    except Exception as e:
+        logger.warning("Could not hash uploaded image %s: %s", field_file.name, e)
+        return PendingImage(field_name, width, height, quality, '')
+
+    existing = ImageDerivative.objects.filter(
+        source_hash=source_hash, width=width, height=height, quality=quality
+    ).first()
+    if existing and field_file.storage.exists(existing.output):
+        # Same picture uploaded again: reuse the stored derivative
+        setattr(instance, field_name, existing.output)
+        return None
+
+    return PendingImage(field_name, width, height, quality, source_hash)
+
+
+def schedule_image_processing(instance, pending):
+    """
+    Hand a saved model's image to the background worker pool once the
+    current transaction commits. Set IMAGE_PROCESSING_ASYNC = False to
+    process inline (management commands, debugging).
+    """
+    if pending is None:
+        return
+    model = type(instance)
+    pk = instance.pk
+
+    def submit():
+        if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+            _get_executor().submit(_run_image_job, model, pk, pending)
+        else:
+            process_image_derivative(model, pk, pending)
+
+    transaction.on_commit(submit)
+
+
+def _run_image_job(model, pk, pending):
+    close_old_connections()
+    try:
+        process_image_derivative(model, pk, pending)
+    except Exception:
+        logger.exception("Image processing failed for %s #%s", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def process_image_derivative(model, pk, pending):
+    """
+    Resize the stored original of `model(pk).<field>` to the target size,
+    store it as an optimized JPEG and point the row at the result.
+    """
+    from .models import ImageDerivative
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    field_file = getattr(instance, pending.field_name)
+    if not field_file:
+        return
+    storage = field_file.storage
+    source_name = field_file.name
+
+    with storage.open(source_name, 'rb') as source:
+        img = fit_image(Image.open(source), pending.width, pending.height)
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=pending.quality, optimize=True)
+
+    # Store the result before touching the original (a JPEG upload gets a
+    # free name next to it), and only delete the original once the row points
+    # at the result: a failed save or a killed worker leaves the row valid
+    output_name = storage.save(f"{os.path.splitext(source_name)[0]}.jpg", ContentFile(output.getvalue()))
+
+    try:
+        # update() rather than save() so the model's save() doesn't run again
+        updated = model.objects.filter(pk=pk, **{pending.field_name: source_name}).update(
+            **{pending.field_name: output_name}
+        )
+    except Exception:
+        storage.delete(output_name)
+        raise
+    if storage.exists(source_name):
+        storage.delete(source_name)
+    if not updated:
+        # The image was replaced while we were working; drop our result
+        storage.delete(output_name)
+        return
+
+    variants = generate_image_variants(storage, output_name, img, pending.quality)
+    if pending.source_hash:
+        ImageDerivative.objects.update_or_create(
+            source_hash=pending.source_hash,
+            width=pending.width,
+            height=pending.height,
+            quality=pending.quality,
+            defaults={'output': output_name, 'variants': variants}
+        )
+        bump_variants_version()
+    image_processed.send(sender=model, instance_pk=pk, field_name=pending.field_name)
+
+
+# ===========================
+# Responsive variants (srcset)
+# ===========================
+
+VARIANTS_VERSION_KEY = 'image_variants_version'
+
+_variants_manifest = None
+_variants_lock = threading.Lock()
+
+
+def get_variant_formats():
+    """Modern formats to generate, limited to what this Pillow build can encode"""
+    from PIL import features
+    formats = []
+    for fmt in getattr(settings, 'RESPONSIVE_IMAGE_FORMATS', ('webp',)):
+        if features.check(fmt):
+            formats.append(fmt)
+    return formats
+
+
+def generate_image_variants(storage, output_name, img, quality=85):
+    """
+    Write width variants of a processed image next to it and return the manifest.
+
+    Widths come from RESPONSIVE_IMAGE_WIDTHS (only those smaller than the
+    image itself); the full-size image is always the largest entry. Each
+    width is written as JPEG (fallback) plus every format from
+    get_variant_formats(), named `<name>-<width>w.<ext>`.
+
+    Returns:
+        dict: {'width': w, 'height': h, 'sources': {'jpeg': [[w, name], ...], 'webp': [...]}}
+    """
+    base = os.path.splitext(output_name)[0]
+    widths = sorted(w for w in getattr(settings, 'RESPONSIVE_IMAGE_WIDTHS', ()) if w < img.width)
+    widths.append(img.width)
+
+    save_options = {
+        'jpeg': {'format': 'JPEG', 'quality': quality, 'optimize': True, 'progressive': True},
+        'webp': {'format': 'WEBP', 'quality': quality - 5, 'method': 6},
+        'avif': {'format': 'AVIF', 'quality': quality - 25},
+    }
+    sources = {fmt: [] for fmt in ['jpeg'] + get_variant_formats()}
+
+    for width in widths:
+        if width == img.width:
+            resized = img
+        else:
+            resized = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        for fmt in sources:
+            if fmt == 'jpeg' and width == img.width:
+                # The processed image itself is the full-size JPEG
+                sources[fmt].append([width, output_name])
+                continue
+            buffer = BytesIO()
+            resized.save(buffer, **save_options[fmt])
+            name = f"{base}-{width}w.{fmt if fmt != 'jpeg' else 'jpg'}"
+            if storage.exists(name):
+                storage.delete(name)
+            sources[fmt].append([width, storage.save(name, ContentFile(buffer.getvalue()))])
+
+    return {'width': img.width, 'height': img.height, 'sources': sources}
+
+
+def ensure_image_variants(field_file, quality=85, force=False):
+    """
+    Generate variants for an already processed, stored image (e.g. images
+    uploaded before variants existed). Returns True if variants were written.
+    """
+    from .models import ImageDerivative
+
+    if not field_file:
+        return False
+    if not force and field_file.name in get_variants_manifest():
+        return False
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as source:
+        source_hash = hash_file(source)
+        img = Image.open(source)
+        img = fit_image(img, img.width, img.height)
+    variants = generate_image_variants(storage, field_file.name, img, quality)
+    ImageDerivative.objects.update_or_create(
+        source_hash=source_hash,
+        width=img.width,
+        height=img.height,
+        quality=quality,
+        defaults={'output': field_file.name, 'variants': variants}
+    )
+    bump_variants_version()
+    return True
+
+
+def bump_variants_version():
+    """Tell every worker to reload the variants manifest"""
+    from django.core.cache import cache
+    try:
+        cache.incr(VARIANTS_VERSION_KEY)
+    except ValueError:
+        cache.set(VARIANTS_VERSION_KEY, 2, timeout=None)
+
+
+def get_variants_manifest():
+    """
+    {stored image name: variants} for every processed image, kept in memory
+    and reloaded only when the shared version changes.
+    """
+    global _variants_manifest
+    from django.core.cache import cache
+    from .models import ImageDerivative
+
+    version = cache.get(VARIANTS_VERSION_KEY)
+    if version is None:
+        cache.add(VARIANTS_VERSION_KEY, 1, timeout=None)
+        version = cache.get(VARIANTS_VERSION_KEY, 1)
+    manifest = _variants_manifest
+    if manifest is not None and manifest[0] == version:
+        return manifest[1]
+    with _variants_lock:
+        if _variants_manifest is None or _variants_manifest[0] != version:
+            rows = ImageDerivative.objects.exclude(variants={}).values_list('output', 'variants')
+            _variants_manifest = (version, dict(rows))
+        return _variants_manifest[1]
@@ -2,18 +2,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.db.models import Sum, Count, Q, F
 from django.db.models.functions import TruncMonth, TruncDate
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
-import csv
-from io import BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from django.contrib.auth.decorators import login_required
 
 
@@ -24,9 +16,13 @@ from .models import (
     Enquiry, Gallery, Review, CarouselSlide, OfferBanner,
     CakeShape, CakeTier, Flavor, Decoration, CustomCakeOrder,
     CustomCakeOrderDecoration, CustomCakeReferenceImage,
-    GiftBox, GiftBoxItem, GiftBoxOrder
+    GiftBox, GiftBoxItem, GiftBoxOrder, DailySalesRollup
 )
 from .models import PageTitleBanner
+from .custom_pricing import quote_orders
+from .rollups import SALES_STATUSES
+from . import exports, invoices, keyset, mail_outbox, pdf_jobs
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.forms import ModelForm
 
@@ -105,21 +101,25 @@ def admin_dashboard(request):
     today = timezone.now().date()
     this_month_start = today.replace(day=1)
     
-    # Order statistics
-    total_orders = Order.objects.count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    confirmed_orders = Order.objects.filter(status='confirmed').count()
-    completed_orders = Order.objects.filter(status='completed').count()
+    # Order and sales statistics (regular orders, from the daily sales rollup)
+    regular_rollups = DailySalesRollup.objects.filter(order_type='regular')
+    status_totals = {
+        row['status']: row
+        for row in regular_rollups.values('status').annotate(
+            orders=Sum('order_count'), amount=Sum('total_amount')
+        ).order_by()
+    }
+    total_orders = sum(row['orders'] for row in status_totals.values())
+    pending_orders = status_totals.get('pending', {}).get('orders', 0)
+    confirmed_orders = status_totals.get('confirmed', {}).get('orders', 0)
+    completed_orders = status_totals.get('completed', {}).get('orders', 0)
     
-    # Sales statistics
-    total_sales = Order.objects.filter(
-        status__in=['confirmed', 'completed']
-    ).aggregate(total=Sum('total_price'))['total'] or 0
+    sales_rollups = regular_rollups.filter(status__in=SALES_STATUSES)
+    total_sales = sum(status_totals.get(status, {}).get('amount', 0) for status in SALES_STATUSES)
     
-    monthly_sales = Order.objects.filter(
-        status__in=['confirmed', 'completed'],
-        created_at__gte=this_month_start
-    ).aggregate(total=Sum('total_price'))['total'] or 0
+    monthly_sales = sales_rollups.filter(
+        date__gte=this_month_start
+    ).aggregate(total=Sum('total_amount'))['total'] or 0
     
     # Expense statistics
     total_expenses = PurchaseBill.objects.aggregate(total=Sum('total_amount'))['total'] or 0
@@ -151,11 +151,13 @@ def admin_dashboard(request):
     # Chart data - Last 7 days sales
     last_7_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
     daily_sales_data = []
+    sales_by_day = dict(
+        sales_rollups.filter(date__gte=last_7_days[0], date__lte=today)
+        .values('date').annotate(total=Sum('total_amount'))
+        .values_list('date', 'total').order_by()
+    )
     for day in last_7_days:
-        day_sales = Order.objects.filter(
-            status__in=['confirmed', 'completed'],
-            created_at__date=day
-        ).aggregate(total=Sum('total_price'))['total'] or 0
+        day_sales = sales_by_day.get(day) or 0
         daily_sales_data.append({
             'date': day.strftime('%d %b'),
             'amount': float(day_sales)
@@ -189,6 +191,44 @@ def index(request):
     return redirect('admin_dashboard')
 
 
+# ===========================
+# LIST PAGINATION
+# ===========================
+
+LIST_ORDERING = ('-created_at', '-id')
+
+
+def _list_page(request, queryset, ordering=LIST_ORDERING):
+    """
+    One keyset page of an admin list: (rows, pager). The pager carries the
+    cached row count (an estimate) and newer/older links that keep the
+    current filters.
+    """
+    page = keyset.paginate(
+        queryset, ordering,
+        cursor=request.GET.get('cursor'),
+        before=request.GET.get('before'),
+        per_page=settings.ADMIN_LIST_PER_PAGE
+    )
+    totals = keyset.cached_totals(queryset)
+
+    def link(param, cursor):
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        params.pop('before', None)
+        params[param] = cursor
+        return f'?{params.urlencode()}'
+
+    pager = {
+        'count': totals['count'],
+        'shown': len(page.items),
+        'newer_url': link('before', page.prev_cursor) if page.has_previous else None,
+        'older_url': link('cursor', page.next_cursor) if page.has_next else None,
+        'first_url': link('cursor', '') if page.has_previous else None,
+    }
+    return page.items, pager
+
+
 # ===========================
 # ORDERS MANAGEMENT
 # ===========================
@@ -212,10 +252,11 @@ def admin_orders(request):
             Q(customer__phone_number__icontains=search)
         )
     
-    orders = orders.order_by('-created_at')
+    orders, pager = _list_page(request, orders)
     
     context = {
         'orders': orders,
+        'pager': pager,
         'status_filter': status_filter,
         'search': search,
     }
@@ -225,16 +266,16 @@ def admin_orders(request):
 @login_required(login_url='admin_login')
 def admin_orders_pending(request):
     """Pending orders only"""
-    orders = Order.objects.filter(status='pending').select_related('customer', 'product').order_by('-created_at')
-    context = {'orders': orders, 'page_title': 'Pending Orders'}
+    orders, pager = _list_page(request, Order.objects.filter(status='pending').select_related('customer', 'product', 'size'))
+    context = {'orders': orders, 'pager': pager, 'page_title': 'Pending Orders'}
     return render(request, 'admin/orders/order_list.html', context)
 
 
 @login_required(login_url='admin_login')
 def admin_orders_confirmed(request):
     """Confirmed orders only"""
-    orders = Order.objects.filter(status='confirmed').select_related('customer', 'product').order_by('-created_at')
-    context = {'orders': orders, 'page_title': 'Confirmed Orders'}
+    orders, pager = _list_page(request, Order.objects.filter(status='confirmed').select_related('customer', 'product', 'size'))
+    context = {'orders': orders, 'pager': pager, 'page_title': 'Confirmed Orders'}
     return render(request, 'admin/orders/order_list.html', context)
 
 
@@ -258,94 +299,26 @@ def admin_order_detail(request, order_id):
 @login_required(login_url='admin_login')
 def admin_order_generate_pdf(request, order_id):
     """Generate estimate PDF for an order"""
-    order = get_object_or_404(Order, id=order_id)
-    
-    # Create PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#FF1493'),
-        spaceAfter=30,
-        alignment=TA_CENTER
+    order = get_object_or_404(invoices.document_queryset(invoices.ORDER_ESTIMATE), id=order_id)
+    return invoices.pdf_response(
+        request, invoices.ORDER_ESTIMATE, order,
+        f'estimate_{order.order_number}.pdf', disposition='attachment'
     )
-    elements.append(Paragraph("🎂 Cakes by Desti", title_style))
-    elements.append(Paragraph("ORDER ESTIMATE", styles['Heading2']))
-    elements.append(Spacer(1, 20))
-    
-    # Order details
-    order_data = [
-        ['Order Number:', order.order_number],
-        ['Customer Name:', order.customer.name],
-        ['Phone:', order.customer.phone_number],
-        ['Order Date:', order.created_at.strftime('%d %b %Y')],
-        ['Delivery Date:', order.delivery_date.strftime('%d %b %Y')],
-        ['Status:', order.get_status_display()],
-    ]
-    
-    order_table = Table(order_data, colWidths=[2*inch, 4*inch])
-    order_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-        ('FONT', (0, 0), (0, -1), 'Helvetica-Bold', 10),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(order_table)
-    elements.append(Spacer(1, 20))
-    
-    # Product details
-    product_data = [
-        ['Product', 'Size', 'Flavor', 'Qty', 'Price', 'Total'],
-        [
-            order.product.name,
-            order.size.name,
-            order.flavor.name if order.flavor else 'N/A',
-            str(order.quantity),
-            f'₹{order.unit_price}',
-            f'₹{order.total_price}'
-        ]
-    ]
-    
-    product_table = Table(product_data, colWidths=[2*inch, 1*inch, 1.5*inch, 0.5*inch, 1*inch, 1*inch])
-    product_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
-        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
-        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(product_table)
-    elements.append(Spacer(1, 20))
-    
-    # Special instructions
-    if order.custom_message or order.special_instructions:
-        elements.append(Paragraph("<b>Special Instructions:</b>", styles['Normal']))
-        if order.custom_message:
-            elements.append(Paragraph(f"Message on cake: {order.custom_message}", styles['Normal']))
-        if order.special_instructions:
-            elements.append(Paragraph(f"Notes: {order.special_instructions}", styles['Normal']))
-        elements.append(Spacer(1, 20))
-    
-    # Footer
-    elements.append(Spacer(1, 30))
-    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER)
-    elements.append(Paragraph("Thank you for your order! 🎉", footer_style))
-    elements.append(Paragraph("Contact: +91 XXXXXXXXXX | Email: info@cakesbydesti.com", footer_style))
-    
-    doc.build(elements)
-    
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="estimate_{order.order_number}.pdf"'
-    
-    return response
+
+
+@login_required(login_url='admin_login')
+def admin_mail_outbox_status(request):
+    """Outbound email queue depth and delivery latency (JSON)"""
+    return JsonResponse(mail_outbox.outbox_metrics())
+
+
+@login_required(login_url='admin_login')
+def admin_pdf_job_status(request, kind, order_number):
+    """Background pre-render status of an order's PDF (JSON)"""
+    status = pdf_jobs.get_pdf_job_status(kind, order_number)
+    if status is None:
+        return JsonResponse({'status': 'not_queued', 'kind': kind, 'order_number': order_number}, status=404)
+    return JsonResponse(status)
 
 
 # ===========================
@@ -356,9 +329,7 @@ def admin_order_generate_pdf(request, order_id):
 def admin_customers(request):
     """List all customers"""
     search = request.GET.get('search', '')
-    customers = Customer.objects.annotate(
-        total_orders=Count('orders')
-    ).all()
+    customers = Customer.objects.all()
     
     if search:
         customers = customers.filter(
@@ -367,10 +338,20 @@ def admin_customers(request):
             Q(email__icontains=search)
         )
     
-    customers = customers.order_by('-created_at')
+    customers, pager = _list_page(request, customers)
+    
+    # Order counts for this page only (uses the (customer, created_at) index)
+    order_counts = dict(
+        Order.objects.filter(customer__in=customers)
+        .values('customer').annotate(total=Count('id')).order_by()
+        .values_list('customer', 'total')
+    )
+    for customer in customers:
+        customer.total_orders = order_counts.get(customer.id, 0)
     
     context = {
         'customers': customers,
+        'pager': pager,
         'search': search,
     }
     return render(request, 'admin/customers/customer_list.html', context)
@@ -974,12 +955,14 @@ def admin_purchase_bills(request):
     if date_to:
         bills = bills.filter(date__lte=date_to)
     
-    bills = bills.order_by('-date')
-    
+    # Summed on every request, unlike the cached count: adding, editing or
+    # deleting a bill redirects back here and must show the new total
     total_amount = bills.aggregate(total=Sum('total_amount'))['total'] or 0
+    bills, pager = _list_page(request, bills, ('-date', '-id'))
     
     context = {
         'bills': bills,
+        'pager': pager,
         'search': search,
         'date_from': date_from,
         'date_to': date_to,
@@ -1553,38 +1536,29 @@ def admin_sales_report(request):
     
     orders = orders.order_by('-created_at')
     
-    # Calculate totals
-    total_orders = orders.count()
-    total_sales = orders.aggregate(total=Sum('total_price'))['total'] or 0
+    # Totals and monthly breakdown come from the daily sales rollup
+    rollups = DailySalesRollup.objects.filter(order_type='regular', status__in=SALES_STATUSES)
+    if date_from:
+        rollups = rollups.filter(date__gte=date_from)
+    if date_to:
+        rollups = rollups.filter(date__lte=date_to)
+    if status:
+        rollups = rollups.filter(status=status)
+    
+    totals = rollups.aggregate(orders=Sum('order_count'), sales=Sum('total_amount'))
+    total_orders = totals['orders'] or 0
+    total_sales = totals['sales'] or 0
     
-    # Export to CSV
+    # Export to CSV (streamed)
     if export_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Order Number', 'Date', 'Customer', 'Product', 'Size', 'Quantity', 'Amount', 'Status'])
-        
-        for order in orders:
-            writer.writerow([
-                order.order_number,
-                order.created_at.strftime('%Y-%m-%d'),
-                order.customer.name,
-                order.product.name,
-                order.size.name,
-                order.quantity,
-                order.total_price,
-                order.get_status_display()
-            ])
-        
-        return response
+        return exports.sales_export_response(request, date_from=date_from, date_to=date_to, status=status)
     
     # Monthly breakdown
-    monthly_data = orders.annotate(
-        month=TruncMonth('created_at')
+    monthly_data = rollups.annotate(
+        month=TruncMonth('date')
     ).values('month').annotate(
-        total_sales=Sum('total_price'),
-        order_count=Count('id')
+        total_sales=Sum('total_amount'),
+        order_count=Sum('order_count')
     ).order_by('month')
     
     context = {
@@ -1620,23 +1594,9 @@ def admin_expense_report(request):
     total_bills = bills.count()
     total_expenses = bills.aggregate(total=Sum('total_amount'))['total'] or 0
     
-    # Export to CSV
+    # Export to CSV (streamed)
     if export_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="expense_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Date', 'Supplier', 'Amount', 'Notes'])
-        
-        for bill in bills:
-            writer.writerow([
-                bill.date.strftime('%Y-%m-%d'),
-                bill.supplier_name,
-                bill.total_amount,
-                bill.notes
-            ])
-        
-        return response
+        return exports.expense_export_response(request, date_from=date_from, date_to=date_to)
     
     # Monthly breakdown
     monthly_data = bills.annotate(
@@ -1738,19 +1698,27 @@ def get_sizes_for_category(request):
 @login_required(login_url='admin_login')
 def admin_custom_orders(request):
     """List all custom cake orders"""
-    orders = CustomCakeOrder.objects.select_related('customer', 'shape', 'tier', 'flavor').order_by('-created_at')
+    orders, pager = _list_page(
+        request, CustomCakeOrder.objects.select_related('customer', 'shape', 'tier', 'flavor')
+    )
     
-    context = {'orders': orders}
+    context = {'orders': orders, 'pager': pager}
     return render(request, 'admin/custom_cakes/order_list.html', context)
 
 
 @login_required(login_url='admin_login')
 def admin_custom_order_detail(request, order_id):
     """View custom order details"""
-    order = get_object_or_404(CustomCakeOrder, id=order_id)
-    order_decorations = CustomCakeOrderDecoration.objects.filter(custom_order=order).select_related('decoration')
+    order = get_object_or_404(
+        CustomCakeOrder.objects.select_related('customer', 'shape', 'tier', 'flavor', 'product', 'size', 'event'),
+        id=order_id
+    )
     reference_images = CustomCakeReferenceImage.objects.filter(custom_order=order)
     
+    # Price breakdown and decorations from one pricing pass
+    quote_orders([order])
+    order_decorations = order.order_decorations.all()
+    
     context = {
         'order': order,
         'order_decorations': order_decorations,
@@ -2020,7 +1988,7 @@ def admin_decoration_delete(request, decoration_id):
 @login_required(login_url='admin_login')
 def admin_gift_boxes(request):
     """List all gift boxes"""
-    gift_boxes = GiftBox.objects.all().prefetch_related('items__product', 'items__size')
+    gift_boxes = GiftBox.objects.all()
     
     context = {
         'gift_boxes': gift_boxes
@@ -2090,7 +2058,7 @@ def admin_gift_box_edit(request, gift_box_id):
         'products': Product.objects.filter(is_active=True).select_related('category', 'subcategory'),
         'sizes': Size.objects.filter(is_active=True),
         'categories': Category.objects.filter(is_active=True),
-        'items': gift_box.items.all()
+        'items': GiftBoxItem.attach_unit_prices(gift_box.items.all().select_related('product', 'size'))
     }
     return render(request, 'admin/gift_box_form.html', context)
 
@@ -2161,8 +2129,11 @@ def admin_gift_box_orders(request):
     if status_filter:
         orders = orders.filter(status=status_filter)
     
+    orders, pager = _list_page(request, orders)
+    
     context = {
         'orders': orders,
+        'pager': pager,
         'status_filter': status_filter
     }
     return render(request, 'admin/gift_box_orders.html', context)
@@ -2175,7 +2146,7 @@ def admin_gift_box_order_detail(request, order_id):
     
     context = {
         'order': order,
-        'items': order.gift_box.items.all()
+        'items': GiftBoxItem.attach_unit_prices(order.gift_box.items.all().select_related('product', 'size'))
     }
     return render(request, 'admin/gift_box_order_detail.html', context)
 
@@ -1,6 +1,11 @@
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
 from django.shortcuts import redirect
 from django.urls import reverse
 
+from cakeshop.sessions import maybe_purge_expired
+from cakeshop_app.cart import Cart
+
 
 class AdminLoginRequiredMiddleware:
     """Require Django auth staff/superuser for all /admin/ routes served by admin_app.
@@ -30,3 +35,28 @@ class AdminLoginRequiredMiddleware:
         return response
 
 
+
+
+class CartMiddleware:
+    """Attach the visitor's cart as request.cart; it is written back only when changed."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = Cart(request)
+        response = self.get_response(request)
+        request.cart.save(response)
+        return response
+
+
+class CoalescingSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware for cakeshop.sessions: no Set-Cookie when the session
+    save was skipped (the browser's cookie already carries the expiry of the
+    last real write), and the periodic purge of expired sessions."""
+    def process_response(self, request, response):
+        response = super().process_response(request, response)
+        session = getattr(request, 'session', None)
+        if getattr(session, 'save_skipped', False):
+            response.cookies.pop(settings.SESSION_COOKIE_NAME, None)
+        maybe_purge_expired()
+        return response
@@ -0,0 +1,209 @@
+"""
+Database sessions with coalesced writes
+
+SESSION_SAVE_EVERY_REQUEST slides the session expiry on every request, which
+on the stock db backend means an UPDATE of django_session per page view (and
+on SQLite every one of those takes the database write lock). This engine
+keeps the sliding expiry but only writes when it has to:
+
+  - the payload changed (compared by hash, so a view that merely sets
+    session.modified or stores the same values again does not count), or
+  - the stored expiry is due for a refresh: less than
+    SESSION_REFRESH_THRESHOLD seconds of it are left.
+
+A skipped save leaves the stored row (and, see CoalescingSessionMiddleware,
+the browser cookie) with the expiry of the last real write, so a session
+now lives between SESSION_REFRESH_THRESHOLD and SESSION_COOKIE_AGE seconds
+after the last request instead of exactly SESSION_COOKIE_AGE.
+
+Expired rows are purged in bulk at most once per SESSION_PURGE_INTERVAL by
+one worker, in a background thread. Saved/performed writes and purged rows
+are counted in the shared cache; see session_stats() and
+`python manage.py session_stats`.
+
+Enable with SESSION_ENGINE = 'cakeshop.sessions'.
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STATS = ('writes_saved', 'writes', 'purged')
+# Local counts are added to the shared totals every this many events
+FLUSH_EVERY = 50
+# Expired rows deleted per statement, so the write lock is released often
+PURGE_BATCH = 1000
+
+_counts = dict.fromkeys(STATS, 0)
+_counts_lock = threading.Lock()
+_next_purge_check = 0.0
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _refresh_threshold():
+    return _setting('SESSION_REFRESH_THRESHOLD', settings.SESSION_COOKIE_AGE - 3600)
+
+
+# ===========================
+# Counters
+# ===========================
+
+def _stat_key(name):
+    return f'sessions:stats:{name}'
+
+
+def _count(name, amount=1):
+    with _counts_lock:
+        _counts[name] += amount
+        if sum(_counts.values()) < FLUSH_EVERY:
+            return
+        pending = dict(_counts)
+        _counts.update(dict.fromkeys(STATS, 0))
+    _flush(pending)
+
+
+def _flush(pending):
+    for name, amount in pending.items():
+        if not amount:
+            continue
+        key = _stat_key(name)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, timeout=None)
+
+
+def flush_stats():
+    """Add this process's unflushed counts to the shared totals."""
+    with _counts_lock:
+        pending = dict(_counts)
+        _counts.update(dict.fromkeys(STATS, 0))
+    _flush(pending)
+
+
+def session_stats():
+    """
+    {'writes_saved', 'writes', 'purged', 'saved_ratio'} summed over all
+    worker processes (each process reports in steps of FLUSH_EVERY events).
+    """
+    flush_stats()
+    stats = {name: cache.get(_stat_key(name)) or 0 for name in STATS}
+    attempts = stats['writes_saved'] + stats['writes']
+    stats['saved_ratio'] = round(stats['writes_saved'] / attempts, 3) if attempts else None
+    return stats
+
+
+def reset_stats():
+    with _counts_lock:
+        _counts.update(dict.fromkeys(STATS, 0))
+    cache.delete_many([_stat_key(name) for name in STATS])
+
+
+# ===========================
+# Session store
+# ===========================
+
+def _payload_hash(store, data):
+    return hashlib.sha1(store.serializer().dumps(data)).hexdigest()
+
+
+class SessionStore(DBSessionStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._loaded_hash = None
+        self._loaded_expiry = None
+        self.save_skipped = False
+
+    def load(self):
+        s = self._get_session_from_db()
+        if not s:
+            return {}
+        data = self.decode(s.session_data)
+        self._loaded_hash = _payload_hash(self, data)
+        self._loaded_expiry = s.expire_date
+        return data
+
+    def _needs_write(self, data):
+        if self._loaded_hash is None or _payload_hash(self, data) != self._loaded_hash:
+            return True
+        remaining = self._loaded_expiry - timezone.now()
+        # A custom expiry shorter than the refresh threshold is always refreshed
+        return remaining < timedelta(seconds=min(_refresh_threshold(), self.get_expiry_age()))
+
+    def save(self, must_create=False):
+        self.save_skipped = False
+        if self.session_key is None:
+            return self.create()
+        if not must_create:
+            data = self._get_session()
+            if not self._needs_write(data):
+                self.save_skipped = True
+                _count('writes_saved')
+                return
+        super().save(must_create=must_create)
+        self._loaded_hash = _payload_hash(self, self._get_session(no_load=True))
+        self._loaded_expiry = self.get_expiry_date()
+        _count('writes')
+
+    @classmethod
+    def clear_expired(cls):
+        """Delete expired sessions in batches. Returns the number deleted."""
+        model = cls.get_model_class()
+        deleted = 0
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=timezone.now())
+                .values_list('session_key', flat=True)[:PURGE_BATCH]
+            )
+            if not keys:
+                break
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
+        if deleted:
+            _count('purged', deleted)
+        return deleted
+
+
+# ===========================
+# Periodic purge
+# ===========================
+
+def maybe_purge_expired():
+    """
+    Start a background purge of expired sessions if none ran in the last
+    SESSION_PURGE_INTERVAL seconds on any worker. Cheap to call per request.
+    """
+    global _next_purge_check
+    interval = _setting('SESSION_PURGE_INTERVAL', 3600)
+    now = time.monotonic()
+    if not interval or now < _next_purge_check:
+        return
+    _next_purge_check = now + min(interval, 60)
+    # One worker per interval wins the slot
+    if not cache.add('sessions:purge_slot', 1, timeout=interval):
+        return
+    threading.Thread(target=_purge, name='session-purge', daemon=True).start()
+
+
+def _purge():
+    close_old_connections()
+    try:
+        deleted = SessionStore.clear_expired()
+        if deleted:
+            logger.info("Purged %s expired sessions", deleted)
+    except Exception:
+        logger.exception("Expired session purge failed")
+    finally:
+        close_old_connections()
@@ -56,11 +56,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'cakeshop.middleware.CoalescingSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'cakeshop.middleware.CartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'cakeshop.middleware.AdminLoginRequiredMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -95,10 +96,29 @@ WSGI_APPLICATION = 'cakeshop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite tuned for several server workers (cakeshop/sqlite_backend): WAL,
+# busy timeout, BEGIN IMMEDIATE transactions and persistent connections.
+# SQLITE_TUNING=False falls back to the stock backend with its defaults.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'True').lower() in ('true', '1', 'yes')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'cakeshop.sqlite_backend' if SQLITE_TUNING else 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Seconds a worker keeps its connection open (0: one per request)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')) if SQLITE_TUNING else 0,
+        'CONN_HEALTH_CHECKS': SQLITE_TUNING,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '10000')),  # ms
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -32000,  # KiB
+                'temp_store': 'MEMORY',
+            },
+        } if SQLITE_TUNING else {},
     }
 }
 
@@ -121,6 +141,25 @@ DATABASES = {
 SESSION_COOKIE_AGE = 86400  # 24 hours (1 day) in seconds
 SESSION_SAVE_EVERY_REQUEST = True  # Keeps extending timeout while actively browsing
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Allow return visits within the same day
+# Sliding expiry without a write per request (cakeshop/sessions.py): a session
+# is only saved when its data changed or less than SESSION_REFRESH_THRESHOLD
+# seconds of its expiry are left, and expired rows are purged in bulk every
+# SESSION_PURGE_INTERVAL seconds. `manage.py session_stats` shows writes saved.
+SESSION_ENGINE = 'cakeshop.sessions'
+SESSION_REFRESH_THRESHOLD = SESSION_COOKIE_AGE - 3600  # i.e. refresh at most hourly
+SESSION_PURGE_INTERVAL = 3600
+
+# Cart storage (cakeshop_app/cart.py). The cart is kept out of the session so
+# browsing never writes session rows: 'cookie' keeps the compact cart in a
+# signed cookie, 'cache' keeps it in the shared cache under a signed cart id.
+# It is only written when it changes and expires CART_MAX_AGE after that.
+CART_STORAGE = os.getenv('CART_STORAGE', 'cookie')
+CART_MAX_AGE = SESSION_COOKIE_AGE
+
+# Order/card number allocation
+# Numbers each worker reserves at once from the NumberSequence table. 1 keeps
+# numbers strictly sequential; larger blocks mean fewer counter writes.
+ORDER_NUMBER_BLOCK_SIZE = int(os.getenv('ORDER_NUMBER_BLOCK_SIZE', 1))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -170,6 +209,38 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Uploaded images are resized in a background thread pool after the model is
+# saved. Set IMAGE_PROCESSING_ASYNC=False to resize inline instead.
+IMAGE_PROCESSING_ASYNC = os.getenv('IMAGE_PROCESSING_ASYNC', 'True').lower() in ('true', '1', 'yes')
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+# Width variants (px) generated for srcset, and modern formats served
+# alongside the JPEG fallback ('avif' is used only if Pillow supports it).
+RESPONSIVE_IMAGE_WIDTHS = (320, 480, 640, 960, 1280)
+RESPONSIVE_IMAGE_FORMATS = ('webp',)
+
+# Rendered invoice/estimate PDFs are cached under MEDIA_ROOT/PDF_CACHE_DIR and
+# the least recently used files are removed past these limits.
+PDF_CACHE_DIR = 'pdf_cache'
+PDF_CACHE_MAX_FILES = int(os.getenv('PDF_CACHE_MAX_FILES', 2000))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# New orders get their PDF rendered in background worker processes right
+# after commit; failed renders are retried with exponential backoff.
+PDF_PRERENDER_ENABLED = os.getenv('PDF_PRERENDER_ENABLED', 'True').lower() in ('true', '1', 'yes')
+PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', 1))
+PDF_RENDER_MAX_ATTEMPTS = 3
+PDF_RENDER_RETRY_DELAY = 30  # seconds, doubled after each failed attempt
+PDF_RENDER_TIMEOUT = 120  # seconds
+
+# Product search results per page (full-text index: see admin_app/search.py)
+SEARCH_RESULTS_PER_PAGE = 12
+# Storefront listings load this many items per keyset page (infinite scroll)
+PRODUCTS_PER_PAGE = 12
+GALLERY_PER_PAGE = 24
+# Admin order/customer/bill lists: rows per keyset page, and how long (seconds)
+# their total counts are cached
+ADMIN_LIST_PER_PAGE = 50
+ADMIN_LIST_COUNT_TIMEOUT = 60
+
 # For better security in production
 SECURE_CONTENT_TYPE_NOSNIFF = True
 SECURE_BROWSER_XSS_FILTER = True
@@ -189,10 +260,47 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')  # set this in environment, do NOT commit to VCS
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True').lower() in ('true', '1', 'yes')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER or 'cakesbydesti@gmail.com'
-
-# Cache settings for OTP storage (using local memory cache for development)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Outgoing mail (OTPs) is queued in the OutboundEmail table and delivered by
+# a background sender in batches over one SMTP connection; failures are
+# retried with exponential backoff. Set MAIL_OUTBOX_ASYNC=False to send
+# right after the request's transaction commits instead.
+MAIL_OUTBOX_ASYNC = os.getenv('MAIL_OUTBOX_ASYNC', 'True').lower() in ('true', '1', 'yes')
+MAIL_OUTBOX_BATCH_SIZE = 20
+MAIL_OUTBOX_MAX_ATTEMPTS = 5
+MAIL_OUTBOX_RETRY_DELAY = 30  # seconds, doubled after each failed attempt
+EMAIL_TIMEOUT = 30  # seconds, so a hung SMTP server can't stall the sender
+
+# Shared cache for OTPs, rate limits and the catalog version. Every worker
+# process must see the same cache, so the default is a local SQLite file;
+# set REDIS_URL (and install the redis package) to use Redis instead.
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'cakeshop.sqlite_cache.SQLiteCache',
+            'LOCATION': os.getenv('CACHE_FILE', os.path.join(BASE_DIR, 'cache', 'cache.sqlite3')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Per-client request limits: {scope: (requests, window in seconds)}
+RATE_LIMITS = {
+    'otp_request': (5, 15 * 60),    # OTP emails per phone number / per IP
+    'otp_verify': (5, 5 * 60),      # wrong OTP guesses per phone number
 }
+
+# Number of reverse proxies in front of the app (e.g. 1 for nginx) whose
+# X-Forwarded-For entries are trusted for per-IP limits. 0: use REMOTE_ADDR.
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+
+# Order forms carry a one-time key; a resubmission within this many seconds
+# gets the original confirmation (later ones are caught by the key stored on
+# the order). See cakeshop_app/idempotency.py.
+IDEMPOTENCY_KEY_TTL = 15 * 60
@@ -0,0 +1,5 @@
+"""
+SQLite database backend tuned for several server workers
+
+Enable with ENGINE = 'cakeshop.sqlite_backend'; see base.py.
+"""
@@ -0,0 +1,185 @@
+"""
+Shared cache backend on a local SQLite file
+
+LocMemCache is private to each worker process, so anything one gunicorn
+worker caches (an OTP, a rate-limit counter, the catalog version) is
+invisible to the others. This backend keeps the cache in one SQLite file
+(WAL mode) that every worker on the host opens, with no extra service to
+run. add() and incr() run in an IMMEDIATE transaction, so they are atomic
+across processes (rate limits and the catalog version rely on that).
+
+Configure it with the file path as LOCATION:
+
+    CACHES = {'default': {
+        'BACKEND': 'cakeshop.sqlite_cache.SQLiteCache',
+        'LOCATION': '/path/to/cache.sqlite3',
+    }}
+
+For several hosts, point CACHES at Redis instead (Django's RedisCache; see
+settings.py); the rest of the code only uses the standard cache API.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Expired rows are swept (and the size limit enforced) every this many writes
+CULL_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    # ===========================
+    # Connection
+    # ===========================
+
+    def _connection(self):
+        """One connection per thread, reopened after a fork."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entry ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) WITHOUT ROWID'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_entry_expires ON cache_entry (expires)')
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _transaction(self):
+        """Write transaction that takes the lock up front (no upgrade deadlocks)."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    # ===========================
+    # Helpers
+    # ===========================
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _live_value(self, connection, key, now):
+        """(pickled value,) row of an unexpired entry, or None."""
+        return connection.execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, now)
+        ).fetchone()
+
+    def _write(self, connection, key, value, timeout):
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)',
+            (key, self._dumps(value), self.get_backend_timeout(timeout))
+        )
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            self._cull()
+
+    def _cull(self):
+        connection = self._transaction()
+        try:
+            connection.execute('DELETE FROM cache_entry WHERE expires <= ?', (time.time(),))
+            count = connection.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+            if count > self._max_entries:
+                # Drop the entries closest to expiry first
+                excess = count - self._max_entries + self._max_entries // self._cull_frequency
+                connection.execute(
+                    'DELETE FROM cache_entry WHERE key IN ('
+                    'SELECT key FROM cache_entry ORDER BY expires IS NULL, expires LIMIT ?)',
+                    (excess,)
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    # ===========================
+    # Cache API
+    # ===========================
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._live_value(self._connection(), key, time.time())
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(self._connection(), key, value, timeout)
+        self._after_write()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._transaction()
+        try:
+            if self._live_value(connection, key, time.time()) is not None:
+                connection.execute('COMMIT')
+                return False
+            self._write(connection, key, value, timeout)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._after_write()
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entry SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._live_value(self._connection(), key, time.time()) is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across processes: read and write happen under one write lock."""
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._transaction()
+        try:
+            row = self._live_value(connection, key, time.time())
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache_entry SET value = ? WHERE key = ?', (self._dumps(value), key)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entry')
+
+    def close(self, **kwargs):
+        # Connections stay open for the life of the thread; SQLite files need no teardown
+        pass
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cakeshop.settings')
 
 application = get_wsgi_application()
+
+# Build the search suggestion index before the first request needs it
+from cakeshop_app.suggestions import warm_suggestion_index  # noqa: E402
+
+warm_suggestion_index()
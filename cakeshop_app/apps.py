@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CakeshopAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cakeshop_app'
+
+    def ready(self):
+        """Import signals when app is ready"""
+        import cakeshop_app.signals
@@ -0,0 +1,406 @@
+"""
+Cart storage for cakeshop_app
+
+The cart used to live in the database session, so every page view by a
+shopper rewrote their django_session row. It now has its own store that
+keeps only a compact encoding of the cart: ids, quantities and what the
+customer typed (delivery date, message). Names and prices are resolved when
+the cart is read, so they are always current.
+
+Two backends, picked by settings.CART_STORAGE:
+  'cookie'  the encoded cart in a signed cookie (no server-side writes at all)
+  'cache'   the cart in the shared cache, keyed by a random id in a signed cookie
+
+CartMiddleware (cakeshop/middleware.py) attaches a Cart to each request as
+request.cart and writes it back only when it was changed.
+"""
+import logging
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PRODUCT = 'p'
+CUSTOM_CAKE = 'c'
+
+# Field order of the compact entries (after the type tag); trailing blanks are dropped
+PRODUCT_FIELDS = (
+    'product_id', 'size_id', 'quantity',
+    'delivery_date', 'delivery_time', 'custom_message', 'special_instructions',
+)
+CUSTOM_CAKE_FIELDS = (
+    'shape_id', 'tier_id', 'total_weight', 'flavor_option',
+    'product_id', 'size_id', 'flavor_id', 'flavor_description', 'decorations',
+)
+
+_SALT = 'cakeshop_app.cart'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _max_age():
+    return _setting('CART_MAX_AGE', settings.SESSION_COOKIE_AGE)
+
+
+def _cookie_name():
+    return _setting('CART_COOKIE_NAME', 'cart')
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ===========================
+# Compact encoding
+# ===========================
+
+def _pack(tag, fields, values):
+    entry = [tag] + [values.get(name) or None for name in fields]
+    while entry[-1] is None:
+        entry.pop()
+    return entry
+
+
+def _unpack(entry, fields):
+    values = dict(zip(fields, entry[1:]))
+    return {name: values.get(name) for name in fields}
+
+
+def _valid(entries):
+    return isinstance(entries, list) and all(
+        isinstance(entry, list) and entry and entry[0] in (PRODUCT, CUSTOM_CAKE)
+        for entry in entries
+    )
+
+
+def _from_legacy_line(line):
+    """Compact entry for a cart line stored in the session by older versions."""
+    if line.get('type') == 'custom_cake':
+        values = dict(line)
+        values['decorations'] = [
+            [_to_int(dec.get('id')), _to_int(dec.get('quantity')) or 1]
+            for dec in line.get('decorations') or []
+        ]
+        for name in ('shape_id', 'tier_id', 'product_id', 'size_id', 'flavor_id'):
+            values[name] = _to_int(values.get(name))
+        return _pack(CUSTOM_CAKE, CUSTOM_CAKE_FIELDS, values)
+    return _pack(PRODUCT, PRODUCT_FIELDS, line)
+
+
+# ===========================
+# Backends
+# ===========================
+
+class CookieCartStore:
+    """The whole (compact) cart in a signed, compressed cookie."""
+
+    def load(self, request):
+        value = request.COOKIES.get(_cookie_name())
+        if not value:
+            return None
+        try:
+            return signing.loads(value, salt=_SALT, max_age=_max_age())
+        except signing.BadSignature:
+            return None
+
+    def encode(self, entries):
+        return signing.dumps(entries, salt=_SALT, compress=True)
+
+    def fits(self, entries):
+        # Browsers drop cookies over ~4KB, which would silently empty the cart
+        return len(self.encode(entries)) <= _setting('CART_COOKIE_MAX_BYTES', 3800)
+
+    def save(self, request, response, entries):
+        if not entries:
+            response.delete_cookie(_cookie_name(), samesite=settings.SESSION_COOKIE_SAMESITE)
+            return
+        response.set_cookie(
+            _cookie_name(), self.encode(entries), max_age=_max_age(),
+            secure=settings.SESSION_COOKIE_SECURE, httponly=True,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+
+
+class CacheCartStore:
+    """The cart in the shared cache; the cookie only carries a signed cart id."""
+
+    def _cart_id(self, request):
+        return request.get_signed_cookie(_cookie_name(), default=None, salt=_SALT)
+
+    def _key(self, cart_id):
+        return f'cart:{cart_id}'
+
+    def load(self, request):
+        cart_id = self._cart_id(request)
+        return cache.get(self._key(cart_id)) if cart_id else None
+
+    def fits(self, entries):
+        return True
+
+    def save(self, request, response, entries):
+        cart_id = self._cart_id(request)
+        if not entries:
+            if cart_id:
+                cache.delete(self._key(cart_id))
+            response.delete_cookie(_cookie_name(), samesite=settings.SESSION_COOKIE_SAMESITE)
+            return
+        cart_id = cart_id or secrets.token_urlsafe(16)
+        cache.set(self._key(cart_id), entries, _max_age())
+        # Re-sent on every change so the cookie expires together with the cache entry
+        response.set_signed_cookie(
+            _cookie_name(), cart_id, salt=_SALT, max_age=_max_age(),
+            secure=settings.SESSION_COOKIE_SECURE, httponly=True,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+
+
+CART_STORES = {
+    'cookie': CookieCartStore,
+    'cache': CacheCartStore,
+}
+
+
+def get_cart_store():
+    return CART_STORES[_setting('CART_STORAGE', 'cookie')]()
+
+
+# ===========================
+# Cart
+# ===========================
+
+class Cart:
+    """
+    The current visitor's cart. Entries are loaded on first use; lines()
+    expands them into the dicts the views and templates use (with current
+    names and prices). Only changes mark the cart for saving.
+    """
+
+    def __init__(self, request, store=None):
+        self.request = request
+        self.store = store or get_cart_store()
+        self.modified = False
+        self._entries = None
+        self._lines = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            entries = self.store.load(self.request)
+            if entries is None:
+                entries = self._take_session_cart()
+            self._entries = entries if _valid(entries) else []
+        return self._entries
+
+    def _take_session_cart(self):
+        """Move a cart left in the session by older versions into this store (once)."""
+        if settings.SESSION_COOKIE_NAME not in self.request.COOKIES:
+            return []
+        legacy = self.request.session.pop('cart', None)
+        if not legacy:
+            return []
+        self.modified = True
+        return [_from_legacy_line(line) for line in legacy if isinstance(line, dict)]
+
+    def _changed(self):
+        self.modified = True
+        self._lines = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def item_count(self):
+        """Total quantity of regular product lines (the navbar badge)."""
+        return sum(entry[3] if len(entry) > 3 else 1 for entry in self.entries if entry[0] == PRODUCT)
+
+    # ---------------------------
+    # Changes
+    # ---------------------------
+
+    def _append(self, entry):
+        self.entries.append(entry)
+        if not self.store.fits(self.entries):
+            self.entries.pop()
+            return False
+        self._changed()
+        return True
+
+    def add_product(self, product_id, size_id, quantity=1, delivery_date=None, delivery_time='',
+                    custom_message='', special_instructions=''):
+        """
+        Add a product line, merging it with an identical one (same product,
+        size and delivery date). Returns False if the cart has no room left.
+        """
+        for entry in self.entries:
+            if entry[0] != PRODUCT:
+                continue
+            line = _unpack(entry, PRODUCT_FIELDS)
+            if (line['product_id'], line['size_id'], line['delivery_date']) == (product_id, size_id, delivery_date or None):
+                line['quantity'] = (line['quantity'] or 1) + quantity
+                entry[:] = _pack(PRODUCT, PRODUCT_FIELDS, line)
+                self._changed()
+                return True
+        return self._append(_pack(PRODUCT, PRODUCT_FIELDS, {
+            'product_id': product_id,
+            'size_id': size_id,
+            'quantity': quantity,
+            'delivery_date': delivery_date,
+            'delivery_time': delivery_time,
+            'custom_message': custom_message,
+            'special_instructions': special_instructions,
+        }))
+
+    def add_custom_cake(self, shape_id, tier_id, total_weight, flavor_option=None, product_id=None,
+                        size_id=None, flavor_id=None, flavor_description='', decorations=()):
+        """
+        Add a custom cake line; `decorations` is a list of (decoration_id, quantity).
+        Returns False if the cart has no room left.
+        """
+        return self._append(_pack(CUSTOM_CAKE, CUSTOM_CAKE_FIELDS, {
+            'shape_id': _to_int(shape_id),
+            'tier_id': _to_int(tier_id),
+            'total_weight': str(total_weight) if total_weight else None,
+            'flavor_option': flavor_option,
+            'product_id': _to_int(product_id),
+            'size_id': _to_int(size_id),
+            'flavor_id': _to_int(flavor_id),
+            'flavor_description': flavor_description,
+            'decorations': [[_to_int(dec_id), _to_int(qty) or 1] for dec_id, qty in decorations],
+        }))
+
+    def set_quantity(self, index, quantity):
+        if 0 <= index < len(self.entries) and self.entries[index][0] == PRODUCT:
+            line = _unpack(self.entries[index], PRODUCT_FIELDS)
+            quantity = max(1, quantity)
+            if line['quantity'] != quantity:
+                line['quantity'] = quantity
+                self.entries[index] = _pack(PRODUCT, PRODUCT_FIELDS, line)
+                self._changed()
+
+    def remove(self, index):
+        if 0 <= index < len(self.entries):
+            self.entries.pop(index)
+            self._changed()
+
+    def clear(self):
+        if self.entries:
+            self.entries.clear()
+            self._changed()
+
+    def save(self, response):
+        """Write the cart back to its store if it was changed during the request."""
+        if self.modified:
+            self.store.save(self.request, response, self.entries)
+            self.modified = False
+
+    # ---------------------------
+    # Reading
+    # ---------------------------
+
+    def lines(self):
+        """
+        The cart as a list of line dicts ('type' 'product' or 'custom_cake'),
+        in cart order, with names and current unit prices filled in. Lines whose
+        product or size no longer exists are kept (so indexes stay valid) but
+        marked 'available': False.
+        """
+        if self._lines is None:
+            self._lines = self._expand()
+        return self._lines
+
+    def _expand(self):
+        from .pricing import get_cart_pricing
+
+        products = [_unpack(entry, PRODUCT_FIELDS) for entry in self.entries if entry[0] == PRODUCT]
+        custom_cakes = [_unpack(entry, CUSTOM_CAKE_FIELDS) for entry in self.entries if entry[0] == CUSTOM_CAKE]
+        for line in products:
+            line['type'] = 'product'
+        pricing = get_cart_pricing(self.request, products)
+        names = _custom_cake_names(custom_cakes) if custom_cakes else None
+
+        lines = []
+        product_lines = iter(products)
+        custom_lines = iter(custom_cakes)
+        for entry in self.entries:
+            if entry[0] == PRODUCT:
+                line = next(product_lines)
+                line['quantity'] = line['quantity'] or 1
+                resolved = pricing.resolve(line)
+                if resolved:
+                    product, size, size_price = resolved
+                    line.update(product_name=product.name, size_name=size.name,
+                                unit_price=size_price.price, available=True)
+                else:
+                    line.update(product_name='No longer available', size_name='',
+                                unit_price=0, available=False)
+            else:
+                line = _expand_custom_cake(next(custom_lines), names)
+            lines.append(line)
+        return lines
+
+
+def _custom_cake_names(lines):
+    """Batched lookups for everything the custom cake lines refer to."""
+    from admin_app.models import CakeShape, CakeTier, Decoration, Flavor, Product, Size
+
+    def ids(name):
+        return {line[name] for line in lines if line[name]}
+
+    decoration_ids = {dec_id for line in lines for dec_id, _ in line['decorations'] or []}
+    return {
+        'shapes': CakeShape.objects.in_bulk(ids('shape_id')),
+        'tiers': CakeTier.objects.in_bulk(ids('tier_id')),
+        'flavors': Flavor.objects.in_bulk(ids('flavor_id')),
+        'products': Product.objects.in_bulk(ids('product_id')),
+        'sizes': Size.objects.in_bulk(ids('size_id')),
+        'decorations': Decoration.objects.in_bulk(decoration_ids),
+    }
+
+
+def _expand_custom_cake(line, names):
+    shape = names['shapes'].get(line['shape_id'])
+    tier = names['tiers'].get(line['tier_id'])
+    product = names['products'].get(line['product_id'])
+    size = names['sizes'].get(line['size_id'])
+    flavor = names['flavors'].get(line['flavor_id'])
+
+    flavor_display = 'Not specified'
+    if line['flavor_option'] == 'product' and product and size:
+        flavor_display = f"{product.name} - {size.name}"
+    elif flavor:
+        flavor_display = flavor.name
+    elif line['flavor_description']:
+        flavor_display = line['flavor_description']
+
+    decorations = []
+    for dec_id, qty in line['decorations'] or []:
+        decoration = names['decorations'].get(dec_id)
+        if decoration:
+            decorations.append({
+                'id': dec_id,
+                'name': decoration.name,
+                'quantity': qty,
+                'price': float(decoration.price),
+            })
+
+    line.update(
+        type='custom_cake',
+        shape_name=shape.name if shape else '',
+        tier_name=tier.name if tier else '',
+        flavor_display=flavor_display,
+        decorations=decorations,
+        unit_price=0,  # Custom cakes quoted later
+        quantity=1,
+        available=bool(shape and tier),
+    )
+    return line
@@ -0,0 +1,123 @@
+"""
+In-process catalog snapshot for cakeshop_app
+Holds the slow-changing catalog tables (categories, sizes, prices, events,
+flavors, shapes, tiers, decorations) in memory so storefront pages render
+them without touching the database.
+
+Every worker keeps its own snapshot tagged with a version number. The
+version lives in the shared cache and is bumped by signals (see signals.py)
+whenever an admin changes the catalog, so each worker rebuilds lazily on
+its next request after a change.
+"""
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from admin_app.models import (
+    Category, Size, ProductPrice, Product, Event, Flavor,
+    CakeShape, CakeTier, Decoration
+)
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+CatalogSnapshot = namedtuple('CatalogSnapshot', [
+    'version',
+    'categories',               # active categories (ordered by name) with product_count and subcategories prefetched
+    'sizes',                    # active sizes in display order
+    'prices',                   # {(product_id, size_id): Decimal}
+    'product_size_ids',         # {product_id: (size_id, ...)} from Product.sizes
+    'events',                   # active events ordered by name
+    'flavors',
+    'shapes',
+    'tiers',
+    'decorations',
+    'decorations_by_category',  # {category display name: (Decoration, ...)}
+])
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_catalog_version():
+    """Current catalog version from the shared cache (initialised to 1)."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every worker's snapshot by moving the shared version forward."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Key missing (cache cleared or first change): start a fresh version
+        # that can't collide with a snapshot built from the old value.
+        cache.set(CATALOG_VERSION_KEY, get_catalog_version() + 1, timeout=None)
+
+
+def _build_snapshot(version):
+    categories = tuple(
+        Category.objects.filter(is_active=True)
+        .annotate(product_count=Count('products'))
+        .prefetch_related('subcategories')
+        .order_by('name')
+    )
+    sizes = tuple(Size.objects.filter(is_active=True).order_by('display_order', 'weight_in_kg'))
+
+    prices = {
+        (product_id, size_id): price
+        for product_id, size_id, price in ProductPrice.objects.values_list('product_id', 'size_id', 'price')
+    }
+
+    product_size_ids = {}
+    for product_id, size_id in Product.sizes.through.objects.values_list('product_id', 'size_id'):
+        product_size_ids.setdefault(product_id, []).append(size_id)
+
+    decorations = tuple(
+        Decoration.objects.filter(is_active=True).order_by('category', 'display_order', 'name')
+    )
+    decorations_by_category = {}
+    for decoration in decorations:
+        decorations_by_category.setdefault(decoration.get_category_display(), []).append(decoration)
+
+    return CatalogSnapshot(
+        version=version,
+        categories=categories,
+        sizes=sizes,
+        prices=MappingProxyType(prices),
+        product_size_ids=MappingProxyType({k: tuple(v) for k, v in product_size_ids.items()}),
+        events=tuple(Event.objects.filter(is_active=True).order_by('event_name')),
+        flavors=tuple(Flavor.objects.filter(is_active=True).order_by('display_order', 'name')),
+        shapes=tuple(CakeShape.objects.filter(is_active=True).order_by('display_order', 'name')),
+        tiers=tuple(CakeTier.objects.filter(is_active=True).order_by('display_order', 'tiers_count')),
+        decorations=decorations,
+        decorations_by_category=MappingProxyType({k: tuple(v) for k, v in decorations_by_category.items()}),
+    )
+
+
+def get_catalog():
+    """
+    Return the current CatalogSnapshot, rebuilding it only when the shared
+    catalog version has moved since this worker last built it.
+    """
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _build_snapshot(version)
+        return _snapshot
+
+
+def sizes_for_product(product_id):
+    """Active sizes linked to a product, in display order."""
+    catalog = get_catalog()
+    size_ids = set(catalog.product_size_ids.get(product_id, ()))
+    return tuple(size for size in catalog.sizes if size.id in size_ids)
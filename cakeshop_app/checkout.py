@@ -0,0 +1,271 @@
+"""
+Checkout service for cakeshop_app
+
+Turns the expanded cart lines (see cart.py) into orders in one transaction:
+every line is validated and priced up front from one batched read, regular
+orders, custom cake orders and their decorations are inserted with
+bulk_create, custom cake estimates are priced together (custom_pricing.
+quote_orders) and the staged loyalty reward/points are applied once at the
+end. Either the whole cart becomes orders or nothing is written, and the
+number of queries does not grow with the size of the cart.
+
+bulk_create skips Model.save() and the post_save signals, so order numbers
+are allocated here as one block and the sales rollups are updated with
+rollups.add_created_orders(). The only other Order/CustomCakeOrder signal
+(loyalty on completion) doesn't apply to new, pending orders.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from admin_app import rollups
+from admin_app.custom_pricing import quote_orders
+from admin_app.models import (
+    CustomCakeOrder, CustomCakeOrderDecoration, Customer, LoyaltyCard, LoyaltyReward,
+    Order, PointsTransaction, generate_sequence_numbers,
+)
+
+from .pricing import CartPricing
+
+CheckoutResult = namedtuple('CheckoutResult', [
+    'orders',          # created Order rows, in cart order
+    'custom_orders',   # created CustomCakeOrder rows, in cart order
+    'skipped',         # number of cart lines left out (product/size/price gone)
+    'payable',         # amount due on the first order after loyalty, or None
+])
+
+
+class CheckoutError(Exception):
+    """The cart can't be turned into orders; the message is shown to the customer."""
+
+
+def _date(value, default):
+    if not value:
+        return default
+    parsed = value if hasattr(value, 'year') else parse_date(str(value))
+    if parsed is None:
+        raise CheckoutError('Please choose a valid delivery date.')
+    return parsed
+
+
+def _time(value):
+    if not value:
+        return None
+    try:
+        parsed = value if hasattr(value, 'hour') else parse_time(str(value))
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CheckoutError('Please choose a valid delivery time.')
+    return parsed
+
+
+def _calculate_max_points_redeemable(amount_after_voucher: Decimal, points_balance: int) -> int:
+    """Cap points to integer rupees available and points balance."""
+    if amount_after_voucher <= 0:
+        return 0
+    try:
+        remaining_rupees = int(Decimal(amount_after_voucher).quantize(Decimal('1'), rounding='ROUND_FLOOR'))
+    except Exception:
+        remaining_rupees = 0
+    return max(0, min(points_balance, remaining_rupees))
+
+
+# ===========================
+# Building orders
+# ===========================
+
+def _build_orders(customer, lines, details, pricing):
+    """Unsaved Order / CustomCakeOrder instances for the cart, plus the skipped line count."""
+    today = timezone.localdate()
+    delivery_date = details.get('delivery_date')
+    delivery_time = details.get('delivery_time')
+    custom_message = details.get('custom_message') or ''
+    special_instructions = details.get('special_instructions') or ''
+
+    orders, custom_orders = [], []
+    skipped = 0
+    for line in lines:
+        if line.get('type') == 'custom_cake':
+            try:
+                total_weight = Decimal(str(line.get('total_weight')))
+            except (InvalidOperation, ValueError):
+                total_weight = None
+            if not line.get('available') or not total_weight or total_weight <= 0:
+                skipped += 1
+                continue
+            custom_order = CustomCakeOrder(
+                customer=customer,
+                shape_id=line['shape_id'],
+                tier_id=line['tier_id'],
+                total_weight=total_weight,
+                delivery_date=_date(delivery_date, today + timedelta(days=2)),
+                delivery_time=_time(delivery_time),
+                delivery_address=details.get('delivery_address') or '',
+                custom_message=custom_message,
+                special_instructions=special_instructions,
+                estimated_price=Decimal('0.00'),
+            )
+            # Set flavor based on option
+            if line.get('flavor_option') == 'product' and line.get('product_id') and line.get('size_id'):
+                custom_order.product_id = line['product_id']
+                custom_order.size_id = line['size_id']
+            elif line.get('flavor_id'):
+                custom_order.flavor_id = line['flavor_id']
+            elif line.get('flavor_description'):
+                custom_order.flavor_description = line['flavor_description']
+            custom_order._cart_decorations = line.get('decorations') or []
+            custom_orders.append(custom_order)
+        else:
+            resolved = pricing.resolve(line)
+            if not resolved:
+                # Product, size or price no longer available
+                skipped += 1
+                continue
+            product, size, size_price = resolved
+            quantity = max(1, int(line.get('quantity') or 1))
+            orders.append(Order(
+                customer=customer,
+                product=product,
+                size=size,
+                quantity=quantity,
+                delivery_date=_date(delivery_date or line.get('delivery_date'), today + timedelta(days=1)),
+                delivery_time=_time(delivery_time or line.get('delivery_time')),
+                custom_message=custom_message or line.get('custom_message') or '',
+                special_instructions=special_instructions or line.get('special_instructions') or '',
+                unit_price=size_price.price,
+                total_price=size_price.price * quantity,
+            ))
+    return orders, custom_orders, skipped
+
+
+def _insert(model, instances):
+    """bulk_create with order numbers allocated as one block; instances get their pks."""
+    numbers = generate_sequence_numbers(model, 'order_number', model.order_number_prefix(), 4, len(instances))
+    for instance, number in zip(instances, numbers):
+        instance.order_number = number
+    model.objects.bulk_create(instances)
+    if any(instance.pk is None for instance in instances):
+        # Backends that can't return ids from a bulk insert
+        ids = dict(model.objects.filter(order_number__in=numbers).values_list('order_number', 'id'))
+        for instance in instances:
+            instance.pk = ids[instance.order_number]
+
+
+def _insert_custom_orders(custom_orders):
+    _insert(CustomCakeOrder, custom_orders)
+    CustomCakeOrderDecoration.objects.bulk_create([
+        CustomCakeOrderDecoration(custom_order=custom_order, decoration_id=dec['id'], quantity=int(dec['quantity']))
+        for custom_order in custom_orders
+        for dec in custom_order._cart_decorations
+    ])
+    # Estimates include the decorations, so they are priced after those exist
+    now = timezone.now()
+    for custom_order, quote in zip(custom_orders, quote_orders(custom_orders)):
+        custom_order.estimated_price = quote.estimate
+        custom_order.updated_at = now
+    CustomCakeOrder.objects.bulk_update(custom_orders, ['estimated_price', 'updated_at'])
+
+
+# ===========================
+# Loyalty
+# ===========================
+
+def _apply_loyalty(customer, order, reward_id, points):
+    """
+    Apply the staged reward (percentage) and then points to `order`, with the
+    loyalty card row locked. Returns the amount payable on the order.
+    """
+    customer_refreshed = Customer.objects.select_for_update().get(id=customer.id)
+    try:
+        loyalty_card = LoyaltyCard.objects.select_for_update().get(customer=customer_refreshed)
+    except LoyaltyCard.DoesNotExist:
+        loyalty_card = None
+
+    order_payable = order.total_price
+
+    # Apply reward (percentage) if selected and valid
+    if reward_id and loyalty_card:
+        reward = LoyaltyReward.objects.filter(id=reward_id, loyalty_card=loyalty_card, status='active').first()
+        if reward and reward.is_valid() and reward.used_on_order is None:
+            try:
+                discount_percent = Decimal(reward.discount_percentage)
+            except Exception:
+                discount_percent = Decimal('0')
+            if discount_percent > 0:
+                discount_amount = (order_payable * discount_percent) / Decimal('100')
+                order_payable = max(Decimal('0'), order_payable - discount_amount)
+                reward.status = 'used'
+                reward.used_on_order = order
+                reward.used_date = timezone.now()
+                reward.save()
+
+    # Apply points redemption, capped by balance and remaining payable
+    if points and loyalty_card:
+        try:
+            points_balance = int(loyalty_card.points_balance)
+        except Exception:
+            points_balance = 0
+        max_points_by_payable = _calculate_max_points_redeemable(order_payable, points_balance)
+        points_to_redeem = max(0, min(int(points), max_points_by_payable))
+        if points_to_redeem > 0 and loyalty_card.points_balance >= points_to_redeem:
+            loyalty_card.points_balance -= points_to_redeem
+            loyalty_card.save()
+            order_payable = max(Decimal('0'), order_payable - Decimal(points_to_redeem))
+            PointsTransaction.objects.create(
+                loyalty_card=loyalty_card,
+                points=points_to_redeem,
+                transaction_type='redeemed',
+                reason=f'Redeemed on order {order.order_number}',
+                order=order
+            )
+
+    # Store the final payable as a note on the order (non-invasive)
+    if order_payable != order.total_price:
+        note = order.special_instructions or ''
+        suffix = f"\n[Loyalty Applied] Final payable after rewards/points: ₹{order_payable}"
+        order.special_instructions = (note + suffix).strip()
+        Order.objects.filter(pk=order.pk).update(special_instructions=order.special_instructions)
+    return order_payable
+
+
+# ===========================
+# Checkout
+# ===========================
+
+def place_cart_orders(customer, lines, details, pricing=None, reward_id=None, points=0, idempotency_key=None):
+    """
+    Create the orders for a cart in one transaction.
+
+    `lines` are the expanded cart lines (Cart.lines()), `details` the
+    checkout form values (delivery_date, delivery_time, custom_message,
+    special_instructions, delivery_address) and `pricing` the CartPricing
+    already built for these lines, if any. The staged loyalty reward and
+    points are applied to the first regular order, and `idempotency_key` is
+    stored on the first order of each kind. Raises CheckoutError when
+    nothing in the cart can be ordered or the form values are invalid.
+    """
+    pricing = pricing or CartPricing(lines)
+    orders, custom_orders, skipped = _build_orders(customer, lines, details, pricing)
+    if not orders and not custom_orders:
+        raise CheckoutError('None of the items in your cart are available any more.')
+
+    for created in (orders, custom_orders):
+        if created:
+            created[0].idempotency_key = idempotency_key
+
+    payable = None
+    with transaction.atomic():
+        if orders:
+            _insert(Order, orders)
+        if custom_orders:
+            _insert_custom_orders(custom_orders)
+        rollups.add_created_orders(orders + custom_orders)
+        if orders:
+            payable = _apply_loyalty(customer, orders[0], reward_id, points)
+
+    return CheckoutResult(orders=orders, custom_orders=custom_orders, skipped=skipped, payable=payable)
@@ -2,16 +2,19 @@
 Context processors for cakeshop_app
 These make variables available to all templates
 """
-from admin_app.models import Category, Product, ProductPrice, Size, Customer, PageTitleBanner
+from admin_app.models import Customer, PageTitleBanner
 from django.utils import timezone
 
+from .catalog import get_catalog
+from .pricing import get_cart_pricing
+
 
 def categories(request):
     """
     Add categories to all template contexts for navigation menu
     """
     return {
-        'categories': Category.objects.filter(is_active=True).order_by('name')
+        'categories': get_catalog().categories
     }
 
 
@@ -20,38 +23,35 @@ def cart_info(request):
     Add cart information to all template contexts for navbar
     Includes item count, cart items, and total
     """
-    cart = request.session.get('cart', [])
-    total_items = sum(item.get('quantity', 1) for item in cart if item.get('type') == 'product')
+    cart = request.cart.lines() if request.cart else []
+    total_items = request.cart.item_count()
     
     # Build cart items with full details for navbar dropdown
     cart_items = []
     cart_total = 0
     
+    pricing = get_cart_pricing(request, cart)
+    
     for item in cart:
         # Only show regular products in navbar dropdown (not custom cakes)
         if item.get('type') != 'product':
             continue
-            
-        try:
-            product = Product.objects.get(id=item['product_id'])
-            size = Size.objects.get(id=item['size_id'])
-            size_price = ProductPrice.objects.filter(product=product, size=size).first()
-            
-            if not size_price:
-                continue
-            
-            cart_items.append({
-                'id': item.get('product_id', ''),
-                'product': product,
-                'size': size,
-                'size_price': size_price,
-                'quantity': item.get('quantity', 1),
-                'subtotal': size_price.price * item.get('quantity', 1)
-            })
-            cart_total += size_price.price * item.get('quantity', 1)
-        except (Product.DoesNotExist, Size.DoesNotExist):
-            # Skip invalid cart items
+        
+        resolved = pricing.resolve(item)
+        if not resolved:
+            # Skip invalid or unpriced cart items
             continue
+        product, size, size_price = resolved
+        
+        cart_items.append({
+            'id': item.get('product_id', ''),
+            'product': product,
+            'size': size,
+            'size_price': size_price,
+            'quantity': item.get('quantity', 1),
+            'subtotal': size_price.price * item.get('quantity', 1)
+        })
+        cart_total += size_price.price * item.get('quantity', 1)
     
     return {
         'cart_count': total_items,
@@ -0,0 +1,150 @@
+"""
+Idempotency keys for order submissions
+
+Every order form carries a one-time key ({% idempotency_key_field %}). The
+first request with a key claims it in the shared cache and records what it
+created once done; a double-submit or browser retry with the same key gets
+the original confirmation back without running the inserts, uploads or
+loyalty redemption again. A duplicate that arrives while the first request
+is still working waits briefly for its outcome.
+
+The cache entry lives for IDEMPOTENCY_KEY_TTL seconds. The key is also
+stored on the created order (a unique column), so a replay after the entry
+expired is answered from the stored order instead (and two requests that
+both miss the cache can't both insert it).
+
+Views opt in with @idempotent(scope, replay, find); see its docstring.
+"""
+import re
+import secrets
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.shortcuts import redirect
+
+FIELD_NAME = 'idempotency_key'
+
+_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+# How long a duplicate waits for the first request to finish, and how often it checks
+WAIT_SECONDS = 10
+POLL_INTERVAL = 0.25
+
+PENDING = 'pending'
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 15 * 60)
+
+
+def _cache_key(scope, key):
+    return f'idempotency:{scope}:{key}'
+
+
+def new_key():
+    return secrets.token_urlsafe(24)
+
+
+def submission_key(request):
+    """The (well-formed) idempotency key posted with the form, or None."""
+    key = request.POST.get(FIELD_NAME, '')
+    return key if _KEY_RE.match(key) else None
+
+
+def claim(scope, key):
+    """
+    Claim `key` for this request.
+
+    Returns None when the request should go ahead (the key is new, or there
+    is no key), the result recorded by the request that used the key first,
+    or PENDING if that request is still running after WAIT_SECONDS.
+    """
+    if key is None:
+        return None
+    if cache.add(_cache_key(scope, key), PENDING, timeout=_ttl()):
+        return None
+
+    deadline = time.monotonic() + WAIT_SECONDS
+    while True:
+        result = cache.get(_cache_key(scope, key))
+        if result is None:
+            # The first request failed and released the key: take it over
+            return None if cache.add(_cache_key(scope, key), PENDING, timeout=_ttl()) else PENDING
+        if result != PENDING or time.monotonic() >= deadline:
+            return result
+        time.sleep(POLL_INTERVAL)
+
+
+def record(scope, key, result):
+    """Store what the request created (a small dict) for replays of `key`."""
+    if key is not None:
+        cache.set(_cache_key(scope, key), result, timeout=_ttl())
+
+
+def release(scope, key):
+    """Give the key back after a failed attempt, so the customer can resubmit."""
+    if key is not None:
+        cache.delete(_cache_key(scope, key))
+
+
+# ===========================
+# View decorator
+# ===========================
+
+def idempotent(scope, replay, find=None):
+    """
+    Make an order-placing view safe to submit twice.
+
+    On POST the view finds the key on request.idempotency_key (None when the
+    form didn't send one; store it on the created order) and reports success
+    by setting request.idempotent_result to a small dict describing what it
+    created. For a repeated key, replay(request, result) builds the response
+    instead of calling the view. find(key) looks the result up from the
+    orders themselves, for keys whose cache entry has expired.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'POST':
+                return view(request, *args, **kwargs)
+
+            key = submission_key(request)
+            request.idempotency_key = key
+            previous = claim(scope, key)
+            if previous == PENDING:
+                messages.info(request, 'Your order is already being placed. Please wait a moment before checking your orders.')
+                return redirect(request.path)
+            if previous is None and key is not None and find is not None:
+                previous = find(key)
+                if previous is not None:
+                    record(scope, key, previous)
+            if previous is not None:
+                return replay(request, previous)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except IntegrityError:
+                # A concurrent request with the same key inserted the order first
+                existing = find(key) if key is not None and find is not None else None
+                if existing is None:
+                    release(scope, key)
+                    raise
+                record(scope, key, existing)
+                return replay(request, existing)
+            except Exception:
+                release(scope, key)
+                raise
+
+            result = getattr(request, 'idempotent_result', None)
+            if result is None:
+                # Validation error etc.: nothing was placed, the form may be sent again
+                release(scope, key)
+            else:
+                record(scope, key, result)
+            return response
+        return wrapper
+    return decorator
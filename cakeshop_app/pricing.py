@@ -0,0 +1,80 @@
+"""
+Cart pricing resolver for cakeshop_app
+Loads products, sizes and prices for the whole cart in one batch and
+memoizes the result on the request so the navbar, cart page and checkout
+share a single set of lookups.
+"""
+from decimal import Decimal
+
+from admin_app.models import Product, ProductPrice, Size
+
+
+class CartPricing:
+    """Batched product/size/price lookups for the regular product lines of a cart."""
+
+    def __init__(self, cart):
+        lines = [line for line in cart if line.get('type') == 'product']
+        product_ids = {line.get('product_id') for line in lines if line.get('product_id')}
+        size_ids = {line.get('size_id') for line in lines if line.get('size_id')}
+
+        self.products = Product.objects.in_bulk(product_ids) if product_ids else {}
+        self.sizes = Size.objects.in_bulk(size_ids) if size_ids else {}
+        self.prices = {}
+        if self.products and self.sizes:
+            price_rows = ProductPrice.objects.filter(
+                product_id__in=self.products.keys(),
+                size_id__in=self.sizes.keys()
+            )
+            for price in price_rows:
+                self.prices[(price.product_id, price.size_id)] = price
+
+    def resolve(self, line):
+        """Return (product, size, ProductPrice) for a cart line, or None if any part is missing."""
+        product = self.products.get(_to_int(line.get('product_id')))
+        size = self.sizes.get(_to_int(line.get('size_id')))
+        if not product or not size:
+            return None
+        size_price = self.prices.get((product.id, size.id))
+        if not size_price:
+            return None
+        # Reuse the already loaded objects so templates don't trigger extra queries
+        size_price.product = product
+        size_price.size = size
+        return product, size, size_price
+
+    def unit_price(self, line):
+        """Current unit price for a cart line (Decimal('0.00') when not priced)."""
+        resolved = self.resolve(line)
+        return resolved[2].price if resolved else Decimal('0.00')
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cart_signature(cart):
+    return tuple(
+        (line.get('product_id'), line.get('size_id'))
+        for line in cart if line.get('type') == 'product'
+    )
+
+
+def get_cart_pricing(request, cart=None):
+    """
+    Get the CartPricing for the current request's cart.
+
+    The resolver is cached on the request and rebuilt only if the set of
+    product/size pairs in the cart changed since it was built.
+    """
+    if cart is None:
+        cart = request.cart.lines()
+    signature = _cart_signature(cart)
+    cached = getattr(request, '_cart_pricing', None)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    pricing = CartPricing(cart)
+    request._cart_pricing = (signature, pricing)
+    return pricing
@@ -0,0 +1,70 @@
+"""
+Fixed-window rate limiting on the shared cache
+
+Each (scope, client) pair gets a counter per time window, created with
+cache.add() and bumped with cache.incr(); both are atomic on the shared
+cache backends, so the limit holds across all worker processes. Limits are
+configured per scope in settings.RATE_LIMITS as (requests, window seconds).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _limit(scope):
+    return settings.RATE_LIMITS[scope]
+
+
+def _window_key(scope, identity, window):
+    # Hashed so phone numbers / emails never end up in cache keys
+    digest = hashlib.sha1(str(identity).encode()).hexdigest()[:20]
+    return f'ratelimit:{scope}:{digest}:{int(time.time() // window)}'
+
+
+def hit(scope, identity):
+    """
+    Count one request for `identity` in `scope`.
+    Returns False once the client is over the limit for the current window.
+    """
+    limit, window = _limit(scope)
+    key = _window_key(scope, identity, window)
+    if cache.add(key, 1, timeout=window):
+        return 1 <= limit
+    try:
+        return cache.incr(key) <= limit
+    except ValueError:
+        # The window expired between add() and incr(): start a new one
+        cache.add(key, 1, timeout=window)
+        return True
+
+
+def is_limited(scope, identity):
+    """True when `identity` has used up `scope` for the current window (without counting a request)."""
+    limit, window = _limit(scope)
+    return (cache.get(_window_key(scope, identity, window)) or 0) >= limit
+
+
+def reset(scope, identity):
+    """Forget the current window's count (e.g. after a successful login)."""
+    _, window = _limit(scope)
+    cache.delete(_window_key(scope, identity, window))
+
+
+def client_ip(request):
+    """
+    Client address for per-IP limits.
+
+    REMOTE_ADDR, unless RATE_LIMIT_TRUSTED_PROXIES says how many of our own
+    proxies sit in front of the app: each of them appends the address it was
+    connected from to X-Forwarded-For, so the client is that many entries
+    from the right. Entries further left come from the client and can be
+    anything, so they are never used.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
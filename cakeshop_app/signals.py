@@ -0,0 +1,48 @@
+"""
+Signals that keep the in-process catalog snapshot and suggestion index fresh
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from admin_app.models import (
+    Category, Subcategory, Size, Product, ProductPrice, Event, Flavor,
+    CakeShape, CakeTier, Decoration
+)
+from admin_app.utils import image_processed
+from .catalog import bump_catalog_version
+from .suggestions import schedule_rebuild
+
+CATALOG_MODELS = (
+    Category, Subcategory, Size, Product, ProductPrice, Event, Flavor,
+    CakeShape, CakeTier, Decoration,
+)
+
+# Models whose names are in the typeahead index (see suggestions.py)
+SUGGESTION_MODELS = (Category, Product, Event, Flavor)
+
+
+def invalidate_catalog(sender, **kwargs):
+    """Bump the shared catalog version so every worker rebuilds its snapshot"""
+    bump_catalog_version()
+    if sender in SUGGESTION_MODELS:
+        transaction.on_commit(schedule_rebuild)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=Product.sizes.through)
+def invalidate_catalog_m2m(sender, action, **kwargs):
+    """Product sizes are part of the snapshot too"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version()
+
+
+@receiver(image_processed)
+def invalidate_catalog_image(sender, **kwargs):
+    """Processed images are written with update(), which skips post_save"""
+    if sender in CATALOG_MODELS:
+        bump_catalog_version()
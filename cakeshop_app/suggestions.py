@@ -0,0 +1,178 @@
+"""
+In-memory typeahead index for storefront search suggestions
+
+Active product, category, flavor and event names are split into words and
+kept in one sorted array of (word, entry) keys, so a prefix lookup is a
+binary search plus a short scan - no database access per keystroke.
+
+The index is tagged with the catalog version (see catalog.py), like the
+catalog snapshot: catalog change signals schedule a background rebuild in
+the process that made the change, and other workers rebuild lazily when they
+see the new version. Servers also build it in the background at startup
+(see cakeshop/wsgi.py).
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+from django.db import DatabaseError, connection
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from admin_app.models import Product
+from .catalog import get_catalog, get_catalog_version
+
+MAX_SUGGESTIONS = 8
+REBUILD_DELAY = 1.0  # seconds of quiet after a catalog change before rebuilding
+
+# Listed in this order when equally good matches
+KIND_ORDER = ('product', 'category', 'flavor', 'event')
+
+Suggestion = namedtuple('Suggestion', ['kind', 'label', 'url'])
+
+SuggestionIndex = namedtuple('SuggestionIndex', [
+    'version',
+    'keys',         # sorted word keys
+    'key_entries',  # entry number for each key
+    'entries',      # Suggestion tuples, in display order
+    'labels',       # normalised label of each entry
+])
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_index = None
+_lock = threading.Lock()
+_rebuild_timer = None
+_timer_lock = threading.Lock()
+
+
+def normalize(text):
+    """Case- and accent-insensitive form used for keys and queries."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+
+
+def _search_url(text):
+    return f"{reverse('products')}?{urlencode({'search': text})}"
+
+
+def _suggestions(catalog):
+    """Every Suggestion for the current catalog."""
+    products_url = reverse('products')
+    suggestions = [
+        Suggestion('product', name, reverse('product_detail', args=[product_id]))
+        for product_id, name in Product.objects.filter(is_active=True).values_list('id', 'name').order_by()
+    ]
+    suggestions.extend(
+        Suggestion('category', category.name, f"{products_url}?{urlencode({'category': category.id})}")
+        for category in catalog.categories
+    )
+    suggestions.extend(
+        Suggestion('flavor', flavor.name, _search_url(flavor.name))
+        for flavor in catalog.flavors
+    )
+    suggestions.extend(
+        Suggestion('event', event.event_name, _search_url(event.event_name))
+        for event in catalog.events
+    )
+    return suggestions
+
+
+def _build_index(version):
+    entries = sorted(
+        _suggestions(get_catalog()),
+        key=lambda entry: (KIND_ORDER.index(entry.kind), normalize(entry.label))
+    )
+    labels = [normalize(entry.label) for entry in entries]
+
+    pairs = sorted({
+        (word, number)
+        for number, label in enumerate(labels)
+        for word in _WORD_RE.findall(label)
+    })
+    return SuggestionIndex(
+        version=version,
+        keys=[word for word, _ in pairs],
+        key_entries=[number for _, number in pairs],
+        entries=tuple(entries),
+        labels=tuple(labels),
+    )
+
+
+def get_suggestion_index():
+    """Current SuggestionIndex, rebuilt only when the catalog version moved."""
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = _build_index(version)
+        return _index
+
+
+def _build_in_background():
+    try:
+        get_suggestion_index()
+    except DatabaseError:
+        # Tables not migrated yet: the first request builds it instead
+        pass
+    finally:
+        connection.close()
+
+
+def warm_suggestion_index():
+    """Build the index in a background thread at startup."""
+    threading.Thread(target=_build_in_background, name='suggestion-index-warm', daemon=True).start()
+
+
+def schedule_rebuild():
+    """
+    Rebuild shortly after a catalog change, off the request thread. A burst
+    of changes (an admin bulk action, an import) is coalesced into one
+    rebuild.
+    """
+    global _rebuild_timer
+    with _timer_lock:
+        if _rebuild_timer is not None:
+            _rebuild_timer.cancel()
+        _rebuild_timer = threading.Timer(REBUILD_DELAY, _build_in_background)
+        _rebuild_timer.daemon = True
+        _rebuild_timer.start()
+
+
+def suggest(query, limit=MAX_SUGGESTIONS):
+    """
+    Suggestions whose words start with every term of `query`.
+
+    Labels that start with the whole query come first, then products,
+    categories, flavors and events, alphabetically within each.
+    """
+    terms = _WORD_RE.findall(normalize(query))
+    if not terms:
+        return []
+    index = get_suggestion_index()
+
+    # Scan the keys of the longest term, check the other terms per entry
+    lead = max(terms, key=len)
+    others = [term for term in terms if term != lead]
+    keys = index.keys
+    matches = set()
+    position = bisect.bisect_left(keys, lead)
+    while position < len(keys) and keys[position].startswith(lead):
+        number = index.key_entries[position]
+        position += 1
+        if number in matches:
+            continue
+        if others:
+            words = _WORD_RE.findall(index.labels[number])
+            if not all(any(word.startswith(term) for word in words) for term in others):
+                continue
+        matches.add(number)
+
+    whole = ' '.join(terms)
+    ranked = sorted(matches, key=lambda number: (not index.labels[number].startswith(whole), number))
+    return [index.entries[number] for number in ranked[:limit]]
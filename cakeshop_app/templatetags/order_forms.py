@@ -0,0 +1,12 @@
+from django import template
+from django.utils.html import format_html
+
+from cakeshop_app.idempotency import FIELD_NAME, new_key
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_key_field():
+    """Hidden one-time key that makes a double-submitted order form place one order"""
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD_NAME, new_key())
@@ -1,3 +1,238 @@
-from django.test import TestCase
+import os
+import shutil
+import sys
+import tempfile
+from decimal import Decimal
+from multiprocessing import get_context
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import ratelimit
+
+WORKERS = 4
+# Seconds to wait for the workers; one that fails to start hangs the pool instead of raising
+TASK_TIMEOUT = 120
+
+# Tests get their own cache, not the shared file cache of the running site.
+# Classes using it also switch off the background session purge, whose
+# thread could outlive the test database and open the real one.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_products(count):
+    """`count` cake products, each priced in two sizes. Returns (products, sizes)."""
+    # Imported here: spawned workers import this module before Django is set up
+    from admin_app.models import Category, Product, ProductPrice, Size
+
+    category = Category.objects.create(name='Cakes', is_cake=True)
+    sizes = [Size.objects.create(name=f'{kg} kg', weight_in_kg=kg) for kg in (1, 2)]
+    products = []
+    for i in range(count):
+        product = Product(name=f'Cake {i}', description='Chocolate', category=category)
+        product.main_image.name = 'products/cake.jpg'
+        # Skip Product.save(), which would process the (missing) image
+        super(Product, product).save()
+        product.sizes.set(sizes)
+        for size in sizes:
+            ProductPrice.objects.create(product=product, size=size, price=Decimal(100 * (i + 1)) * size.weight_in_kg)
+        products.append(product)
+    return products, sizes
+
+
+@override_settings(CACHES=TEST_CACHES, SESSION_PURGE_INTERVAL=0, ALLOWED_HOSTS=['testserver'], PDF_PRERENDER_ENABLED=False)
+class CartQueryCountTests(TestCase):
+    """The navbar (cart_info) and the cart page cost the same number of queries for any cart size."""
+
+    LINES = 8
+    # Queries with a warm cache: 3 for the cart pricing, the rest for the page
+    EXPECTED = {'home': 9, 'view_cart': 5}
+
+    def setUp(self):
+        cache.clear()
+        self.products, self.sizes = create_products(self.LINES)
+
+    def client_with_cart(self, lines):
+        for product in self.products[:lines]:
+            self.client.post(reverse('add_to_cart'), {
+                'product_id': product.id, 'size_id': self.sizes[0].id, 'quantity': 2,
+            })
+        # Fill the catalog and banner caches before anything is counted
+        self.client.get(reverse('home'))
+        return self.client
+
+    def query_count(self, url, lines):
+        self.client.cookies.clear()
+        client = self.client_with_cart(lines)
+        with self.assertNumQueries(self.EXPECTED[url]):
+            response = client.get(reverse(url))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_navbar_queries_do_not_grow_with_cart(self):
+        for lines in (1, self.LINES):
+            with self.subTest(lines=lines):
+                response = self.query_count('home', lines)
+                self.assertEqual(len(response.context['cart_items']), lines)
+
+    def test_cart_page_queries_do_not_grow_with_cart(self):
+        for lines in (1, self.LINES):
+            with self.subTest(lines=lines):
+                response = self.query_count('view_cart', lines)
+                self.assertEqual(response.context['cart_count'], lines * 2)
+
+
+@override_settings(CACHES=TEST_CACHES, SESSION_PURGE_INTERVAL=0, ALLOWED_HOSTS=['testserver'], PDF_PRERENDER_ENABLED=False)
+class IdempotentCheckoutTests(TestCase):
+    """A resubmitted checkout form returns the original order and leaves the current cart alone."""
+
+    def setUp(self):
+        cache.clear()
+        self.products, self.sizes = create_products(2)
+        self.form = {
+            'customer_name': 'Asha', 'customer_phone': '9000000001', 'delivery_address': 'MG Road',
+            'idempotency_key': 'k' * 24,
+        }
+
+    def add_to_cart(self, product):
+        self.client.post(reverse('add_to_cart'), {'product_id': product.id, 'size_id': self.sizes[0].id, 'quantity': 1})
+
+    def test_resubmit_returns_the_original_order(self):
+        from admin_app.models import Order
+
+        self.add_to_cart(self.products[0])
+        first = self.client.post(reverse('checkout_submit'), self.form)
+        second = self.client.post(reverse('checkout_submit'), self.form)
+        self.assertEqual(second.url, first.url)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_stale_resubmit_keeps_items_added_since(self):
+        from admin_app.models import Order
+
+        self.add_to_cart(self.products[0])
+        first = self.client.post(reverse('checkout_submit'), self.form)
+        self.add_to_cart(self.products[1])
+        replay = self.client.post(reverse('checkout_submit'), self.form)
+        self.assertEqual(replay.url, first.url)
+        self.assertEqual(Order.objects.count(), 1)
+        cart = self.client.get(reverse('view_cart')).context['cart']
+        self.assertEqual([line['product_id'] for line in cart], [self.products[1].id])
+
+
+class ClientIpTests(SimpleTestCase):
+    """Per-IP rate limits can't be dodged with a made-up X-Forwarded-For header."""
+
+    def request(self, forwarded=None):
+        headers = {'HTTP_X_FORWARDED_FOR': forwarded} if forwarded is not None else {}
+        return RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', **headers)
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=0)
+    def test_header_ignored_without_trusted_proxies(self):
+        self.assertEqual(ratelimit.client_ip(self.request('1.2.3.4')), '10.0.0.1')
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=1)
+    def test_right_most_hop_added_by_the_proxy(self):
+        self.assertEqual(ratelimit.client_ip(self.request('6.6.6.6, 203.0.113.7')), '203.0.113.7')
+        self.assertEqual(ratelimit.client_ip(self.request('203.0.113.7')), '203.0.113.7')
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=2)
+    def test_hop_added_by_the_outermost_proxy(self):
+        self.assertEqual(ratelimit.client_ip(self.request('6.6.6.6, 203.0.113.7, 10.0.0.5')), '203.0.113.7')
+        # Fewer hops than proxies: the header didn't come through our proxies
+        self.assertEqual(ratelimit.client_ip(self.request('203.0.113.7')), '10.0.0.1')
+
+
+# ===========================
+# Shared cache across worker processes
+# ===========================
+
+def _setup_worker():
+    """Pool initializer: a fresh Django process, like a separate server worker."""
+    sys.path.insert(0, str(settings.BASE_DIR))
+    import django
+    django.setup()
+
+
+def _store_otp(phone):
+    from . import utils
+    utils.store_otp(phone, 'check@example.com', '424242')
+
+
+def _verify_otp(phone):
+    from . import utils
+    return utils.verify_otp(phone, '424242')[0]
+
+
+def _increment(key, times):
+    from django.core.cache import cache
+    cache.add(key, 0, timeout=300)
+    for _ in range(times):
+        cache.incr(key)
+
+
+def _cache_get(key):
+    from django.core.cache import cache
+    return cache.get(key)
+
+
+def _hit_rate_limit(identity, times):
+    return sum(ratelimit.hit('otp_request', identity) for _ in range(times))
+
+
+def _catalog_version(bump):
+    from .catalog import bump_catalog_version, get_catalog_version
+    if bump:
+        bump_catalog_version()
+    return get_catalog_version()
+
+
+class SharedCacheTests(SimpleTestCase):
+    """
+    State kept in the cache is shared by all worker processes: each check
+    runs in separate spawned processes against one scratch cache file.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        workdir = tempfile.mkdtemp(prefix='shared-cache-test-')
+        cls.addClassCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        # Spawned workers read their settings from the environment at start-up
+        env = {'CACHE_FILE': os.path.join(workdir, 'cache.sqlite3'), 'REDIS_URL': ''}
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            cls.pool = get_context('spawn').Pool(WORKERS, initializer=_setup_worker)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        cls.addClassCleanup(cls.pool.terminate)
+
+    def starmap(self, func, args):
+        return self.pool.starmap_async(func, args).get(TASK_TIMEOUT)
+
+    def test_otp_verifies_in_another_worker_once(self):
+        self.starmap(_store_otp, [('otp-test',)])
+        results = self.starmap(_verify_otp, [('otp-test',)] * WORKERS)
+        self.assertEqual(results.count(True), 1, results)
+
+    def test_incr_is_atomic_across_workers(self):
+        self.starmap(_increment, [('incr-test', 200)] * WORKERS)
+        self.assertEqual(self.starmap(_cache_get, [('incr-test',)]), [200 * WORKERS])
+
+    def test_rate_limit_holds_across_workers(self):
+        limit, _ = settings.RATE_LIMITS['otp_request']
+        allowed = self.starmap(_hit_rate_limit, [('ratelimit-test', limit)] * WORKERS)
+        self.assertEqual(sum(allowed), limit)
+
+    def test_catalog_version_bump_reaches_every_worker(self):
+        [before] = self.starmap(_catalog_version, [(False,)])
+        [bumped] = self.starmap(_catalog_version, [(True,)])
+        seen = self.starmap(_catalog_version, [(False,)] * WORKERS)
+        self.assertEqual(bumped, before + 1)
+        self.assertEqual(set(seen), {bumped})
@@ -15,6 +15,7 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     # Products
     path('products/', views.products, name='products'),
+    path('products/more/', views.products_more, name='products_more'),
     path('products/<int:product_id>/', views.product_detail, name='product_detail'),
     
     # Orders
@@ -37,6 +38,7 @@ urlpatterns = [
     
     # Gallery
     path('gallery/', views.gallery, name='gallery'),
+    path('gallery/more/', views.gallery_more, name='gallery_more'),
     
     # Contact
     path('contact/', views.contact, name='contact'),
@@ -59,6 +61,7 @@ urlpatterns = [
     # AJAX APIs
     path('api/product-details/', views.get_product_details_ajax, name='get_product_details_ajax'),
     path('api/event-suggestions/', views.get_event_suggestions_ajax, name='get_event_suggestions_ajax'),
+    path('api/search-suggestions/', views.search_suggestions_ajax, name='search_suggestions_ajax'),
     path('api/calculate-price/', views.calculate_price_ajax, name='calculate_price_ajax'),
     path('api/product-sizes-prices/', views.get_product_sizes_prices, name='get_product_sizes_prices'),
 
@@ -2,9 +2,15 @@
 import random
 import string
 from datetime import datetime, timedelta
+import logging
 from django.core.cache import cache
-from django.core.mail import send_mail
-from django.conf import settings
+
+from admin_app.mail_outbox import enqueue_email
+
+logger = logging.getLogger(__name__)
+
+# Seconds an OTP stays valid; its email is not sent any later than that
+OTP_TTL = 5 * 60
 
 def generate_otp(length=6):
     """Generate a numeric OTP of specified length."""
@@ -17,7 +23,7 @@ def store_otp(phone, email, otp):
         'otp': otp,
         'email': email,
         'created_at': datetime.now().isoformat()
-    }, timeout=300)  # 5 minutes
+    }, timeout=OTP_TTL)
 
 def verify_otp(phone, entered_otp):
     """Verify the OTP for given phone number."""
@@ -30,12 +36,18 @@ def verify_otp(phone, entered_otp):
     if stored_data['otp'] != entered_otp:
         return False, "Invalid OTP. Please try again."
     
-    # Clear the OTP after successful verification
-    cache.delete(cache_key)
+    # Clear the OTP after successful verification; only the worker that
+    # actually deletes it may use it, so an OTP can't be redeemed twice
+    if not cache.delete(cache_key):
+        return False, "OTP has expired. Please request a new one."
     return True, stored_data.get('email', '')
 
+def clear_otp(phone):
+    """Invalidate any pending OTP for a phone number."""
+    cache.delete(f"otp_{phone}")
+
 def send_otp_email(email, otp):
-    """Send OTP via email."""
+    """Queue the OTP email; the background mail sender delivers it."""
     subject = 'Your OTP for Cakes by Desti'
     message = f'''
     Hello!
@@ -50,14 +62,8 @@ def send_otp_email(email, otp):
     '''
     
     try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            fail_silently=False,
-        )
+        enqueue_email(email, subject, message, expires_in=OTP_TTL)
         return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
\ No newline at end of file
+    except Exception:
+        logger.exception("Could not queue OTP email")
+        return False
@@ -1,44 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q, Count
-from . import utils
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.db.models import Count
+from django.template.loader import render_to_string
+from . import idempotency, ratelimit, utils
+from admin_app import invoices, keyset
+from admin_app.custom_pricing import quote_orders
+from admin_app.search import search_products
+from admin_app.pdf_jobs import schedule_pdf_prerender, schedule_pdf_prerenders
+from .catalog import get_catalog, sizes_for_product
+from .checkout import CheckoutError, place_cart_orders
+from .pricing import get_cart_pricing
+from .suggestions import suggest
+from django.http import JsonResponse
 from django.urls import reverse
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
 import urllib.parse
-from io import BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 
 # Import models from admin_app
 from admin_app.models import (
-    Category, Subcategory, Product, Size, ProductPrice,
+    Subcategory, Product, Size, ProductPrice,
     Event, EventSuggestion, Customer, Order,
     Enquiry, Gallery, Review, CarouselSlide, OfferBanner,
     CakeShape, CakeTier, Decoration, CustomCakeOrder,
-    Flavor, CustomCakeOrderDecoration, CustomCakeReferenceImage,
+    CustomCakeOrderDecoration, CustomCakeReferenceImage,
     GiftBox, GiftBoxItem, GiftBoxOrder,
     LoyaltyCard, LoyaltyReward, PointsTransaction, Referral, Achievement, CustomerAchievement
 )
 
 # ===========================
-# CART (Session-based)
+# CART (request.cart, see cart.py)
 # ===========================
 
-def _get_cart(session):
-    cart = session.get('cart')
-    if cart is None:
-        cart = []
-        session['cart'] = cart
-    return cart
-
 def add_to_cart(request):
     if request.method != 'POST':
         return redirect('products')
@@ -57,29 +53,17 @@ def add_to_cart(request):
         messages.error(request, 'Selected size not priced for this product.')
         return redirect('product_detail', product_id=product.id)
 
-    cart = _get_cart(request.session)
-    # Merge with identical line (product+size+delivery_date)
-    merged = False
-    for line in cart:
-        if line.get('type') == 'product' and line['product_id'] == product.id and line['size_id'] == size.id and line.get('delivery_date') == delivery_date:
-            line['quantity'] += quantity
-            merged = True
-            break
-    if not merged:
-        cart.append({
-            'type': 'product',
-            'product_id': product.id,
-            'product_name': product.name,
-            'size_id': size.id,
-            'size_name': size.name,
-            'unit_price': float(price.price),
-            'quantity': quantity,
-            'delivery_date': delivery_date,
-            'delivery_time': delivery_time,
-            'custom_message': custom_message,
-            'special_instructions': special_instructions,
-        })
-    request.session.modified = True
+    # Merges with an identical line (product+size+delivery_date)
+    added = request.cart.add_product(
+        product.id, size.id, quantity,
+        delivery_date=delivery_date,
+        delivery_time=delivery_time,
+        custom_message=custom_message,
+        special_instructions=special_instructions,
+    )
+    if not added:
+        messages.error(request, 'Your cart is full. Please check out or remove an item first.')
+        return redirect('view_cart')
     messages.success(request, 'Added to cart.')
     return redirect('view_cart')
 
@@ -105,65 +89,39 @@ def add_custom_to_cart(request):
     decoration_ids = request.POST.getlist('decoration_ids')
     decoration_quantities = request.POST.getlist('decoration_quantities')
     
-    # Get names for display
     shape = get_object_or_404(CakeShape, id=shape_id)
     tier = get_object_or_404(CakeTier, id=tier_id)
     
-    flavor_display = 'Not specified'
     if flavor_option == 'product' and product_id and size_id:
-        product = Product.objects.get(id=product_id)
         size = Size.objects.get(id=size_id)
-        flavor_display = f"{product.name} - {size.name}"
         total_weight = str(size.weight_in_kg)
-    elif flavor_id:
-        flavor = Flavor.objects.get(id=flavor_id)
-        flavor_display = flavor.name
-    elif flavor_description:
-        flavor_display = flavor_description
-    
-    # Build decoration summary
-    decoration_summary = []
+    
+    # Only decorations that exist; names are looked up when the cart is shown
+    decorations = []
     if decoration_ids:
+        known = set(Decoration.objects.filter(id__in=[d for d in decoration_ids if d.isdigit()]).values_list('id', flat=True))
         for i, dec_id in enumerate(decoration_ids):
-            try:
-                decoration = Decoration.objects.get(id=dec_id)
+            if dec_id.isdigit() and int(dec_id) in known:
                 qty = decoration_quantities[i] if i < len(decoration_quantities) else 1
-                decoration_summary.append({
-                    'id': dec_id,
-                    'name': decoration.name,
-                    'quantity': qty,
-                    'price': float(decoration.price)
-                })
-            except:
-                pass
-    
-    cart = _get_cart(request.session)
-    cart.append({
-        'type': 'custom_cake',
-        'shape_id': shape_id,
-        'shape_name': shape.name,
-        'tier_id': tier_id,
-        'tier_name': tier.name,
-        'total_weight': total_weight,
-        'flavor_option': flavor_option,
-        'product_id': product_id,
-        'size_id': size_id,
-        'flavor_id': flavor_id,
-        'flavor_description': flavor_description,
-        'flavor_display': flavor_display,
-        'decorations': decoration_summary,
-        'decoration_ids': decoration_ids,
-        'decoration_quantities': decoration_quantities,
-        'unit_price': 0,  # Custom cakes quoted later
-        'quantity': 1,
-    })
-    
-    request.session.modified = True
+                decorations.append((dec_id, qty))
+    
+    added = request.cart.add_custom_cake(
+        shape.id, tier.id, total_weight,
+        flavor_option=flavor_option,
+        product_id=product_id,
+        size_id=size_id,
+        flavor_id=flavor_id,
+        flavor_description=flavor_description,
+        decorations=decorations,
+    )
+    if not added:
+        messages.error(request, 'Your cart is full. Please check out or remove an item first.')
+        return redirect('view_cart')
     messages.success(request, 'Custom cake added to cart.')
     return redirect('view_cart')
 
 def view_cart(request):
-    cart = _get_cart(request.session)
+    cart = request.cart.lines()
     # compute line totals
     for line in cart:
         try:
@@ -172,6 +130,7 @@ def view_cart(request):
                 line['line_total'] = 0
                 line['display_price'] = 'Quote Required'
             else:
+                # Current price (0 when the product or size is no longer available)
                 line['line_total'] = float(line['unit_price']) * int(line['quantity'])
                 line['display_price'] = f"₹{int(line['line_total'])}"
         except Exception:
@@ -192,22 +151,38 @@ def update_cart_item(request):
         return redirect('view_cart')
     idx = int(request.POST.get('index', -1))
     qty = int(request.POST.get('quantity', 1))
-    cart = _get_cart(request.session)
-    if 0 <= idx < len(cart):
-        cart[idx]['quantity'] = max(1, qty)
-        request.session.modified = True
+    request.cart.set_quantity(idx, qty)
     return redirect('view_cart')
 
 def remove_cart_item(request):
     if request.method != 'POST':
         return redirect('view_cart')
     idx = int(request.POST.get('index', -1))
-    cart = _get_cart(request.session)
-    if 0 <= idx < len(cart):
-        cart.pop(idx)
-        request.session.modified = True
+    request.cart.remove(idx)
     return redirect('view_cart')
 
+def _checkout_placed(key):
+    """Confirmation URL of the checkout submitted with `key`, from the orders"""
+    order = Order.objects.filter(idempotency_key=key).values_list('id', flat=True).first()
+    if order:
+        return {'url': reverse('order_confirmation', kwargs={'order_id': order})}
+    custom_order = CustomCakeOrder.objects.filter(idempotency_key=key).values_list('order_number', flat=True).first()
+    if custom_order:
+        return {'url': reverse('custom_order_confirmation', kwargs={'order_number': custom_order})}
+    return None
+
+
+def _replay_checkout(request, result):
+    """
+    Repeated checkout: back to the original confirmation. The first request
+    already emptied the cart; anything in it now was added since and stays.
+    """
+    request.session.pop('selected_reward_id', None)
+    request.session.pop('pending_points_redeem', None)
+    return redirect(result['url'])
+
+
+@idempotency.idempotent('checkout', _replay_checkout, _checkout_placed)
 def checkout_submit(request):
     if request.method != 'POST':
         return redirect('view_cart')
@@ -234,159 +209,51 @@ def checkout_submit(request):
     request.session['customer_phone'] = customer.phone_number
     request.session.modified = True
 
-    # Optional global delivery and notes
-    order_delivery_date = request.POST.get('delivery_date')
-    order_delivery_time = request.POST.get('delivery_time')
-    order_custom_message = request.POST.get('custom_message', '')
-    order_special_instructions = request.POST.get('special_instructions', '')
-
-    cart = _get_cart(request.session)
+    cart = request.cart.lines()
     if not cart:
         messages.error(request, 'Your cart is empty.')
         return redirect('products')
 
-    created_orders = []
-    created_custom_orders = []
-    
-    for line in cart:
-        if line.get('type') == 'custom_cake':
-            # Create CustomCakeOrder
-            shape = CakeShape.objects.get(id=line['shape_id'])
-            tier = CakeTier.objects.get(id=line['tier_id'])
-            
-            custom_order = CustomCakeOrder(
-                customer=customer,
-                shape=shape,
-                tier=tier,
-                total_weight=Decimal(line['total_weight']),
-                delivery_date=order_delivery_date or (timezone.now().date() + timedelta(days=2)),
-                delivery_time=order_delivery_time or None,
-                delivery_address=customer_address,
-                custom_message=order_custom_message or '',
-                special_instructions=order_special_instructions or '',
-            )
-            
-            # Set flavor based on option
-            if line.get('flavor_option') == 'product' and line.get('product_id') and line.get('size_id'):
-                custom_order.product_id = line['product_id']
-                custom_order.size_id = line['size_id']
-            elif line.get('flavor_id'):
-                custom_order.flavor_id = line['flavor_id']
-            elif line.get('flavor_description'):
-                custom_order.flavor_description = line['flavor_description']
-            
-            custom_order.save()
-            
-            # Add decorations
-            if line.get('decorations'):
-                for dec in line['decorations']:
-                    CustomCakeOrderDecoration.objects.create(
-                        custom_order=custom_order,
-                        decoration_id=dec['id'],
-                        quantity=int(dec['quantity'])
-                    )
-            
-            created_custom_orders.append(custom_order)
-            
-        else:
-            # Regular product order
-            product = Product.objects.get(id=line['product_id'])
-            size = Size.objects.get(id=line['size_id'])
-            order = Order(
-                customer=customer,
-                product=product,
-                size=size,
-                quantity=line['quantity'],
-                delivery_date=order_delivery_date or line.get('delivery_date') or (timezone.now().date() + timedelta(days=1)),
-                delivery_time=order_delivery_time or line.get('delivery_time') or None,
-                custom_message=order_custom_message or line.get('custom_message') or '',
-                special_instructions=order_special_instructions or line.get('special_instructions') or '',
-            )
-            order.unit_price = order.calculate_unit_price()
-            order.total_price = order.unit_price * order.quantity
-            order.save()
-            created_orders.append(order)
-
-    # Apply staged loyalty selections to the first created regular order (simple flow)
-    # We apply reward first, then points, and record transactions. This operates post-order creation.
-    selected_reward_id = request.session.get('selected_reward_id')
-    pending_points = int(request.session.get('pending_points_redeem', 0) or 0)
-
-    if created_orders:
-        order_to_apply = created_orders[0]
-        # Fetch loyalty card with row lock to avoid race conditions
-        from django.db import transaction
-        with transaction.atomic():
-            customer_refreshed = Customer.objects.select_for_update().get(id=customer.id)
-            try:
-                loyalty_card = LoyaltyCard.objects.select_for_update().get(customer=customer_refreshed)
-            except LoyaltyCard.DoesNotExist:
-                loyalty_card = None
-
-            order_payable = order_to_apply.total_price
-
-            # Apply reward (percentage) if selected and valid
-            if selected_reward_id and loyalty_card:
-                reward = LoyaltyReward.objects.filter(id=selected_reward_id, loyalty_card=loyalty_card, status='active').first()
-                if reward and reward.is_valid() and reward.used_on_order is None:
-                    try:
-                        discount_percent = Decimal(reward.discount_percentage)
-                    except Exception:
-                        discount_percent = Decimal('0')
-                    if discount_percent > 0:
-                        discount_amount = (order_payable * discount_percent) / Decimal('100')
-                        # Reduce payable
-                        order_payable = max(Decimal('0'), order_payable - discount_amount)
-                        # Mark reward as used
-                        reward.status = 'used'
-                        reward.used_on_order = order_to_apply
-                        reward.used_date = timezone.now()
-                        reward.save()
-
-            # Apply points redemption, capped by balance and remaining payable
-            if pending_points and loyalty_card:
-                try:
-                    points_balance = int(loyalty_card.points_balance)
-                except Exception:
-                    points_balance = 0
-                max_points_by_payable = _calculate_max_points_redeemable(order_payable, points_balance)
-                points_to_redeem = max(0, min(int(pending_points), max_points_by_payable))
-                if points_to_redeem > 0 and loyalty_card.points_balance >= points_to_redeem:
-                    # Deduct points and reduce payable
-                    loyalty_card.points_balance -= points_to_redeem
-                    loyalty_card.save()
-                    order_payable = max(Decimal('0'), order_payable - Decimal(points_to_redeem))
-                    # Log points redemption
-                    PointsTransaction.objects.create(
-                        loyalty_card=loyalty_card,
-                        points=points_to_redeem,
-                        transaction_type='redeemed',
-                        reason=f'Redeemed on order {order_to_apply.order_number}',
-                        order=order_to_apply
-                    )
+    # Optional global delivery and notes; staged loyalty goes on the first regular order
+    try:
+        result = place_cart_orders(
+            customer, cart,
+            details={
+                'delivery_date': request.POST.get('delivery_date'),
+                'delivery_time': request.POST.get('delivery_time'),
+                'custom_message': request.POST.get('custom_message', ''),
+                'special_instructions': request.POST.get('special_instructions', ''),
+                'delivery_address': customer_address,
+            },
+            pricing=get_cart_pricing(request, cart),
+            reward_id=request.session.get('selected_reward_id'),
+            points=int(request.session.get('pending_points_redeem', 0) or 0),
+            idempotency_key=request.idempotency_key,
+        )
+    except CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('view_cart')
+    created_orders, created_custom_orders = result.orders, result.custom_orders
+    if result.skipped:
+        messages.warning(request, f'{result.skipped} item(s) in your cart were no longer available and were not ordered.')
 
-            # Optionally, store final payable on order special_instructions note (non-invasive)
-            try:
-                if order_payable != order_to_apply.total_price:
-                    note = order_to_apply.special_instructions or ''
-                    suffix = f"\n[Loyalty Applied] Final payable after rewards/points: ₹{order_payable}"
-                    order_to_apply.special_instructions = (note + suffix).strip()
-                    order_to_apply.save()
-            except Exception:
-                pass
+    # Pre-render the invoices/estimates linked from the order messages
+    schedule_pdf_prerenders(invoices.ORDER_INVOICE, [order.order_number for order in created_orders])
+    schedule_pdf_prerenders(invoices.CUSTOM_CAKE_ESTIMATE, [order.order_number for order in created_custom_orders])
 
     # Clear cart and staged loyalty selections
-    request.session['cart'] = []
+    request.cart.clear()
     request.session.pop('selected_reward_id', None)
     request.session.pop('pending_points_redeem', None)
     request.session.modified = True
 
     # Redirect to first order confirmation
     if created_orders:
-        return redirect('order_confirmation', order_id=created_orders[0].id)
-    elif created_custom_orders:
-        return redirect('custom_order_confirmation', order_number=created_custom_orders[0].order_number)
-    return redirect('products')
+        url = reverse('order_confirmation', kwargs={'order_id': created_orders[0].id})
+    else:
+        url = reverse('custom_order_confirmation', kwargs={'order_number': created_custom_orders[0].order_number})
+    request.idempotent_result = {'url': url}
+    return redirect(url)
 
 # ===========================
 # HELPER FUNCTIONS
@@ -564,15 +431,15 @@ def home(request):
         end_date__gte=today
     ).order_by('-created_at')[:3]
     
-    # Featured products (latest 8) - prefetch prices for better performance
+    # Featured products (latest 8) - price range annotated in the same query
     featured_products = Product.objects.filter(
         is_active=True
-    ).prefetch_related('prices', 'sizes').order_by('-created_at')[:8]
+    ).with_price_summary().order_by('-created_at')[:8]
+    
+    catalog = get_catalog()
     
     # Categories
-    categories = Category.objects.filter(is_active=True).annotate(
-        product_count=Count('products')
-    )[:6]
+    categories = catalog.categories[:6]
     
     # Featured gallery images
     featured_gallery = Gallery.objects.filter(is_featured=True).order_by('-uploaded_at')[:6]
@@ -581,7 +448,7 @@ def home(request):
     reviews = Review.objects.filter(is_approved=True).order_by('-created_at')[:6]
     
     # Events for quick order
-    events = Event.objects.filter(is_active=True).order_by('event_name')
+    events = catalog.events
     
     context = {
         'banners': banners,  # Carousel slides
@@ -604,13 +471,16 @@ def about(request):
 # PRODUCTS
 # ===========================
 
-def products(request):
-    """Product listing with filtering"""
+PRODUCT_ORDERING = ('-created_at', '-id')
+GALLERY_ORDERING = ('-uploaded_at', '-id')
+
+
+def _product_listing(request):
+    """Active products for the listing, with the category/subcategory filters applied"""
     category_slug = request.GET.get('category', '')
     subcategory_slug = request.GET.get('subcategory', '')
-    search = request.GET.get('search', '')
     
-    products = Product.objects.filter(is_active=True).select_related('category', 'subcategory').prefetch_related('prices', 'sizes')
+    products = Product.objects.filter(is_active=True).select_related('category', 'subcategory').with_price_summary()
     
     if category_slug:
         products = products.filter(category__id=category_slug)
@@ -618,38 +488,87 @@ def products(request):
     if subcategory_slug:
         products = products.filter(subcategory__id=subcategory_slug)
     
+    return products
+
+
+def _next_page_url(request, url_name, cursor):
+    """URL of `url_name` at the next keyset page, keeping the current filters"""
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f"{reverse(url_name)}?{params.urlencode()}"
+
+
+def products(request):
+    """Product listing with filtering"""
+    category_slug = request.GET.get('category', '')
+    search = request.GET.get('search', '')
+    
+    products = _product_listing(request)
+    
+    search_page = None
+    more_url = next_page_url = None
     if search:
-        products = products.filter(
-            Q(name__icontains=search) |
-            Q(description__icontains=search)
+        # Ranked full-text matches, one page at a time
+        search_page = search_products(search, products, page=request.GET.get('page', 1))
+        products = search_page.products
+    else:
+        # Newest first, a page at a time; more pages load as the visitor scrolls
+        page = keyset.paginate(
+            products, PRODUCT_ORDERING,
+            cursor=request.GET.get('cursor'),
+            per_page=settings.PRODUCTS_PER_PAGE
         )
-    
-    products = products.order_by('-created_at')
+        products = page.items
+        if page.has_next:
+            more_url = _next_page_url(request, 'products_more', page.next_cursor)
+            next_page_url = _next_page_url(request, 'products', page.next_cursor)
     
     # Get categories and subcategories for filter
-    categories = Category.objects.filter(is_active=True).annotate(
-        product_count=Count('products')
-    )
+    categories = get_catalog().categories
     
     context = {
         'products': products,
         'categories': categories,
         'selected_category': category_slug,
         'search': search,
+        'search_page': search_page,
+        'more_url': more_url,
+        'next_page_url': next_page_url,
     }
     
     return render(request, 'customer/products.html', context)
 
 
+def products_more(request):
+    """Next page of the product listing as an HTML fragment (infinite scroll)"""
+    page = keyset.paginate(
+        _product_listing(request), PRODUCT_ORDERING,
+        cursor=request.GET.get('cursor'),
+        per_page=settings.PRODUCTS_PER_PAGE
+    )
+    html = ''.join(
+        render_to_string('partials/product_card.html', {'product': product}, request=request)
+        for product in page.items
+    )
+    
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'count': len(page.items),
+        'more_url': _next_page_url(request, 'products_more', page.next_cursor) if page.has_next else None,
+        'next_page_url': _next_page_url(request, 'products', page.next_cursor) if page.has_next else None,
+    })
+
+
 def product_detail(request, product_id):
     """Product detail page"""
-    product = get_object_or_404(Product, id=product_id, is_active=True)
+    product = get_object_or_404(Product.objects.with_price_summary(), id=product_id, is_active=True)
     
     # Get related products (same category)
     related_products = Product.objects.filter(
         category=product.category,
         is_active=True
-    ).exclude(id=product.id)[:4]
+    ).exclude(id=product.id).with_price_summary().order_by('-created_at')[:4]
     
     # Get product reviews
     reviews = Review.objects.filter(
@@ -658,10 +577,10 @@ def product_detail(request, product_id):
     ).order_by('-created_at')
     
     # Get available sizes
-    sizes = product.sizes.filter(is_active=True).order_by('display_order', 'weight_in_kg')
+    sizes = sizes_for_product(product.id)
     
     # Get events for order form
-    events = Event.objects.filter(is_active=True).order_by('event_name')
+    events = get_catalog().events
     
     # Get additional images
     additional_images = product.additional_images.all()
@@ -682,6 +601,27 @@ def product_detail(request, product_id):
 # ORDERS
 # ===========================
 
+def _order_placed(key):
+    order_id = Order.objects.filter(idempotency_key=key).values_list('id', flat=True).first()
+    return {'order_id': order_id} if order_id else None
+
+
+def _order_placed_response(request, order):
+    """Confirmation page with the WhatsApp message for a placed order"""
+    context = {
+        'order': order,
+        'whatsapp_message': generate_order_whatsapp_message(order, order.customer),
+        'customer_whatsapp': order.customer.phone_number,
+    }
+    return render(request, 'customer/order_confirmation.html', context)
+
+
+def _replay_order(request, result):
+    order = get_object_or_404(Order.objects.select_related('customer', 'product', 'size'), id=result['order_id'])
+    return _order_placed_response(request, order)
+
+
+@idempotency.idempotent('order', _replay_order, _order_placed)
 def place_order(request):
     """Place a new order"""
     if request.method == 'POST':
@@ -752,21 +692,15 @@ def place_order(request):
             delivery_date=delivery_date,
             delivery_time=delivery_time if delivery_time else None,
             unit_price=unit_price,
-            status='pending'
+            status='pending',
+            idempotency_key=request.idempotency_key,
         )
-        
-        # Generate WhatsApp message
-        whatsapp_message = generate_order_whatsapp_message(order, customer)
+        request.idempotent_result = {'order_id': order.id}
         
         messages.success(request, f'Order placed successfully! Order #{order.order_number}')
         
         # Return with WhatsApp data
-        context = {
-            'order': order,
-            'whatsapp_message': whatsapp_message,
-            'customer_whatsapp': customer.phone_number,
-        }
-        return render(request, 'customer/order_confirmation.html', context)
+        return _order_placed_response(request, order)
     
     # GET request - show order form
     product_id = request.GET.get('product')
@@ -912,12 +846,15 @@ def order_detail_customer_by_id(request, order_id):
 
 def custom_order_detail_customer(request, order_number):
     """Customer view for detailed custom cake order"""
-    order = get_object_or_404(CustomCakeOrder, order_number=order_number)
-    order_decorations = CustomCakeOrderDecoration.objects.filter(custom_order=order).select_related('decoration')
+    order = get_object_or_404(
+        CustomCakeOrder.objects.select_related('customer', 'shape', 'tier', 'flavor', 'product', 'size'),
+        order_number=order_number
+    )
     reference_images = CustomCakeReferenceImage.objects.filter(custom_order=order)
     
-    # Use your model's built-in breakdown property for detailed pricing
-    price_breakdown = order.price_breakdown if hasattr(order, 'price_breakdown') else None
+    # One pricing pass; also loads the decorations shown on the page
+    price_breakdown = quote_orders([order])[0].breakdown
+    order_decorations = order.order_decorations.all()
     
     context = {
         'order': order,
@@ -931,6 +868,17 @@ def custom_order_detail_customer(request, order_number):
 # GALLERY
 # ===========================
 
+def _gallery_listing(request):
+    """Gallery images, filtered by event when one is selected"""
+    images = Gallery.objects.select_related('event_type')
+    
+    event_filter = request.GET.get('event', '')
+    if event_filter:
+        images = images.filter(event_type__id=event_filter)
+    
+    return images
+
+
 def gallery(request):
     """Gallery page with event-based filtering"""
     # Get active events for the filter menu
@@ -938,27 +886,46 @@ def gallery(request):
         image_count=Count('gallery_images')
     ).order_by('event_name')
     
-    # Base queryset
-    images = Gallery.objects.select_related('event_type').all()
-    
-    # Apply event filter if selected
-    event_filter = request.GET.get('event', '')
-    if event_filter:
-        images = images.filter(event_type__id=event_filter)
-    
-    # Order images by upload date (newest first)
-    images = images.order_by('-uploaded_at')
+    # Newest uploads first, a page at a time; more load as the visitor scrolls
+    page = keyset.paginate(
+        _gallery_listing(request), GALLERY_ORDERING,
+        cursor=request.GET.get('cursor'),
+        per_page=settings.GALLERY_PER_PAGE
+    )
     
     context = {
-        'images': images,
+        'images': page.items,
         'events': events,
-        'selected_event': event_filter,
+        'selected_event': request.GET.get('event', ''),
+        'more_url': _next_page_url(request, 'gallery_more', page.next_cursor) if page.has_next else None,
+        'next_page_url': _next_page_url(request, 'gallery', page.next_cursor) if page.has_next else None,
         'page_title': 'Gallery'
     }
     
     return render(request, 'customer/gallery.html', context)
 
 
+def gallery_more(request):
+    """Next page of gallery images as an HTML fragment (infinite scroll)"""
+    page = keyset.paginate(
+        _gallery_listing(request), GALLERY_ORDERING,
+        cursor=request.GET.get('cursor'),
+        per_page=settings.GALLERY_PER_PAGE
+    )
+    html = ''.join(
+        render_to_string('partials/gallery_block.html', {'image': image}, request=request)
+        for image in page.items
+    )
+    
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'count': len(page.items),
+        'more_url': _next_page_url(request, 'gallery_more', page.next_cursor) if page.has_next else None,
+        'next_page_url': _next_page_url(request, 'gallery', page.next_cursor) if page.has_next else None,
+    })
+
+
 # ===========================
 # CONTACT & ENQUIRIES
 # ===========================
@@ -1021,7 +988,7 @@ def search(request):
     if request.method == 'POST':
         search_query = request.POST.get('search', '').strip()
         if search_query:
-            return redirect(f"{reverse('products')}?search={search_query}")
+            return redirect(f"{reverse('products')}?{urllib.parse.urlencode({'search': search_query})}")
     return redirect('products')
 
 
@@ -1061,6 +1028,13 @@ def login_view(request):
                 messages.error(request, 'Email is required for OTP verification.')
                 return redirect('customer_login')
                 
+            # Limit OTP emails per phone number and per client address
+            if not (ratelimit.hit('otp_request', f'phone:{phone}')
+                    and ratelimit.hit('otp_request', f'ip:{ratelimit.client_ip(request)}')):
+                messages.error(request, 'Too many OTP requests. Please try again in a few minutes.')
+                context.update({'phone': phone, 'email': email})
+                return render(request, 'customer/login.html', context)
+            
             # Generate and send OTP
             otp = utils.generate_otp()
             if utils.send_otp_email(email, otp):
@@ -1086,10 +1060,17 @@ def login_view(request):
                     'phone': phone,
                     'email': email
                 })
+            elif ratelimit.is_limited('otp_verify', phone):
+                # Too many wrong guesses: the OTP is burnt, a new one is needed
+                utils.clear_otp(phone)
+                messages.error(request, 'Too many incorrect attempts. Please request a new OTP.')
+                context.update({'phone': phone, 'email': email})
             else:
                 is_valid, stored_email = utils.verify_otp(phone, entered_otp)
                 
                 if is_valid and stored_email == email:
+                    ratelimit.reset('otp_verify', phone)
+                    
                     # Create/update customer with verified email
                     customer, created = Customer.objects.get_or_create(
                         phone_number=phone,
@@ -1114,6 +1095,7 @@ def login_view(request):
                     next_url = request.POST.get('next') or request.GET.get('next') or 'home'
                     return redirect(next_url)
                 else:
+                    ratelimit.hit('otp_verify', phone)
                     messages.error(request, 'Invalid OTP. Please try again.')
                     context.update({
                         'show_otp_form': True,
@@ -1249,6 +1231,19 @@ def get_event_suggestions_ajax(request):
     })
 
 
+def search_suggestions_ajax(request):
+    """Typeahead suggestions for the search box (AJAX), served from memory"""
+    suggestions = suggest(request.GET.get('q', '')[:100])
+    
+    return JsonResponse({
+        'success': True,
+        'suggestions': [
+            {'type': suggestion.kind, 'label': suggestion.label, 'url': suggestion.url}
+            for suggestion in suggestions
+        ]
+    })
+
+
 def calculate_price_ajax(request):
     """Calculate order price (AJAX) - product + size only"""
     product_id = request.GET.get('product_id')
@@ -1305,28 +1300,16 @@ def calculate_price_ajax(request):
 
 def custom_cakes(request):
     """Custom cakes page - display options and take orders"""
-    shapes = CakeShape.objects.filter(is_active=True).order_by('display_order', 'name')
-    tiers = CakeTier.objects.filter(is_active=True).order_by('display_order', 'tiers_count')
-    decorations = Decoration.objects.filter(is_active=True).order_by('category', 'display_order', 'name')
-    flavors = Flavor.objects.filter(is_active=True).order_by('display_order', 'name')
-    events = Event.objects.filter(is_active=True).order_by('event_name')
+    catalog = get_catalog()
     products = Product.objects.filter(is_active=True, category__is_cake=True).order_by('name')
     
-    # Group decorations by category
-    decorations_by_category = {}
-    for decoration in decorations:
-        category = decoration.get_category_display()
-        if category not in decorations_by_category:
-            decorations_by_category[category] = []
-        decorations_by_category[category].append(decoration)
-    
     context = {
-        'shapes': shapes,
-        'tiers': tiers,
-        'decorations': decorations,
-        'decorations_by_category': decorations_by_category,
-        'flavors': flavors,
-        'events': events,
+        'shapes': catalog.shapes,
+        'tiers': catalog.tiers,
+        'decorations': catalog.decorations,
+        'decorations_by_category': catalog.decorations_by_category,
+        'flavors': catalog.flavors,
+        'events': catalog.events,
         'products': products,
     }
     
@@ -1462,6 +1445,9 @@ def place_custom_order(request):
         # Recalculate estimate after adding decorations
         custom_order.update_estimate()
         
+        # Pre-render the estimate PDF linked from the WhatsApp message
+        schedule_pdf_prerender(invoices.CUSTOM_CAKE_ESTIMATE, custom_order.order_number)
+        
         # Generate WhatsApp message
         whatsapp_message = generate_custom_cake_whatsapp_message(custom_order, customer)
         
@@ -1497,511 +1483,14 @@ def custom_order_confirmation(request, order_number):
 
 def generate_order_pdf(request, order_number):
     """Generate professional invoice PDF for regular product order"""
-    order = get_object_or_404(Order, order_number=order_number)
-    
-    # Create PDF with watermark
-    buffer = BytesIO()
-    from reportlab.platypus import PageTemplate, Frame
-    from reportlab.lib.pagesizes import A4
-    
-    def add_watermark(canvas, doc):
-        """Add watermark (no borders for clean look)"""
-        canvas.saveState()
-        canvas.setFont('Helvetica-Bold', 60)
-        canvas.setFillColor(colors.HexColor('#FFF3F8'))
-        canvas.setFillAlpha(0.2)
-        canvas.translate(A4[0]/2, A4[1]/2)
-        canvas.rotate(45)
-        canvas.drawCentredString(0, 0, "CAKES BY DESTI")
-        canvas.rotate(-45)
-        canvas.translate(-A4[0]/2, -A4[1]/2)
-        canvas.restoreState()
-    
-    frame = Frame(0.75*inch, 0.75*inch, A4[0]-1.5*inch, A4[1]-1.5*inch, id='normal')
-    template = PageTemplate(id='invoice', frames=frame, onPage=add_watermark)
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.75*inch, bottomMargin=0.75*inch,
-                           leftMargin=0.75*inch, rightMargin=0.75*inch)
-    doc.addPageTemplates([template])
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Styles
-    from_content_style = ParagraphStyle(
-        'FromContent',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#333333'),
-        leading=14
-    )
-    
-    # Dark blue header with INVOICE
-    header_data = [[
-        Paragraph("<b style='color: white; font-size: 12pt'>🎂 CAKES BY DESTI & SIMI</b><br/>"
-                 "<font size='8' color='white'>Made by our family for your family</font>", from_content_style),
-        Paragraph("<b style='color: white; font-size: 32pt'>INVOICE</b>", from_content_style)
-    ]]
-    
-    header_table = Table(header_data, colWidths=[4*inch, 2.5*inch])
-    header_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#1A5490')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-        ('PADDING', (0, 0), (-1, -1), 20),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 15))
-    
-    # Client Info and Invoice Details
-    info_data = [[
-        Paragraph(f"<b>Client Name:</b> {order.customer.name}<br/>"
-                 f"<b>Invoice#:</b> {order.order_number}<br/>"
-                 f"<b>Date:</b> {order.created_at.strftime('%m/%d/%Y')}", from_content_style),
-        Paragraph(f"<b>Client Address</b><br/>"
-                 f"{order.customer.address or 'N/A'}<br/>"
-                 f"Ph: {order.customer.phone_number}<br/>"
-                 f"Email: {order.customer.email or 'N/A'}", from_content_style)
-    ]]
-    
-    info_table = Table(info_data, colWidths=[3.25*inch, 3.25*inch])
-    info_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('PADDING', (0, 0), (-1, -1), 0),
-    ]))
-    elements.append(info_table)
-    elements.append(Spacer(1, 25))
-    
-    # Items Table
-    product_description = f"{order.product.name} - {order.size.name}"
-    if order.custom_message:
-        product_description += f"<br/>Message: {order.custom_message}"
-    if order.event:
-        product_description += f"<br/>Event: {order.event.event_name}"
-    
-    items_data = [
-        ['SL.', 'Item Description', 'Price', 'Qty', 'Total']
-    ]
-    
-    items_data.append([
-        '1',
-        Paragraph(product_description, from_content_style),
-        f'₹{order.unit_price:,.0f}',
-        str(order.quantity),
-        f'₹{order.total_price:,.0f}'
-    ])
-    
-    # Add empty rows for clean look
-    for i in range(4):
-        items_data.append(['', '', '', '', ''])
-    
-    items_table = Table(items_data, colWidths=[0.5*inch, 3.5*inch, 1*inch, 0.6*inch, 0.9*inch])
-    items_table.setStyle(TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1A5490')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (2, 0), (-1, -1), 'CENTER'),
-        
-        # Data rows
-        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#CCCCCC')),
-        ('PADDING', (0, 0), (-1, -1), 10),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-    ]))
-    elements.append(items_table)
-    elements.append(Spacer(1, 5))
-    
-    # Summary Section (aligned right)
-    summary_data = [
-        ['', '', '', 'Sub Total:', f'₹{order.total_price:,.0f}'],
-        ['', '', '', 'Total:', f'₹{order.total_price:,.0f}'],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[0.5*inch, 3.5*inch, 1*inch, 0.6*inch, 0.9*inch])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
-        ('FONT', (3, 0), (3, 0), 'Helvetica', 10),
-        ('FONT', (4, 0), (4, 0), 'Helvetica', 10),
-        ('FONT', (3, 1), (-1, 1), 'Helvetica-Bold', 12),
-        ('BACKGROUND', (3, 1), (-1, 1), colors.HexColor('#E8F5E9')),
-        ('TEXTCOLOR', (3, 1), (-1, 1), colors.HexColor('#4CAF50')),
-        ('PADDING', (3, 0), (-1, -1), 8),
-        ('LINEABOVE', (3, 0), (-1, 0), 1, colors.HexColor('#CCCCCC')),
-        ('LINEABOVE', (3, 1), (-1, 1), 2, colors.HexColor('#4CAF50')),
-        ('TOPPADDING', (3, 1), (-1, 1), 12),
-        ('BOTTOMPADDING', (3, 1), (-1, 1), 12),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 25))
-    
-    # Additional notes if any
-    if order.special_instructions:
-        note_style = ParagraphStyle('Note', parent=styles['Normal'], fontSize=9, 
-                                    textColor=colors.HexColor('#666666'), leading=12)
-        elements.append(Paragraph(f"<b>Special Instructions:</b><br/>{order.special_instructions}", note_style))
-        elements.append(Spacer(1, 15))
-    
-    # Terms and Conditions
-    terms_heading_style = ParagraphStyle('TermsHeading', parent=styles['Normal'], fontSize=11,
-                                        textColor=colors.HexColor('#1A5490'), fontName='Helvetica-Bold',
-                                        spaceAfter=8)
-    terms_style = ParagraphStyle('Terms', parent=styles['Normal'], fontSize=9,
-                                 textColor=colors.HexColor('#333333'), leading=13, spaceAfter=3)
-    
-    elements.append(Paragraph("Terms & Conditions", terms_heading_style))
-    elements.append(Paragraph("Payment is due on delivery", terms_style))
-    elements.append(Paragraph("Delivery date and time must be confirmed 24 hours in advance", terms_style))
-    elements.append(Paragraph("Thank you for your business!", terms_style))
-    elements.append(Spacer(1, 15))
-    
-    # Simple Footer
-    footer_data = [[
-        'Tel: +91 9946588352',
-        'Email: cakesbydesti@example.com',
-        'Web: www.cakesbydesti.com'
-    ]]
-    
-    footer_table = Table(footer_data, colWidths=[2.2*inch, 2.2*inch, 2.1*inch])
-    footer_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#666666')),
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-        ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
-        ('TOPPADDING', (0, 0), (-1, -1), 20),
-    ]))
-    elements.append(footer_table)
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Return PDF response
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="Order_{order.order_number}.pdf"'
-    
-    return response
+    order = get_object_or_404(invoices.document_queryset(invoices.ORDER_INVOICE), order_number=order_number)
+    return invoices.pdf_response(request, invoices.ORDER_INVOICE, order, f'Order_{order.order_number}.pdf')
 
 
 def generate_custom_cake_pdf(request, order_number):
     """Generate PDF for custom cake order with enhanced styling and watermark"""
-    order = get_object_or_404(CustomCakeOrder, order_number=order_number)
-    
-    # Create PDF with custom page template for watermark
-    buffer = BytesIO()
-    
-    # Custom page template class for watermark
-    from reportlab.platypus import PageTemplate, Frame
-    from reportlab.lib.pagesizes import A4
-    
-    def add_watermark(canvas, doc):
-        """Add watermark (no borders for clean look)"""
-        canvas.saveState()
-        
-        # Add watermark text in center
-        canvas.setFont('Helvetica-Bold', 60)
-        canvas.setFillColor(colors.HexColor('#FFF3F8'))
-        canvas.setFillAlpha(0.2)
-        canvas.translate(A4[0]/2, A4[1]/2)
-        canvas.rotate(45)
-        canvas.drawCentredString(0, 0, "CAKES BY DESTI")
-        canvas.rotate(-45)
-        canvas.translate(-A4[0]/2, -A4[1]/2)
-        
-        canvas.restoreState()
-    
-    # Build document with custom page template
-    frame = Frame(0.75*inch, 0.75*inch, A4[0]-1.5*inch, A4[1]-1.5*inch, id='normal')
-    template = PageTemplate(id='test', frames=frame, onPage=add_watermark)
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.75*inch, bottomMargin=0.75*inch,
-                           leftMargin=0.75*inch, rightMargin=0.75*inch)
-    doc.addPageTemplates([template])
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Enhanced custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=32,
-        textColor=colors.HexColor('#FF1493'),
-        spaceAfter=5,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold',
-        leading=38
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=16,
-        textColor=colors.HexColor('#C06C84'),
-        spaceAfter=5,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    contact_style = ParagraphStyle(
-        'Contact',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#666666'),
-        spaceAfter=25,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'Heading',
-        parent=styles['Heading2'],
-        fontSize=15,
-        textColor=colors.HexColor('#FF6B9D'),
-        spaceAfter=10,
-        spaceBefore=15,
-        fontName='Helvetica-Bold',
-        borderColor=colors.HexColor('#FF6B9D'),
-        borderWidth=0,
-        borderPadding=5
-    )
-    
-    # Styles
-    from_content_style = ParagraphStyle(
-        'FromContent',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#333333'),
-        leading=14
-    )
-    
-    # Dark blue header with ESTIMATE
-    header_data = [[
-        Paragraph("<b style='color: white; font-size: 12pt'>🎂 CAKES BY DESTI & SIMI</b><br/>"
-                 "<font size='8' color='white'>Made by our family for your family</font>", from_content_style),
-        Paragraph("<b style='color: white; font-size: 32pt'>ESTIMATE</b>", from_content_style)
-    ]]
-    
-    header_table = Table(header_data, colWidths=[4*inch, 2.5*inch])
-    header_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#1A5490')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-        ('PADDING', (0, 0), (-1, -1), 20),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 15))
-    
-    # Client Info and Estimate Details
-    info_data = [[
-        Paragraph(f"<b>Client Name:</b> {order.customer.name}<br/>"
-                 f"<b>Estimate#:</b> {order.order_number}<br/>"
-                 f"<b>Date:</b> {order.created_at.strftime('%m/%d/%Y')}", from_content_style),
-        Paragraph(f"<b>Client Address</b><br/>"
-                 f"{order.delivery_address[:80]}<br/>"
-                 f"Ph: {order.customer.phone_number}<br/>"
-                 f"Email: {order.customer.email or 'N/A'}", from_content_style)
-    ]]
-    
-    info_table = Table(info_data, colWidths=[3.25*inch, 3.25*inch])
-    info_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('PADDING', (0, 0), (-1, -1), 0),
-    ]))
-    elements.append(info_table)
-    elements.append(Spacer(1, 25))
-    
-    # Items Table (Like the template)
-    # Get flavor name
-    flavor_name = order.flavor.name if order.flavor else (order.flavor_description or 'Not specified')
-    
-    # Get decorations
-    order_decorations = order.order_decorations.all()
-    decorations_text = ', '.join([f"{od.quantity}× {od.decoration.name}" for od in order_decorations]) if order_decorations else 'None'
-    
-    # Build description
-    cake_description = f"Custom Cake - {order.shape.name}, {order.tier.name}, {order.total_weight}kg, {flavor_name}"
-    if decorations_text != 'None':
-        cake_description += f"<br/>Decorations: {decorations_text}"
-    if order.custom_message:
-        cake_description += f"<br/>Message: {order.custom_message}"
-    
-    # Create items table with header
-    items_data = [
-        ['QTY', 'Description', 'Unit Price', 'Amount']
-    ]
-    
-    # Add cake item
-    items_data.append([
-        '1',
-        Paragraph(cake_description, from_content_style),
-        f'₹{order.price_range["min"]:,}',
-        f'₹{order.price_range["min"]:,}'
-    ])
-    
-    # Add a few empty rows for clean look
-    for i in range(2):
-        items_data.append(['', '', '', ''])
-    
-    items_table = Table(items_data, colWidths=[0.7*inch, 3.8*inch, 1*inch, 1*inch])
-    items_table.setStyle(TableStyle([
-        # Header row styling - Dark blue
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1A5490')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
-        ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-        ('ALIGN', (2, 0), (-1, 0), 'CENTER'),
-        
-        # Data rows styling
-        ('FONT', (0, 1), (-1, -1), 'Helvetica', 10),
-        ('ALIGN', (0, 1), (0, -1), 'CENTER'),
-        ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        
-        # Grid and padding
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#CCCCCC')),
-        ('PADDING', (0, 0), (-1, -1), 10),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-    ]))
-    elements.append(items_table)
-    elements.append(Spacer(1, 5))
-    
-    # Subtotal and Total Section (aligned to right like template)
-    price_range = order.price_range
-    summary_data = [
-        ['', '', 'Subtotal', f'₹{price_range["min"]:,}'],
-        ['', '', 'Price Range', f'₹{price_range["min"]:,} - ₹{price_range["max"]:,}'],
-        ['', '', Paragraph('<b>Total (Estimated)</b>', from_content_style), 
-         Paragraph(f'<b>₹{price_range["max"]:,}</b>', from_content_style)],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[0.7*inch, 3.8*inch, 1*inch, 1*inch])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-        ('FONT', (2, 0), (2, 1), 'Helvetica', 10),
-        ('FONT', (3, 0), (3, 1), 'Helvetica', 10),
-        ('FONT', (2, 2), (-1, 2), 'Helvetica-Bold', 12),
-        ('BACKGROUND', (2, 2), (-1, 2), colors.HexColor('#E8F5E9')),
-        ('TEXTCOLOR', (2, 2), (-1, 2), colors.HexColor('#4CAF50')),
-        ('PADDING', (2, 0), (-1, -1), 8),
-        ('LINEABOVE', (2, 0), (-1, 0), 1, colors.HexColor('#CCCCCC')),
-        ('LINEABOVE', (2, 2), (-1, 2), 2, colors.HexColor('#4CAF50')),
-        ('TOPPADDING', (2, 2), (-1, 2), 12),
-        ('BOTTOMPADDING', (2, 2), (-1, 2), 12),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 20))
-    
-    # Final Price (if different)
-    if order.final_price and order.final_price != order.estimated_price:
-        final_data = [['FINAL PRICE:', f'₹{order.final_price:,.2f}']]
-        final_table = Table(final_data, colWidths=[5*inch, 1.5*inch])
-        final_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#E8F5E9')),
-            ('FONT', (0, 0), (0, 0), 'Helvetica-Bold', 14),
-            ('FONT', (1, 0), (1, 0), 'Helvetica-Bold', 16),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#4CAF50')),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('PADDING', (0, 0), (-1, -1), 15),
-            ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#4CAF50')),
-        ]))
-        elements.append(final_table)
-        
-        if order.price_note:
-            note_style = ParagraphStyle('Note', parent=styles['Normal'], fontSize=9, textColor=colors.HexColor('#666666'), alignment=TA_LEFT)
-            elements.append(Spacer(1, 5))
-            elements.append(Paragraph(f"<i>Note: {order.price_note}</i>", note_style))
-    
-    elements.append(Spacer(1, 20))
-    
-    # Additional Information
-    if order.custom_message or order.special_instructions:
-        elements.append(Paragraph("Additional Information", heading_style))
-        
-        info_data = []
-        if order.custom_message:
-            info_data.append(['Message on Cake:', order.custom_message])
-        if order.special_instructions:
-            info_data.append(['Special Instructions:', order.special_instructions])
-        
-        info_table = Table(info_data, colWidths=[2*inch, 4.5*inch])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#FFF9E6')),
-            ('FONT', (0, 0), (0, -1), 'Helvetica-Bold', 10),
-            ('FONT', (1, 0), (1, -1), 'Helvetica', 10),
-            ('PADDING', (0, 0), (-1, -1), 12),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#FFE5A3')),
-        ]))
-        elements.append(info_table)
-    
-    elements.append(Spacer(1, 30))
-    
-    # Terms and Conditions Section
-    terms_heading_style = ParagraphStyle(
-        'TermsHeading',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#1A5490'),
-        fontName='Helvetica-Bold',
-        spaceAfter=8
-    )
-    
-    terms_style = ParagraphStyle(
-        'Terms',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#333333'),
-        leading=13,
-        spaceAfter=3
-    )
-    
-    elements.append(Paragraph("Terms & Conditions", terms_heading_style))
-    elements.append(Paragraph("This is an estimated quotation. Final price will be confirmed after design discussion.", terms_style))
-    elements.append(Paragraph("50% advance payment required to confirm the order.", terms_style))
-    elements.append(Paragraph("Balance payment to be made at the time of delivery.", terms_style))
-    elements.append(Paragraph("Thank you for your business!", terms_style))
-    elements.append(Spacer(1, 15))
-    
-    # Simple Footer (like template)
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#666666'),
-        alignment=TA_CENTER,
-        spaceAfter=0
-    )
-    
-    # Create footer table with 3 columns
-    footer_data = [[
-        'Tel: +91 9946588352',
-        'Email: cakesbydesti@example.com',
-        'Web: www.cakesbydesti.com'
-    ]]
-    
-    footer_table = Table(footer_data, colWidths=[2.2*inch, 2.2*inch, 2.1*inch])
-    footer_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#666666')),
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-        ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
-        ('TOPPADDING', (0, 0), (-1, -1), 20),
-    ]))
-    elements.append(footer_table)
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Return PDF response
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="CustomCake_{order.order_number}.pdf"'
-    
-    return response
+    order = get_object_or_404(invoices.document_queryset(invoices.CUSTOM_CAKE_ESTIMATE), order_number=order_number)
+    return invoices.pdf_response(request, invoices.CUSTOM_CAKE_ESTIMATE, order, f'CustomCake_{order.order_number}.pdf')
 
 
 # ===========================
@@ -2045,7 +1534,7 @@ def get_product_sizes_prices(request):
 
 def gift_boxes(request):
     """Display all gift boxes"""
-    gift_boxes = GiftBox.objects.filter(is_active=True).prefetch_related('items__product', 'items__size')
+    gift_boxes = GiftBox.objects.filter(is_active=True)
     
     context = {
         'gift_boxes': gift_boxes,
@@ -2057,7 +1546,7 @@ def gift_boxes(request):
 def gift_box_detail(request, gift_box_id):
     """Display gift box details"""
     gift_box = get_object_or_404(GiftBox, id=gift_box_id, is_active=True)
-    items = gift_box.items.all().select_related('product', 'size')
+    items = GiftBoxItem.attach_unit_prices(gift_box.items.all().select_related('product', 'size'))
     
     context = {
         'gift_box': gift_box,
@@ -2067,6 +1556,16 @@ def gift_box_detail(request, gift_box_id):
     return render(request, 'customer/gift_box_detail.html', context)
 
 
+def _gift_box_order_placed(key):
+    order_number = GiftBoxOrder.objects.filter(idempotency_key=key).values_list('order_number', flat=True).first()
+    return {'order_number': order_number} if order_number else None
+
+
+def _replay_gift_box_order(request, result):
+    return redirect('gift_box_order_confirmation', order_number=result['order_number'])
+
+
+@idempotency.idempotent('gift_box_order', _replay_gift_box_order, _gift_box_order_placed)
 def gift_box_order(request, gift_box_id):
     """Place order for a gift box"""
     gift_box = get_object_or_404(GiftBox, id=gift_box_id, is_active=True)
@@ -2109,8 +1608,10 @@ def gift_box_order(request, gift_box_id):
             delivery_date=delivery_date,
             delivery_time=delivery_time or None,
             special_instructions=special_instructions,
-            unit_price=gift_box.total_price
+            unit_price=gift_box.total_price,
+            idempotency_key=request.idempotency_key,
         )
+        request.idempotent_result = {'order_number': order.order_number}
         
         messages.success(request, f'Gift Box order #{order.order_number} placed successfully!')
         return redirect('gift_box_order_confirmation', order_number=order.order_number)
@@ -2125,7 +1626,7 @@ def gift_box_order(request, gift_box_id):
 
 def gift_box_order_confirmation(request, order_number):
     """Gift box order confirmation page"""
-    order = get_object_or_404(GiftBoxOrder, order_number=order_number)
+    order = get_object_or_404(GiftBoxOrder.objects.select_related('gift_box'), order_number=order_number)
     items = order.gift_box.items.all().select_related('product', 'size')
     
     context = {
@@ -2338,17 +1839,6 @@ def _get_current_customer(request):
         return None
 
 
-def _calculate_max_points_redeemable(amount_after_voucher: Decimal, points_balance: int) -> int:
-    """Cap points to integer rupees available and points balance."""
-    if amount_after_voucher <= 0:
-        return 0
-    try:
-        remaining_rupees = int(Decimal(amount_after_voucher).quantize(Decimal('1'), rounding='ROUND_FLOOR'))
-    except Exception:
-        remaining_rupees = 0
-    return max(0, min(points_balance, remaining_rupees))
-
-
 def loyalty_history(request):
     """Customer loyalty history across orders, rewards, points, achievements."""
     customer = _get_current_customer(request)
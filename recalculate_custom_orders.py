@@ -14,6 +14,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cakeshop.settings')
 django.setup()
 
 from admin_app.models import CustomCakeOrder, Flavor
+from admin_app.custom_pricing import recalculate_estimates
 from decimal import Decimal
 
 def recalculate_all_orders():
@@ -24,7 +25,7 @@ def recalculate_all_orders():
     # Get all non-completed orders
     orders = CustomCakeOrder.objects.filter(
         status__in=['pending', 'quoted', 'customer_approved']
-    ).select_related('flavor', 'shape', 'tier')
+    ).select_related('customer', 'flavor', 'shape', 'tier', 'product', 'size')
     
     total_orders = orders.count()
     
@@ -38,14 +39,17 @@ def recalculate_all_orders():
     recalculated = 0
     errors = 0
     
-    for order in orders:
+    # Price every order in one batch and store the new estimates in bulk
+    try:
+        results = recalculate_estimates(orders)
+    except Exception as e:
+        print(f"❌ Error recalculating orders: {str(e)}")
+        print("-" * 70)
+        results = []
+        errors = total_orders
+    
+    for order, old_price in results:
         try:
-            # Get old price
-            old_price = order.estimated_price
-            
-            # Recalculate
-            order.update_estimate()
-            
             # Get new price
             new_price = order.estimated_price
             
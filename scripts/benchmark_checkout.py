@@ -0,0 +1,162 @@
+"""
+Benchmark checkout throughput with several worker processes, on the stock
+SQLite backend and on the tuned one (cakeshop/sqlite_backend).
+
+Each worker (a separate process, like a gunicorn worker) repeatedly fills a
+cart and submits the checkout through the Django test client, for a fixed
+time. Both runs start from identical copies of a scratch database seeded
+with a small catalog, and use a scratch cache file; PDF prerendering is
+switched off so only the request work is measured. Reports completed
+checkouts per second, failed checkouts ("database is locked" and the like)
+and latency percentiles.
+
+Usage:
+    python scripts/benchmark_checkout.py [--workers 4] [--seconds 10] [--lines 3]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = (
+    ('stock', 'False'),
+    ('tuned', 'True'),
+)
+
+
+def setup():
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cakeshop.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+
+def create_database(products):
+    """Migrate the scratch database and add a catalog to order from."""
+    from decimal import Decimal
+    from django.core.management import call_command
+    from admin_app.models import Category, Product, ProductPrice, Size
+
+    call_command('migrate', verbosity=0)
+    category = Category.objects.create(name='Cakes', is_cake=True)
+    sizes = [Size.objects.create(name=f'{kg} kg', weight_in_kg=kg) for kg in (1, 2)]
+    for i in range(products):
+        product = Product(name=f'Benchmark cake {i}', description='Benchmark', category=category)
+        product.main_image.name = 'products/benchmark.jpg'
+        # Skip Product.save(), which would process the (missing) image
+        super(Product, product).save()
+        product.sizes.set(sizes)
+        for size in sizes:
+            ProductPrice.objects.create(product=product, size=size, price=Decimal(100 * (i + 1)) * size.weight_in_kg)
+    from django.db import connection
+    connection.close()
+
+
+def checkout_loop(worker, start_at, seconds, lines):
+    """Place orders until the time is up. Returns (latencies, errors)."""
+    from django.db import connection
+    from django.test import Client
+    from admin_app.models import ProductPrice
+
+    prices = list(ProductPrice.objects.values_list('product_id', 'size_id'))
+    connection.close()
+
+    latencies, errors = [], {}
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + seconds
+    # One client (and so one loaded middleware stack) per worker; a new
+    # customer per checkout, with an empty cart and session
+    client = Client(raise_request_exception=True)
+    n = 0
+    while time.time() < deadline:
+        client.cookies.clear()
+        started = time.perf_counter()
+        try:
+            for i in range(lines):
+                product_id, size_id = prices[(worker + n + i) % len(prices)]
+                client.post('/cart/add/', {'product_id': product_id, 'size_id': size_id, 'quantity': 1})
+            response = client.post('/cart/checkout/', {
+                'customer_name': f'Benchmark {worker}',
+                'customer_phone': f'9{worker:03d}{n % 1000:06d}',
+                'delivery_address': 'Benchmark street',
+            })
+            if response.status_code != 302 or response.url.rstrip('/').endswith('cart'):
+                raise RuntimeError(f'checkout not placed ({response.status_code})')
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            message = str(e).splitlines()[0][:80]
+            errors[message] = errors.get(message, 0) + 1
+        n += 1
+    return latencies, errors
+
+
+def run(mode, tuned, template, workdir, args):
+    database = os.path.join(workdir, f'{mode}.sqlite3')
+    shutil.copyfile(template, database)
+    os.environ.update({
+        'SQLITE_TUNING': tuned,
+        'SQLITE_PATH': database,
+        'CACHE_FILE': os.path.join(workdir, f'{mode}-cache.sqlite3'),
+    })
+    with get_context('spawn').Pool(args.workers, initializer=setup) as pool:
+        start_at = time.time() + 2  # let every worker finish starting up
+        results = pool.starmap(checkout_loop, [
+            (worker, start_at, args.seconds, args.lines) for worker in range(args.workers)
+        ])
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    errors = {}
+    for _, worker_errors in results:
+        for message, count in worker_errors.items():
+            errors[message] = errors.get(message, 0) + count
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+
+    print(f"{mode:6}  {len(latencies) / args.seconds:8.1f} checkouts/s  "
+          f"{len(latencies):6} placed  {sum(errors.values()):5} failed  "
+          f"p50 {percentile(0.5):6.0f} ms  p95 {percentile(0.95):6.0f} ms")
+    for message, count in sorted(errors.items(), key=lambda item: -item[1]):
+        print(f"        {count:5} x {message}")
+    return len(latencies) / args.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--lines', type=int, default=3, help='cart lines per checkout')
+    parser.add_argument('--products', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='checkout-benchmark-')
+    os.environ['PDF_PRERENDER_ENABLED'] = 'False'
+    try:
+        # The template is created in the stock (rollback journal) mode, so
+        # the stock run doesn't inherit WAL from the file
+        template = os.path.join(workdir, 'template.sqlite3')
+        os.environ.update({
+            'SQLITE_TUNING': 'False',
+            'SQLITE_PATH': template,
+            'CACHE_FILE': os.path.join(workdir, 'template-cache.sqlite3'),
+        })
+        with get_context('spawn').Pool(1, initializer=setup) as pool:
+            pool.apply(create_database, (args.products,))
+
+        print(f"{args.workers} workers, {args.seconds}s, {args.lines} cart lines per checkout")
+        throughput = {mode: run(mode, tuned, template, workdir, args) for mode, tuned in MODES}
+        if throughput['stock']:
+            print(f"tuned / stock: {throughput['tuned'] / throughput['stock']:.2f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+/*
+ * Infinite scroll for keyset-paginated listings.
+ *
+ * A ".js-load-more" link carries the fragment endpoint in data-more-url and
+ * the plain next page in href (the no-JS fallback). Each response is
+ * {html, more_url, next_page_url}; the new items are appended to the
+ * element named by data-target and a "loadmore:appended" event is
+ * triggered on it with the new elements.
+ */
+(function($) {
+    // Loads the next page as the link comes within 400px of the viewport
+    var observer = 'IntersectionObserver' in window ? new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (entry.isIntersecting) { loadMore($(entry.target)); }
+        });
+    }, {rootMargin: '400px 0px'}) : null;
+
+    function loadMore($link) {
+        if ($link.data('loading')) { return; }
+        $link.data('loading', true).addClass('loading');
+
+        $.getJSON($link.data('more-url')).done(function(data) {
+            var $target = $($link.data('target'));
+            var $items = $($.parseHTML($.trim(data.html || ''))).filter('*');
+            $target.trigger('loadmore:appended', [$items]);
+            if (!$items.parent().length) {
+                $target.append($items);
+            }
+            if (data.more_url) {
+                $link.data('more-url', data.more_url).attr('href', data.next_page_url);
+                // The observer only reports the link entering the viewport;
+                // observing it afresh reports it again if a short page left it in view
+                if (observer) {
+                    observer.unobserve($link[0]);
+                    observer.observe($link[0]);
+                }
+            } else {
+                $link.closest('.load-more').remove();
+            }
+        }).always(function() {
+            $link.data('loading', false).removeClass('loading');
+        });
+    }
+
+    $(document).on('click', '.js-load-more', function(e) {
+        e.preventDefault();
+        loadMore($(this));
+    });
+
+    $(function() {
+        if (!observer) { return; }
+        $('.js-load-more').each(function() { observer.observe(this); });
+    });
+})(jQuery);